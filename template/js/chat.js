@@ -1,36 +1,171 @@
 /* begin template/js/chat.js ; marker comment, please do not remove */
 console.log("chat.js loading...");  // Add this at the very top of the file
 
+// Milliseconds between delta polls while the WebSocket is not connected
+const POLL_INTERVAL = 5000;
+
 class ChatClient {
 	constructor() {
 		console.log("ChatClient constructor called");
 		this.ws = null;
+		this.wsUrls = this.getWebSocketUrls();
+		this.wsUrlIndex = 0;
+		this.wsFailures = 0;
+		this.eventSource = null;
+		// Newest message id on the page, and the ETag of the last delta
+		// response, so an unchanged channel answers 304 with no body
+		const container = document.querySelector('.chat-messages');
+		this.cursor = container && container.dataset.cursor !== undefined ? container.dataset.cursor : null;
+		this.etag = null;
 		this.connect();
-		this.setupReconnection();
 		this.setupFormHandler();
+		this.startPolling();
 	}
 
-	connect() {
-		const wsPort = parseInt(window.location.port) + 1;
-		this.ws = new WebSocket(`ws://localhost:${wsPort}`);
+	getDeltaChannel() {
+		// /chat.html shows general
+		const channel = this.getCurrentChannel();
+		return channel === 'chat' ? 'general' : channel;
+	}
 
-		this.ws.onmessage = (event) => {
-			const data = JSON.parse(event.data);
-			if (data.type === 'new_message') {
-				this.handleNewMessage(data.message);
-			} else if (data.type === 'update_required') {
+	startPolling() {
+		// Fallback for when the WebSocket is down; an idle channel costs one 304
+		setInterval(() => {
+			if (!this.eventSource && (!this.ws || this.ws.readyState !== WebSocket.OPEN)) {
+				this.pollMessages();
+			}
+		}, POLL_INTERVAL);
+	}
+
+	async pollMessages() {
+		if (this.cursor === null) {
+			// Page rendered from a template without a cursor
+			this.refreshMessages();
+			return;
+		}
+		const headers = this.etag ? {'If-None-Match': this.etag} : {};
+		try {
+			const response = await fetch(
+				`/api/chat/${encodeURIComponent(this.getDeltaChannel())}/since/${encodeURIComponent(this.cursor)}`,
+				{headers: headers, cache: 'no-store'}
+			);
+			if (response.status === 304) {
+				return;
+			}
+			if (!response.ok) {
+				throw new Error(`Delta request failed: ${response.status}`);
+			}
+			this.etag = response.headers.get('ETag');
+			const data = await response.json();
+			if (data.more) {
+				// Too far behind for a delta
 				this.refreshMessages();
+				return;
 			}
-		};
+			const messagesContainer = document.querySelector('.chat-messages');
+			if (data.messages.length && messagesContainer) {
+				// Optimistic copies of our own posts are replaced by the real ones
+				messagesContainer.querySelectorAll('.message.pending').forEach(el => el.remove());
+				messagesContainer.insertAdjacentHTML('afterbegin', data.messages.map(m => m.html).join(''));
+			}
+			this.cursor = data.cursor;
+		} catch (error) {
+			console.error('Error polling messages:', error);
+		}
 	}
 
-	setupReconnection() {
-		this.ws.onclose = () => {
+	getWebSocketUrls() {
+		// Unified server mode answers on the page's own port at /ws;
+		// the classic two-port mode listens on port + 1.
+		const host = window.location.hostname || 'localhost';
+		const port = parseInt(window.location.port) || 80;
+		return [`ws://${host}:${port}/ws`, `ws://localhost:${port + 1}`];
+	}
+
+	getCurrentChannel() {
+		return window.location.pathname.split('/').pop().replace('.html', '') || 'general';
+	}
+
+	connect() {
+		const ws = new WebSocket(this.wsUrls[this.wsUrlIndex]);
+		let opened = false;
+		this.ws = ws;
+
+		ws.onopen = () => {
+			opened = true;
+			this.wsFailures = 0;
+			// Only receive events for the channel shown on this page
+			ws.send(JSON.stringify({type: 'subscribe', channels: [this.getDeltaChannel()]}));
+		};
+
+		ws.onmessage = (event) => {
+			const data = JSON.parse(event.data);
+			// Bursts arrive coalesced into a single batch frame
+			this.handleEvents(data.type === 'batch' ? data.events : [data]);
+		};
+
+		ws.onclose = () => {
+			if (!opened) {
+				// Never connected: try the other server mode next time
+				this.wsUrlIndex = (this.wsUrlIndex + 1) % this.wsUrls.length;
+				this.wsFailures += 1;
+				if (this.wsFailures >= this.wsUrls.length && window.EventSource) {
+					// WebSockets blocked (e.g. by a proxy): use the HTTP event stream
+					this.connectEventStream();
+					return;
+				}
+			}
 			console.log('WebSocket closed, reconnecting...');
 			setTimeout(() => this.connect(), 1000);
 		};
 	}
 
+	connectEventStream() {
+		const source = new EventSource(`/events?channel=${encodeURIComponent(this.getDeltaChannel())}`);
+		this.eventSource = source;
+		// The browser reconnects by itself and resumes with Last-Event-ID
+		['update_required', 'new_message'].forEach((type) => {
+			source.addEventListener(type, (event) => this.handleEvents([JSON.parse(event.data)]));
+		});
+		source.onerror = () => {
+			if (source.readyState === EventSource.CLOSED) {
+				// Not served here (classic two-port server): back to WebSockets
+				this.eventSource = null;
+				this.wsFailures = 0;
+				setTimeout(() => this.connect(), 1000);
+			}
+		};
+	}
+
+	handleEvents(events) {
+		// Events carry the channel name ('general'), not the page name ('chat')
+		const channel = this.getDeltaChannel();
+		let refresh = false;
+		let reload = false;
+		events.forEach((item) => {
+			if (item.channel && item.channel !== channel && channel !== 'everything') {
+				return;
+			}
+			if (item.type === 'new_message') {
+				this.handleNewMessage(item.message);
+			} else if (item.type === 'update_required') {
+				// New messages sort after the cursor; anything else
+				// (edits, deletes, pulled older messages) needs the page
+				if (item.message_id && item.change !== 'delete' && item.change !== 'modify' &&
+					this.cursor !== null && item.message_id > this.cursor) {
+					refresh = true;
+				} else {
+					reload = true;
+				}
+			}
+		});
+		if (reload) {
+			this.refreshMessages();
+		} else if (refresh) {
+			this.pollMessages();
+		}
+	}
+
 	setupFormHandler() {
 		console.log("Setting up form handler");
 		const form = document.getElementById('post-form');
@@ -102,8 +237,8 @@ class ChatClient {
 				// Clear form
 				form.reset();
 
-				// Refresh messages to get proper IDs and formatting
-				this.refreshMessages();
+				// Fetch the stored message to get proper IDs and formatting
+				this.pollMessages();
 
 			} catch (error) {
 				console.error('Error:', error);
@@ -133,6 +268,8 @@ class ChatClient {
 				const currentMessages = document.querySelector('.chat-messages');
 				if (newMessages && currentMessages) {
 					currentMessages.innerHTML = newMessages.innerHTML;
+					this.cursor = newMessages.dataset.cursor !== undefined ? newMessages.dataset.cursor : null;
+					this.etag = null;
 				}
 			})
 			.catch(error => console.error('Error refreshing messages:', error));
@@ -145,7 +282,7 @@ class ChatClient {
 			: (messageData.tags || '');
 
 		return `
-			<div class="message">
+			<div class="message pending">
 				<div class="message-header">
 					<span class="author">${messageData.author || 'Guest'}</span>
 				</div>
@@ -282,6 +419,55 @@ function debounce(func, wait) {
 	};
 }
 
+function setupExpandLinks() {
+	// Delegated, so messages added later (deltas, refreshes) work too
+	document.addEventListener('click', async (event) => {
+		const link = event.target.closest('.expand-link');
+		if (!link || !link.textContent.trim()) return;
+		event.preventDefault();
+		const container = link.closest('.message-content');
+
+		// The preview is the text before the link; wrap it once so it can be hidden
+		let preview = container.querySelector('.message-preview');
+		if (!preview) {
+			preview = document.createElement('span');
+			preview.className = 'message-preview';
+			Array.from(container.childNodes)
+				.filter(node => node.nodeType === Node.TEXT_NODE)
+				.forEach(node => preview.appendChild(node));
+			container.insertBefore(preview, container.firstChild);
+		}
+
+		let full = container.querySelector('.full-message');
+		if (!full) {
+			// Lazy pages only carry the preview
+			link.textContent = 'Loading...';
+			try {
+				const channel = encodeURIComponent(link.dataset.channel);
+				const response = await fetch(`/api/message/${channel}/${encodeURIComponent(link.dataset.messageId)}`);
+				if (!response.ok) {
+					throw new Error(`Failed to load message: ${response.status}`);
+				}
+				const data = await response.json();
+				full = document.createElement('div');
+				full.className = 'full-message';
+				full.style.display = 'none';
+				full.innerHTML = data.content;
+				container.insertBefore(full, link);
+			} catch (error) {
+				console.error('Error loading message:', error);
+				link.textContent = 'Show More';
+				return;
+			}
+		}
+
+		const expanded = full.style.display !== 'none';
+		full.style.display = expanded ? 'none' : 'block';
+		preview.style.display = expanded ? '' : 'none';
+		link.textContent = expanded ? 'Show More' : 'Show Less';
+	});
+}
+
 function replyToMessage(messageId, author) {
 	const textarea = document.querySelector('textarea[name="content"]');
 	const replyToInput = document.querySelector('input[name="reply_to"]');
@@ -317,6 +503,9 @@ document.addEventListener('DOMContentLoaded', function() {
 
 	// Setup sync button
 	setupSyncButton();
+
+	// "Show More" on truncated messages
+	setupExpandLinks();
 });
 
 /* end chat.js ; marker comment, please do not remove */
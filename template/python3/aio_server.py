@@ -0,0 +1,177 @@
+# begin template/python3/aio_server.py ; marker comment, please do not remove
+
+# Unified asyncio server: HTTP routes and WebSocket upgrades on one port,
+# in one event loop. Requests are parsed on the loop; the route itself
+# (rendering, git, file I/O) runs on a thread pool so the loop never blocks.
+
+import asyncio
+import io
+import email.parser
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+from config import POST_BATCH_MAX_BYTES
+from http_handler import CustomHTTPRequestHandler
+from sse import EVENT_STREAM_PATH, EventStream
+from ws_protocol import WebSocketConnection, handshake_response
+
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 16 * 1024 * 1024
+# Routes with their own limit, checked before the body is read
+BODY_SIZE_LIMITS = {'/post/batch': POST_BATCH_MAX_BYTES}
+# Routes that read their body as they go instead of getting it all in memory
+STREAMED_BODY_PATHS = {'/post/batch'}
+# Seconds a streamed route waits for more of the body before giving up
+BODY_READ_TIMEOUT = 60
+WEBSOCKET_PATH = '/ws'
+
+class BufferedRequest(CustomHTTPRequestHandler):
+	"""A CustomHTTPRequestHandler fed from memory instead of a socket.
+
+	Routes see the usual interface (path, headers, rfile, send_response,
+	wfile, ...); everything written is collected and sent by the loop.
+	"""
+
+	def __init__(self, method, path, version, headers, rfile, client_address, directory):
+		self.command = method
+		self.path = path
+		self.request_version = version
+		self.requestline = f"{method} {path} {version}"
+		self.headers = headers
+		self.rfile = rfile
+		self.wfile = io.BytesIO()
+		self.client_address = client_address
+		self.directory = directory
+		self.close_connection = True
+
+	def run(self):
+		"""Dispatch through the shared route table; returns the raw response"""
+		self.router.dispatch(self, self.command)
+		return self.wfile.getvalue()
+
+class StreamedBody(io.RawIOBase):
+	"""The next length bytes of a connection, for a route running on a worker thread.
+
+	Each read waits for the loop to receive the data, so the body is never
+	held in memory as a whole. Wrap in io.BufferedReader for readline.
+	"""
+
+	def __init__(self, reader: asyncio.StreamReader, length: int, loop: asyncio.AbstractEventLoop):
+		self.reader = reader
+		self.remaining = length
+		self.loop = loop
+
+	def readable(self):
+		return True
+
+	def readinto(self, buffer):
+		if self.remaining <= 0:
+			return 0
+		future = asyncio.run_coroutine_threadsafe(self.reader.read(min(len(buffer), self.remaining)), self.loop)
+		data = future.result(timeout=BODY_READ_TIMEOUT)
+		if not data:
+			self.remaining = 0  # Client closed the connection early
+			return 0
+		buffer[:len(data)] = data
+		self.remaining -= len(data)
+		return len(data)
+
+class UnifiedServer:
+	"""Serve the route table, a WebSocket endpoint and an event stream from a single loop"""
+
+	def __init__(self, port: int, directory: str,
+				 on_websocket: Callable[[WebSocketConnection], Awaitable[None]],
+				 host: str = '', workers: Optional[int] = None,
+				 on_event_stream: Optional[Callable[[EventStream], Awaitable[None]]] = None):
+		self.port = port
+		self.directory = directory
+		self.host = host
+		self.on_websocket = on_websocket
+		self.on_event_stream = on_event_stream
+		self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gityap-http')
+		self.server: Optional[asyncio.AbstractServer] = None
+
+	async def start(self):
+		self.server = await asyncio.start_server(
+			self.handle_connection, self.host, self.port, limit=MAX_HEADER_SIZE
+		)
+		print(f"Serving HTTP and WebSocket on 0.0.0.0 port {self.port} (http://0.0.0.0:{self.port}/) ...")
+
+	async def serve_forever(self):
+		await self.start()
+		async with self.server:
+			await self.server.serve_forever()
+
+	async def run_blocking(self, func, *args):
+		"""Run blocking work (rendering, git) on the executor"""
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self.executor, func, *args)
+
+	async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		try:
+			try:
+				head = await reader.readuntil(b'\r\n\r\n')
+			except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+				return
+
+			request_line, _, header_block = head.partition(b'\r\n')
+			try:
+				method, path, version = request_line.decode('latin-1').split()
+			except ValueError:
+				writer.write(b"HTTP/1.0 400 Bad Request\r\nConnection: close\r\n\r\n")
+				return
+			headers = email.parser.BytesParser(_class=http.client.HTTPMessage).parsebytes(header_block)
+
+			if self.is_websocket_upgrade(method, path, headers):
+				writer.write(handshake_response(headers['Sec-WebSocket-Key']))
+				await writer.drain()
+				await self.on_websocket(WebSocketConnection(reader, writer, path=path))
+				return
+
+			if self.on_event_stream is not None and method == 'GET' and path.split('?', 1)[0] == EVENT_STREAM_PATH:
+				# Long-lived; stays on the loop instead of taking a worker thread
+				await self.on_event_stream(EventStream(reader, writer, path, headers))
+				return
+
+			try:
+				length = int(headers.get('Content-Length', 0) or 0)
+			except ValueError:
+				length = -1
+			if length < 0:
+				writer.write(b"HTTP/1.0 400 Bad Request\r\nConnection: close\r\n\r\n")
+				return
+			route_path = path.split('?', 1)[0]
+			if length > BODY_SIZE_LIMITS.get(route_path, MAX_BODY_SIZE):
+				writer.write(b"HTTP/1.0 413 Payload Too Large\r\nConnection: close\r\n\r\n")
+				return
+			if route_path in STREAMED_BODY_PATHS:
+				rfile = io.BufferedReader(StreamedBody(reader, length, asyncio.get_running_loop()))
+			else:
+				rfile = io.BytesIO(await reader.readexactly(length) if length else b'')
+
+			request = BufferedRequest(
+				method, path, version, headers, rfile,
+				writer.get_extra_info('peername') or ('', 0), self.directory
+			)
+			response = await self.run_blocking(request.run)
+			writer.write(response)
+			await writer.drain()
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass
+		except Exception as e:
+			print(f"Error handling connection: {e}")
+		finally:
+			if not writer.is_closing():
+				writer.close()
+
+	@staticmethod
+	def is_websocket_upgrade(method, path, headers) -> bool:
+		return (
+			method == 'GET'
+			and path.split('?', 1)[0] == WEBSOCKET_PATH
+			and headers.get('Upgrade', '').lower() == 'websocket'
+			and bool(headers.get('Sec-WebSocket-Key'))
+		)
+
+# end template/python3/aio_server.py ; marker comment, please do not remove
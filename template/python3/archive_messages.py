@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+# begin template/python3/archive_messages.py ; marker comment, please do not remove
+# to run: python3 archive_messages.py -d REPO [--older-than DAYS | --before YYYY-MM-DD]
+
+# Compacts messages older than a cutoff into per-channel, per-month packs
+# (archive/<channel>/YYYY-MM.jsonl.gz with a YYYY-MM.idx.json offset index,
+# see chat/archive.py) and removes the loose files, so checkouts, scans and
+# backups handle a few files per month instead of one per message. Readers
+# (pages, /api/message, search, threads) find packed messages by the same
+# channel and id. Packs are append-only, so running it again later only
+# adds to them.
+#
+# In a git repository the loose files are removed with git rm and the packs
+# added in one commit; the history of each message stays in git. Disk usage,
+# file and directory counts and the time of a cold scan (every message
+# parsed without the manifest) are reported before and after.
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shlex
+import sys
+import time
+from datetime import datetime, timedelta
+
+from chat.archive import ARCHIVE_DIR, INDEX_SUFFIX, INDEX_VERSION, PACK_SUFFIX, load_index, month_of
+from chat.channel_manager import iter_channel_files
+from chat.manifest import _atomic_write_json, detect_encoding, manifest_for, parse_message
+from commit_files import git_toplevel, run_git, tracked_files
+from migrate_layout import remove_empty_dirs
+
+# Paths per git rm command line
+GIT_RM_BATCH = 200
+
+def usage(repo_path):
+	"""{'files', 'directories', 'bytes'} of message/ and archive/; bytes as allocated on disk"""
+	totals = {'files': 0, 'directories': 0, 'bytes': 0}
+	for top in ('message', ARCHIVE_DIR):
+		for root, dirs, files in os.walk(os.path.join(repo_path, top)):
+			dirs[:] = [name for name in dirs if not name.startswith('.')]
+			totals['directories'] += 1
+			for name in files:
+				try:
+					stat = os.stat(os.path.join(root, name))
+				except OSError:
+					continue
+				totals['files'] += 1
+				totals['bytes'] += getattr(stat, 'st_blocks', 0) * 512 or stat.st_size
+	return totals
+
+def cold_scan(repo_path):
+	"""(messages, seconds) to list and parse every message without the manifest"""
+	started = time.perf_counter()
+	count = 0
+	for path in iter_channel_files(os.path.join(repo_path, 'message'), 'everything'):
+		try:
+			parse_message(path)
+		except OSError:
+			continue
+		count += 1
+	return count, time.perf_counter() - started
+
+def report(before, after):
+	rows = [('files', 'files'), ('directories', 'directories'), ('bytes on disk', 'bytes'), ('messages', 'messages')]
+	print(f"{'':16}{'before':>14}{'after':>14}")
+	for label, key in rows:
+		print(f"{label:16}{before[key]:>14,}{after[key]:>14,}")
+	print(f"{'cold scan':16}{before['seconds']:>13.2f}s{after['seconds']:>13.2f}s")
+
+def measure(repo_path):
+	totals = usage(repo_path)
+	totals['messages'], totals['seconds'] = cold_scan(repo_path)
+	return totals
+
+def plan_archive(message_dir, channel, cutoff):
+	"""{YYYY-MM: [path]} of the channel's loose messages with an id before cutoff"""
+	months = {}
+	for root, dirs, files in os.walk(os.path.join(message_dir, channel)):
+		dirs[:] = [name for name in dirs if not name.startswith('.')]
+		for name in files:
+			message_id = name[:-len('.txt')]
+			if name.endswith('.txt') and message_id[:8].isdigit() and message_id < cutoff:
+				months.setdefault(month_of(message_id), []).append(os.path.join(root, name))
+	return months
+
+def append_to_pack(repo_path, pack_base, paths):
+	"""Add the messages at paths to a pack; returns the ids now in it"""
+	index = dict(load_index(pack_base))
+	os.makedirs(os.path.dirname(pack_base), exist_ok=True)
+	with open(pack_base + PACK_SUFFIX, 'ab') as f:
+		offset = f.seek(0, os.SEEK_END)
+		for path in sorted(paths):
+			message_id = os.path.basename(path)[:-len('.txt')]
+			if message_id in index:
+				continue  # Packed by an earlier run that stopped before removing it
+			stat = os.stat(path)
+			with open(path, 'rb') as message_file:
+				raw_data = message_file.read()
+			encoding = detect_encoding(raw_data)
+			record = {
+				'id': message_id,
+				'path': os.path.relpath(path, repo_path),
+				'mtime': stat.st_mtime,
+				'size': stat.st_size,
+				'encoding': encoding,
+				'content_hash': hashlib.sha256(raw_data).hexdigest(),
+				'content': raw_data.decode(encoding, errors='replace'),
+			}
+			# One gzip member per message, so each can be decompressed alone
+			member = gzip.compress(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n', mtime=0)
+			f.write(member)
+			index[message_id] = [offset, len(member), stat.st_mtime, stat.st_size]
+			offset += len(member)
+		f.flush()
+		os.fsync(f.fileno())
+	# The index is replaced only once the members it points at are on disk
+	_atomic_write_json(pack_base + INDEX_SUFFIX, {'version': INDEX_VERSION, 'messages': index})
+	return index
+
+def git_remove(toplevel, paths):
+	for start in range(0, len(paths), GIT_RM_BATCH):
+		batch = ' '.join(shlex.quote(os.path.relpath(path, toplevel)) for path in paths[start:start + GIT_RM_BATCH])
+		returncode, _, error = run_git(f"git rm -q -- {batch}", toplevel)
+		if returncode != 0:
+			print(f"Error removing archived files: {error}")
+
+def archive(repo_path, cutoff, channels=None, use_git=True, commit=True, dry_run=False):
+	"""Pack every loose message with an id before cutoff (YYYYmmdd); returns the number packed"""
+	repo_path = os.path.abspath(repo_path)
+	message_dir = os.path.join(repo_path, 'message')
+	archive_dir = os.path.join(repo_path, ARCHIVE_DIR)
+	if channels is None:
+		channels = sorted(entry.name for entry in os.scandir(message_dir)
+						  if entry.is_dir() and not entry.name.startswith('.'))
+	toplevel = git_toplevel(repo_path) if use_git and not dry_run else None
+	manifest = manifest_for(repo_path)
+	packed = 0
+	touched = []
+	for channel in channels:
+		months = plan_archive(message_dir, channel, cutoff)
+		if not months:
+			continue
+		count = sum(len(paths) for paths in months.values())
+		print(f"{channel}: packing {count} messages into {len(months)} monthly packs")
+		if dry_run:
+			continue
+
+		channel_dir = os.path.join(message_dir, channel)
+		tracked = tracked_files(toplevel, channel_dir) if toplevel else set()
+		removed = []
+		for month, paths in sorted(months.items()):
+			pack_base = os.path.join(archive_dir, channel, month)
+			entries = {path: manifest.lookup(path) for path in paths}
+			index = append_to_pack(repo_path, pack_base, paths)
+			for path in paths:
+				message_id = os.path.basename(path)[:-len('.txt')]
+				if message_id not in index:
+					continue
+				removed.append(path)
+				manifest.forget(path)
+				if entries[path] is not None:
+					manifest.store(os.path.join(pack_base, f"{message_id}.txt"), entries[path])
+		manifest.save()
+
+		git_remove(toplevel, [path for path in removed if path in tracked])
+		for path in removed:
+			if os.path.exists(path):
+				os.remove(path)
+		remove_empty_dirs(channel_dir)
+		packed += len(removed)
+		touched.append(channel)
+
+	if toplevel and touched:
+		packs = ' '.join(shlex.quote(os.path.relpath(os.path.join(archive_dir, channel), toplevel)) for channel in touched)
+		run_git(f"git add -- {packs}", toplevel)
+		pathspec = packs + ' ' + ' '.join(
+			shlex.quote(os.path.relpath(os.path.join(message_dir, channel), toplevel)) for channel in touched)
+		if commit:
+			message = f"Archive {packed} messages from before {cutoff}"
+			returncode, _, error = run_git(f"git commit -q -m {shlex.quote(message)} -- {pathspec}", toplevel)
+			if returncode != 0:
+				print(f"Error committing archive: {error}")
+	return packed
+
+def main():
+	parser = argparse.ArgumentParser(description="Pack old messages into per-channel monthly archives.")
+	parser.add_argument('-d', '--directory', type=str, default=os.getcwd(),
+					   help='Repository to archive (default: current directory)')
+	cutoff = parser.add_mutually_exclusive_group()
+	cutoff.add_argument('--older-than', type=int, default=365, metavar='DAYS',
+					   help='Pack messages older than this many days (default: 365)')
+	cutoff.add_argument('--before', type=str, metavar='YYYY-MM-DD', help='Pack messages from before this date')
+	parser.add_argument('-c', '--channel', action='append', dest='channels',
+					   help='Only this channel (may be repeated; default: every channel)')
+	parser.add_argument('-n', '--dry-run', action='store_true', help='Show what would be packed, change nothing')
+	parser.add_argument('--no-git', action='store_true', help='Delete loose files without git rm')
+	parser.add_argument('--no-commit', action='store_true', help='Leave the changes staged, uncommitted')
+	parser.add_argument('--no-report', action='store_true', help='Skip the before/after disk and scan report')
+	args = parser.parse_args()
+
+	if not os.path.isdir(os.path.join(args.directory, 'message')):
+		print(f"No message directory in {args.directory}")
+		sys.exit(1)
+	try:
+		if args.before:
+			cutoff_date = datetime.strptime(args.before, '%Y-%m-%d')
+		else:
+			cutoff_date = datetime.now() - timedelta(days=args.older_than)
+	except ValueError:
+		print(f"Invalid date: {args.before}")
+		sys.exit(1)
+
+	measure_report = not args.no_report and not args.dry_run
+	before = measure(args.directory) if measure_report else None
+	packed = archive(args.directory, cutoff_date.strftime('%Y%m%d'), channels=args.channels,
+					 use_git=not args.no_git, commit=not args.no_commit, dry_run=args.dry_run)
+	if not args.dry_run:
+		print(f"Packed {packed} messages from before {cutoff_date:%Y-%m-%d}.")
+	if measure_report:
+		report(before, measure(args.directory))
+
+if __name__ == "__main__":
+	main()
+
+# end archive_messages.py ; marker comment, please do not remove
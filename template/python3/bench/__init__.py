@@ -0,0 +1,3 @@
+# begin template/python3/bench/__init__.py
+"""Benchmarks for the GitYap server and message pipeline."""
+# end template/python3/bench/__init__.py
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# begin template/python3/bench/baseline.py ; marker comment, please do not remove
+# to run: python3 bench/baseline.py save results.json --name main
+#         python3 bench/baseline.py compare results.json
+#         python3 bench/baseline.py gate --since origin/main
+
+# Baseline store and regression gate for bench/run.py results.
+#
+# Baselines are run.py JSON reports stored as <store>/<fingerprint>/<label>.json,
+# where the fingerprint identifies the machine (see common.machine_fingerprint)
+# and the label is --name or the commit. Numbers are only compared within one
+# fingerprint: timings from different machines say nothing about the code.
+#
+# An operation regresses when its median is more than --threshold slower than
+# the baseline AND a one-sided Mann-Whitney U test on the raw samples says the
+# slowdown is significant at --alpha. compare and gate exit 1 on a regression,
+# 2 when there is no usable baseline, 0 otherwise.
+
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from common import PYTHON3_DIR, TEMPLATE_DIR, machine_fingerprint
+
+DEFAULT_STORE = os.environ.get('GITYAP_BENCH_BASELINES', os.path.join(PYTHON3_DIR, 'bench', 'baselines'))
+KEY_OPERATIONS = ('chat_render', 'chat_render_everything', 'post', 'log_report', 'sync')
+# Changes under these paths (relative to the repository root) trigger the gate
+GATED_PATHS = ('template/python3/chat/', 'template/python3/handlers/', 'template/python3/commit_files.py')
+DEFAULT_THRESHOLD = 0.10
+DEFAULT_ALPHA = 0.05
+
+def load_report(path):
+	with open(path, 'r', encoding='utf-8') as f:
+		return json.load(f)
+
+def report_fingerprint(report):
+	return report.get('fingerprint') or machine_fingerprint(report.get('machine') or {})
+
+def save_baseline(report, store=DEFAULT_STORE, name=None):
+	"""Store a report; returns the path written"""
+	label = name or (report.get('commit') or 'unknown')[:12]
+	directory = os.path.join(store, report_fingerprint(report))
+	os.makedirs(directory, exist_ok=True)
+	path = os.path.join(directory, f"{label}.json")
+	with open(path, 'w', encoding='utf-8') as f:
+		json.dump(report, f, indent=2)
+	return path
+
+def list_baselines(store=DEFAULT_STORE, fingerprint=None):
+	"""(fingerprint, label, created, commit, path) for every stored baseline, oldest first"""
+	entries = []
+	if not os.path.isdir(store):
+		return entries
+	for machine in sorted(os.listdir(store)):
+		if fingerprint and machine != fingerprint:
+			continue
+		directory = os.path.join(store, machine)
+		if not os.path.isdir(directory):
+			continue
+		for filename in os.listdir(directory):
+			if not filename.endswith('.json'):
+				continue
+			path = os.path.join(directory, filename)
+			try:
+				report = load_report(path)
+			except (OSError, ValueError) as e:
+				print(f"Skipping unreadable baseline {path}: {e}", file=sys.stderr)
+				continue
+			entries.append((machine, filename[:-5], report.get('created', ''), report.get('commit', 'unknown'), path))
+	entries.sort(key=lambda entry: entry[2])
+	return entries
+
+def find_baseline(store, fingerprint, against=None):
+	"""Path of the named (or newest) baseline for this machine, or None"""
+	if against and os.path.isfile(against):
+		return against
+	entries = list_baselines(store, fingerprint)
+	if against:
+		entries = [entry for entry in entries if entry[1] == against or entry[3].startswith(against)]
+	return entries[-1][4] if entries else None
+
+def mann_whitney_greater(baseline, current):
+	"""One-sided p-value that current samples are larger than baseline ones"""
+	n1, n2 = len(baseline), len(current)
+	combined = sorted([(value, 0) for value in baseline] + [(value, 1) for value in current])
+	ranks = [0.0] * len(combined)
+	tie_term = 0
+	index = 0
+	while index < len(combined):
+		end = index
+		while end + 1 < len(combined) and combined[end + 1][0] == combined[index][0]:
+			end += 1
+		for position in range(index, end + 1):
+			ranks[position] = (index + end) / 2 + 1
+		size = end - index + 1
+		tie_term += size ** 3 - size
+		index = end + 1
+
+	rank_sum = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 1)
+	u = rank_sum - n2 * (n2 + 1) / 2
+	mean = n1 * n2 / 2
+	total = n1 + n2
+	variance = n1 * n2 / 12 * ((total + 1) - tie_term / (total * (total - 1)))
+	if variance <= 0:
+		return 1.0
+	z = (u - mean - 0.5) / math.sqrt(variance)
+	return 0.5 * math.erfc(z / math.sqrt(2))
+
+def compare_reports(baseline, current, operations=KEY_OPERATIONS,
+					threshold=DEFAULT_THRESHOLD, alpha=DEFAULT_ALPHA):
+	"""Per-operation verdicts: ok, regression, improvement, slower, faster, missing, error"""
+	rows = []
+	for name in operations:
+		before = baseline.get('results', {}).get(name)
+		after = current.get('results', {}).get(name)
+		if not before or 'summary' not in before or not after:
+			rows.append({'operation': name, 'verdict': 'missing'})
+			continue
+		if 'error' in after:
+			rows.append({'operation': name, 'verdict': 'error', 'error': after['error']})
+			continue
+
+		base_median = before['summary']['median']
+		median = after['summary']['median']
+		ratio = median / base_median if base_median else float('inf')
+		before_samples = before.get('samples') or []
+		after_samples = after.get('samples') or []
+		if len(before_samples) >= 3 and len(after_samples) >= 3:
+			p_slower = mann_whitney_greater(before_samples, after_samples)
+			p_faster = mann_whitney_greater(after_samples, before_samples)
+		else:
+			# Too few samples to test; fall back to the threshold alone
+			p_slower = p_faster = 0.0
+
+		if ratio > 1 + threshold:
+			verdict = 'regression' if p_slower < alpha else 'slower'
+		elif ratio < 1 - threshold:
+			verdict = 'improvement' if p_faster < alpha else 'faster'
+		else:
+			verdict = 'ok'
+		rows.append({
+			'operation': name, 'verdict': verdict, 'baseline': base_median, 'current': median,
+			'ratio': ratio, 'p_slower': p_slower,
+		})
+	return rows
+
+def comparable(baseline, current):
+	"""Warnings about differences that make the numbers hard to compare"""
+	warnings = []
+	if report_fingerprint(baseline) != report_fingerprint(current):
+		warnings.append("baseline was recorded on a different machine")
+	for key in ('messages', 'channels', 'seed'):
+		before = baseline.get('corpus', {}).get(key)
+		after = current.get('corpus', {}).get(key)
+		if before is not None and after is not None and before != after:
+			warnings.append(f"corpus {key} differs ({before} vs {after})")
+	return warnings
+
+def print_comparison(rows, baseline, warnings):
+	print(f"Baseline: commit {baseline.get('commit', 'unknown')} ({baseline.get('created', '?')})")
+	for warning in warnings:
+		print(f"Warning: {warning}")
+	print(f"{'operation':24s} {'baseline ms':>12s} {'current ms':>12s} {'change':>8s} {'p':>7s}  verdict")
+	for row in rows:
+		if 'ratio' not in row:
+			print(f"{row['operation']:24s} {'':>12s} {'':>12s} {'':>8s} {'':>7s}  {row['verdict']} {row.get('error', '')}")
+			continue
+		print(f"{row['operation']:24s} {row['baseline'] * 1000:12.3f} {row['current'] * 1000:12.3f} "
+			  f"{(row['ratio'] - 1) * 100:+7.1f}% {row['p_slower']:7.3f}  {row['verdict']}")
+
+def run_comparison(baseline_path, current, operations, threshold, alpha):
+	"""Print the comparison and return the exit status"""
+	baseline = load_report(baseline_path)
+	rows = compare_reports(baseline, current, operations, threshold, alpha)
+	print_comparison(rows, baseline, comparable(baseline, current))
+	failed = [row['operation'] for row in rows if row['verdict'] in ('regression', 'error')]
+	if failed:
+		print(f"Significant slowdown (> {threshold:.0%}) in: {', '.join(failed)}")
+		return 1
+	return 0
+
+def changed_gated_paths(since):
+	"""Files under GATED_PATHS that differ from the given revision"""
+	root = os.path.dirname(TEMPLATE_DIR)
+	output = subprocess.run(['git', '-C', root, 'diff', '--name-only', since, '--'] + list(GATED_PATHS),
+							capture_output=True, text=True, check=True).stdout
+	return [line for line in output.splitlines() if line]
+
+def run_gate(args):
+	if args.since:
+		try:
+			changed = changed_gated_paths(args.since)
+		except (OSError, subprocess.CalledProcessError) as e:
+			print(f"Could not diff against {args.since}: {e}", file=sys.stderr)
+			return 2
+		if not changed:
+			print(f"No changes under {', '.join(GATED_PATHS)} since {args.since}; skipping benchmarks")
+			return 0
+		print(f"{len(changed)} gated file(s) changed since {args.since}", file=sys.stderr)
+
+	baseline_path = find_baseline(args.store, machine_fingerprint(), args.against)
+	if not baseline_path:
+		print(f"No baseline for this machine ({machine_fingerprint()}) in {args.store}", file=sys.stderr)
+		return 2
+	baseline = load_report(baseline_path)
+
+	# Re-create the baseline's corpus and parameters so only the code differs
+	from corpus import generate_corpus
+	from run import build_report, run_suite
+	corpus = baseline.get('corpus', {})
+	parameters = baseline.get('parameters', {})
+	operations = [name for name in args.operations if name in baseline.get('results', {})]
+	corpus_dir = tempfile.mkdtemp(prefix='gityap-gate-')
+	try:
+		corpus_info = generate_corpus(corpus_dir, corpus.get('messages', 1000), len(corpus.get('channels', [])) or 4,
+									  corpus.get('seed', 1), corpus.get('reply_ratio', 0.2), git=True)
+		results = run_suite(corpus_dir, parameters.get('channel', 'general'), parameters.get('repeat', 5),
+							operations, parameters.get('process_sample', 500), parameters.get('commit_batch', 20))
+	finally:
+		shutil.rmtree(corpus_dir, ignore_errors=True)
+
+	current = build_report(results, corpus_info, parameters)
+	if args.output:
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump(current, f, indent=2)
+	return run_comparison(baseline_path, current, args.operations, args.threshold, args.alpha)
+
+def main():
+	parser = argparse.ArgumentParser(description="Store benchmark baselines and gate on regressions.")
+	parser.add_argument('--store', default=DEFAULT_STORE, help=f'Baseline directory (default: {DEFAULT_STORE})')
+	commands = parser.add_subparsers(dest='command', required=True)
+
+	save = commands.add_parser('save', help='Store a bench/run.py result file as a baseline')
+	save.add_argument('results', help='JSON written by bench/run.py --output')
+	save.add_argument('--name', help='Label for the baseline (default: the commit)')
+
+	commands.add_parser('list', help='List stored baselines')
+
+	def add_comparison_options(command):
+		command.add_argument('--against', help='Baseline label, commit prefix or file (default: newest for this machine)')
+		command.add_argument('--operations', nargs='+', default=list(KEY_OPERATIONS), help='Operations to check')
+		command.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+							 help=f'Relative slowdown of the median that counts (default: {DEFAULT_THRESHOLD})')
+		command.add_argument('--alpha', type=float, default=DEFAULT_ALPHA,
+							 help=f'Significance level of the Mann-Whitney test (default: {DEFAULT_ALPHA})')
+
+	compare = commands.add_parser('compare', help='Compare a result file with a baseline')
+	compare.add_argument('results', help='JSON written by bench/run.py --output')
+	add_comparison_options(compare)
+
+	gate = commands.add_parser('gate', help='Run the key benchmarks and compare them with the baseline')
+	gate.add_argument('--since', help=f'Only run when {", ".join(GATED_PATHS)} changed since this revision')
+	gate.add_argument('-o', '--output', help='Also write the new results as JSON to this file')
+	add_comparison_options(gate)
+
+	args = parser.parse_args()
+
+	if args.command == 'save':
+		path = save_baseline(load_report(args.results), args.store, args.name)
+		print(f"Baseline stored in {path}")
+	elif args.command == 'list':
+		for fingerprint, label, created, commit, _ in list_baselines(args.store):
+			marker = '*' if fingerprint == machine_fingerprint() else ' '
+			print(f"{marker} {fingerprint}  {label:20s} {created:20s} {commit}")
+	elif args.command == 'compare':
+		current = load_report(args.results)
+		baseline_path = find_baseline(args.store, report_fingerprint(current), args.against)
+		if not baseline_path:
+			print(f"No baseline for machine {report_fingerprint(current)} in {args.store}", file=sys.stderr)
+			sys.exit(2)
+		sys.exit(run_comparison(baseline_path, current, args.operations, args.threshold, args.alpha))
+	elif args.command == 'gate':
+		sys.exit(run_gate(args))
+
+if __name__ == "__main__":
+	main()
+
+# end template/python3/bench/baseline.py ; marker comment, please do not remove
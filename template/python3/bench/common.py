@@ -0,0 +1,102 @@
+# begin template/python3/bench/common.py ; marker comment, please do not remove
+
+# Shared helpers for the benchmark scripts: in-memory sockets for driving the
+# HTTP handler without a server, timing, summary statistics and a description
+# of the machine and code revision the numbers came from.
+
+import hashlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+PYTHON3_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_DIR = os.path.dirname(PYTHON3_DIR)
+
+if PYTHON3_DIR not in sys.path:
+	sys.path.insert(0, PYTHON3_DIR)
+
+class FakeSocket:
+	"""In-memory socket accepted by StreamRequestHandler"""
+	def __init__(self, raw):
+		self._raw = raw
+		self.output = io.BytesIO()
+
+	def makefile(self, mode, *args, **kwargs):
+		if 'r' in mode:
+			return io.BytesIO(self._raw)
+		return self.output
+
+	def sendall(self, data):
+		self.output.write(data)
+
+class FakeServer:
+	pass
+
+def raw_request(method, path, body=b'', headers=None):
+	"""Serialize an HTTP/1.1 request"""
+	lines = [f"{method} {path} HTTP/1.1", "Host: localhost"]
+	for name, value in (headers or {}).items():
+		lines.append(f"{name}: {value}")
+	if body:
+		lines.append(f"Content-Length: {len(body)}")
+	return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+def time_call(func, *args, **kwargs):
+	"""Return (elapsed_seconds, result) for one call"""
+	started = time.perf_counter()
+	result = func(*args, **kwargs)
+	return time.perf_counter() - started, result
+
+def percentile(sorted_values, fraction):
+	if not sorted_values:
+		return 0.0
+	index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+	return sorted_values[index]
+
+def summarize(samples):
+	"""Summary statistics for a list of durations (seconds)"""
+	ordered = sorted(samples)
+	return {
+		'n': len(ordered),
+		'min': ordered[0] if ordered else 0.0,
+		'median': statistics.median(ordered) if ordered else 0.0,
+		'mean': statistics.fmean(ordered) if ordered else 0.0,
+		'stdev': statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+		'p95': percentile(ordered, 0.95),
+		'p99': percentile(ordered, 0.99),
+		'max': ordered[-1] if ordered else 0.0,
+	}
+
+def git_commit(path=TEMPLATE_DIR):
+	"""Commit hash of the code being measured ('unknown' outside a git checkout)"""
+	try:
+		output = subprocess.run(['git', '-C', path, 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+		dirty = subprocess.run(['git', '-C', path, 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip()
+		return output + ('-dirty' if dirty else '')
+	except (OSError, subprocess.CalledProcessError):
+		return 'unknown'
+
+def machine_info():
+	"""Description of the machine, used to tell comparable runs apart"""
+	return {
+		'python': platform.python_version(),
+		'implementation': platform.python_implementation(),
+		'system': platform.system(),
+		'release': platform.release(),
+		'machine': platform.machine(),
+		'processor': platform.processor(),
+		'cpu_count': os.cpu_count(),
+	}
+
+def machine_fingerprint(info=None):
+	"""Short stable hash of machine_info(); runs are only comparable within one"""
+	info = info or machine_info()
+	stable = {key: info.get(key) for key in ('python', 'implementation', 'system', 'machine', 'processor', 'cpu_count')}
+	return hashlib.sha1(json.dumps(stable, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+# end template/python3/bench/common.py ; marker comment, please do not remove
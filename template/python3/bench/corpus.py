@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# begin template/python3/bench/corpus.py ; marker comment, please do not remove
+# to run: python3 bench/corpus.py OUTPUT_DIR --messages 10000 --channels 8
+
+# Generates a synthetic GitYap repository for benchmarks:
+# - message/<channel>/YYYYmmdd_HHMMSS.txt files in the format handle_chat_post
+#   writes (Author:/Channel: header, body, optional Tags: line)
+# - hashtags, Reply-To: lines pointing at earlier messages, and a mix of
+#   UTF-8, Latin-1 and UTF-16 encoded files
+# - file mtimes matching the timestamp in the file name
+# - a template/ directory so page renderers can run from OUTPUT_DIR
+# Generation is streamed, so 1M messages need no more memory than 1k.
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import TEMPLATE_DIR
+
+WORDS = (
+	"git commit merge branch rebase push pull fetch message channel thread reply "
+	"server client render cache index latency socket event queue deploy release "
+	"review patch diff log tag remote origin fork clone build test bench profile "
+	"the a and of to in is that for on with as it be this by from at or"
+).split()
+HASHTAGS = ['#release', '#bug', '#idea', '#perf', '#question', '#docs', '#ops', '#random']
+AUTHORS = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank', 'grace', 'heidi', 'ivan', 'judy', 'Guest']
+ACCENTED = ['café', 'naïve', 'façade', 'Zürich', 'señor', 'crème brûlée']
+
+# (encoding, weight); Latin-1 bodies get accented words so detection has work to do
+ENCODINGS = (('utf-8', 85), ('latin-1', 10), ('utf-16', 5))
+
+# Fixtures for log.html.py, whose page templates are not shipped in template/html
+LOG_FIXTURES = {
+	'html/page.html': "<!DOCTYPE html><html><head><title>{title}</title><style>{style}</style></head>"
+		"<body><h1>{title}</h1><p>{file_count} files, generated {current_time}</p>"
+		"<table>{table_rows}</table></body></html>\n",
+	'html/page_row.html': "<tr><td>{relative_path}</td><td>{commit_timestamp}</td><td>{stored_date}</td>"
+		"<td>{author}</td><td>{hashtags}</td></tr>\n",
+	'css/webmail.css': "table { border-collapse: collapse; }\n",
+}
+
+def channel_names(count):
+	base = ['general', 'random', 'dev', 'ops', 'design', 'support', 'release', 'offtopic']
+	names = base[:count]
+	names += [f"channel{index:03d}" for index in range(len(names), count)]
+	return names
+
+def pick_encoding(rng):
+	total = sum(weight for _, weight in ENCODINGS)
+	roll = rng.uniform(0, total)
+	for encoding, weight in ENCODINGS:
+		roll -= weight
+		if roll <= 0:
+			return encoding
+	return ENCODINGS[0][0]
+
+def message_body(rng, encoding, min_words=5, max_words=120):
+	words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+	if encoding != 'utf-8' or rng.random() < 0.1:
+		for _ in range(rng.randint(1, 3)):
+			words.insert(rng.randrange(len(words) + 1), rng.choice(ACCENTED))
+	if rng.random() < 0.4:
+		for _ in range(rng.randint(1, 3)):
+			words.insert(rng.randrange(len(words) + 1), rng.choice(HASHTAGS))
+	return ' '.join(words)
+
+def format_message(author, channel, body, tags=None, reply_to=None):
+	"""Same layout as RequestHandler.handle_chat_post, plus Reply-To"""
+	parts = [f"Author: {author}\n", f"Channel: {channel}\n"]
+	if reply_to:
+		parts.append(f"Reply-To: {reply_to}\n")
+	parts.append(body)
+	if tags:
+		parts.append(f"\n\nTags: {' '.join(tags)}")
+	return ''.join(parts)
+
+def setup_templates(output_dir):
+	"""Link the real templates into output_dir, adding the log.html fixtures"""
+	template_dir = os.path.join(output_dir, 'template')
+	for sub in ('html', 'css', 'js', 'python3', 'txt'):
+		source_dir = os.path.join(TEMPLATE_DIR, sub)
+		target_dir = os.path.join(template_dir, sub)
+		if not os.path.isdir(source_dir):
+			continue
+		if sub == 'python3':
+			if not os.path.lexists(target_dir):
+				os.makedirs(template_dir, exist_ok=True)
+				os.symlink(source_dir, target_dir)
+			continue
+		os.makedirs(target_dir, exist_ok=True)
+		for name in os.listdir(source_dir):
+			target = os.path.join(target_dir, name)
+			if not os.path.lexists(target):
+				os.symlink(os.path.join(source_dir, name), target)
+
+	for relative, content in LOG_FIXTURES.items():
+		target = os.path.join(template_dir, relative)
+		if not os.path.exists(target):
+			with open(target, 'w', encoding='utf-8') as f:
+				f.write(content)
+
+def generate_corpus(output_dir, messages=1000, channels=4, seed=1, reply_ratio=0.2,
+					start=None, spacing_seconds=37, git=False, progress=False):
+	"""Write a synthetic repository; returns a description of what was written"""
+	rng = random.Random(seed)
+	names = channel_names(channels)
+	message_dir = os.path.join(output_dir, 'message')
+	for name in names:
+		os.makedirs(os.path.join(message_dir, name), exist_ok=True)
+	setup_templates(output_dir)
+
+	start = start or datetime(2020, 1, 1)
+	# Channels get skewed traffic, as real deployments do
+	weights = [1.0 / (rank + 1) for rank in range(len(names))]
+	recent_ids = {name: [] for name in names}
+	encodings = {}
+	total_bytes = 0
+	moment = start
+
+	for index in range(messages):
+		moment += timedelta(seconds=rng.randint(1, spacing_seconds))
+		channel = rng.choices(names, weights)[0]
+		message_id = moment.strftime('%Y%m%d_%H%M%S')
+		path = os.path.join(message_dir, channel, f"{message_id}.txt")
+
+		encoding = pick_encoding(rng)
+		reply_to = None
+		if recent_ids[channel] and rng.random() < reply_ratio:
+			reply_to = rng.choice(recent_ids[channel])
+		tags = rng.sample(HASHTAGS, rng.randint(1, 2)) if rng.random() < 0.3 else None
+		content = format_message(rng.choice(AUTHORS), channel, message_body(rng, encoding), tags, reply_to)
+
+		data = content.encode(encoding)
+		with open(path, 'wb') as f:
+			f.write(data)
+		stamp = moment.timestamp()
+		os.utime(path, (stamp, stamp))
+
+		recent_ids[channel].append(message_id)
+		if len(recent_ids[channel]) > 50:
+			del recent_ids[channel][0]
+		encodings[encoding] = encodings.get(encoding, 0) + 1
+		total_bytes += len(data)
+
+		if progress and index and index % 10000 == 0:
+			print(f"  {index} messages written", file=sys.stderr)
+
+	if git:
+		init_git(output_dir)
+
+	return {
+		'messages': messages,
+		'channels': names,
+		'seed': seed,
+		'reply_ratio': reply_ratio,
+		'bytes': total_bytes,
+		'encodings': encodings,
+		'first': start.strftime('%Y%m%d_%H%M%S'),
+		'last': moment.strftime('%Y%m%d_%H%M%S'),
+	}
+
+def init_git(output_dir):
+	"""Commit the corpus so git-based readers (log.html.py) have history"""
+	def git(*args):
+		subprocess.run(['git', '-C', output_dir] + list(args), check=True, capture_output=True)
+
+	git('init', '-q')
+	git('config', 'user.name', 'Bench Bot')
+	git('config', 'user.email', 'bench@bot.local')
+	with open(os.path.join(output_dir, '.gitignore'), 'w') as f:
+		f.write("template/\nchat/\ncss/\njs/\nprofiles/\ncache/\n")
+	git('add', '-A')
+	git('commit', '-q', '-m', 'Synthetic corpus')
+
+def add_bare_remote(output_dir):
+	"""Give the corpus a temporary bare repository as origin so pulls stay local"""
+	def git(*args):
+		return subprocess.run(['git', '-C', output_dir] + list(args), check=True, capture_output=True, text=True).stdout.strip()
+
+	if not os.path.isdir(os.path.join(output_dir, '.git')):
+		init_git(output_dir)
+	if git('remote'):
+		print("Repository already has a remote, leaving it as is", file=sys.stderr)
+		return None
+	remote = tempfile.mkdtemp(prefix='gityap-remote-', suffix='.git')
+	git('init', '-q', '--bare', remote)
+	git('remote', 'add', 'origin', remote)
+	git('push', '-q', '-u', 'origin', 'HEAD')
+	return remote
+
+def remove_bare_remote(output_dir, remote):
+	subprocess.run(['git', '-C', output_dir, 'remote', 'remove', 'origin'], capture_output=True)
+	shutil.rmtree(remote, ignore_errors=True)
+
+def main():
+	parser = argparse.ArgumentParser(description="Generate a synthetic GitYap message repository.")
+	parser.add_argument('output_dir', help='Directory to create the repository in')
+	parser.add_argument('-m', '--messages', type=int, default=1000, help='Number of messages (default: 1000)')
+	parser.add_argument('-c', '--channels', type=int, default=4, help='Number of channels (default: 4)')
+	parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+	parser.add_argument('--reply-ratio', type=float, default=0.2, help='Fraction of messages that are replies')
+	parser.add_argument('--git', action='store_true', help='Initialize a git repository and commit the corpus')
+	args = parser.parse_args()
+
+	started = time.perf_counter()
+	info = generate_corpus(args.output_dir, args.messages, args.channels, args.seed,
+						   args.reply_ratio, git=args.git, progress=True)
+	print(f"Wrote {info['messages']} messages ({info['bytes']} bytes) in {len(info['channels'])} channels "
+		  f"to {args.output_dir} in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+	main()
+
+# end template/python3/bench/corpus.py ; marker comment, please do not remove
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# begin template/python3/bench/loadtest.py ; marker comment, please do not remove
+# to run: python3 bench/loadtest.py --start /tmp/site --setup-remote --duration 30 --ws-clients 50
+
+# Load generator for a running (or locally started) GitYap server. Drives a
+# weighted mix of:
+#   get    GET /chat/<channel>.html
+#   post   POST /post with a new message
+#   sync   POST /sync, pulling from the local bare-repo remote (--setup-remote)
+# from --concurrency asyncio workers, while --ws-clients WebSocket clients
+# subscribe to the channels and time how long each posted message takes to
+# show up as an update_required event. Everything runs on localhost.
+#
+# Reports throughput and p50/p95/p99 latency per operation and the delivery
+# lag seen by WebSocket subscribers; --output writes the same as JSON.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from common import PYTHON3_DIR, git_commit, machine_info, percentile, summarize
+from corpus import add_bare_remote, channel_names, generate_corpus, remove_bare_remote
+
+import ws_protocol
+
+OPERATIONS = ('get', 'post', 'sync')
+DEFAULT_MIX = 'get=70,post=25,sync=5'
+
+def parse_mix(text):
+	"""'get=70,post=25' -> {'get': 70.0, 'post': 25.0}"""
+	mix = {}
+	for part in text.split(','):
+		name, _, weight = part.partition('=')
+		name = name.strip()
+		if name not in OPERATIONS:
+			raise argparse.ArgumentTypeError(f"Unknown operation '{name}' (expected one of {', '.join(OPERATIONS)})")
+		mix[name] = float(weight or 1)
+	return {name: weight for name, weight in mix.items() if weight > 0}
+
+def free_port():
+	with socket.socket() as sock:
+		sock.bind(('127.0.0.1', 0))
+		return sock.getsockname()[1]
+
+async def http_request(host, port, method, path, body=b'', headers=None, timeout=30.0):
+	"""One request on a fresh connection; returns (status, body)"""
+	reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+	try:
+		lines = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", "Connection: close"]
+		for name, value in (headers or {}).items():
+			lines.append(f"{name}: {value}")
+		if body or method == 'POST':
+			lines.append(f"Content-Length: {len(body)}")
+		writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+		await writer.drain()
+		# The server closes the connection after every response
+		response = await asyncio.wait_for(reader.read(), timeout)
+	finally:
+		writer.close()
+	head, _, payload = response.partition(b'\r\n\r\n')
+	status_line = head.split(b'\r\n', 1)[0].split()
+	if len(status_line) < 2:
+		raise ConnectionError("Empty or malformed response")
+	return int(status_line[1]), payload
+
+class Stats:
+	"""Latencies and failures per operation"""
+
+	def __init__(self):
+		self.latencies = {name: [] for name in OPERATIONS}
+		self.errors = {name: 0 for name in OPERATIONS}
+		self.error_samples = {name: [] for name in OPERATIONS}
+
+	def record(self, name, elapsed, error=None):
+		if error is None:
+			self.latencies[name].append(elapsed)
+			return
+		self.errors[name] += 1
+		if len(self.error_samples[name]) < 5:
+			self.error_samples[name].append(error)
+
+class LoadTest:
+	def __init__(self, host, port, channels, mix, concurrency, duration,
+				 ws_clients, ws_port, ws_path, seed=1):
+		self.host = host
+		self.port = port
+		self.channels = channels
+		self.mix = mix
+		self.concurrency = concurrency
+		self.duration = duration
+		self.ws_clients = ws_clients
+		self.ws_port = ws_port
+		self.ws_path = ws_path
+		self.rng = random.Random(seed)
+		self.stats = Stats()
+		# (channel, message_id) -> times the POSTs were sent; ids have second
+		# resolution, so several posts can share one
+		self.sent_at = {}
+		# (channel, message_id) -> arrival times, one per subscriber
+		self.received = {}
+		self.subscribers = {channel: 0 for channel in channels}
+		self.ws_errors = []
+		self.ws_frames = 0
+		self.posted = 0
+
+	async def op_get(self):
+		channel = self.rng.choice(self.channels)
+		status, _ = await http_request(self.host, self.port, 'GET', f"/chat/{channel}.html")
+		return status
+
+	async def op_post(self):
+		channel = self.rng.choice(self.channels)
+		body = json.dumps({
+			'author': 'loadtest',
+			'channel': channel,
+			'content': f"load test message {self.posted} #perf",
+		}).encode('utf-8')
+		self.posted += 1
+		started = time.monotonic()
+		status, payload = await http_request(self.host, self.port, 'POST', '/post', body,
+											 {'Content-Type': 'application/json'})
+		if status == 200:
+			try:
+				message_id = json.loads(payload).get('timestamp')
+			except ValueError:
+				message_id = None
+			if message_id:
+				self.sent_at.setdefault((channel, message_id), []).append(started)
+		return status
+
+	async def op_sync(self):
+		channel = self.rng.choice(self.channels)
+		body = json.dumps({'channel': channel}).encode('utf-8')
+		status, _ = await http_request(self.host, self.port, 'POST', '/sync', body,
+									   {'Content-Type': 'application/json'})
+		return status
+
+	async def worker(self, deadline):
+		names = list(self.mix)
+		weights = [self.mix[name] for name in names]
+		while time.monotonic() < deadline:
+			name = self.rng.choices(names, weights)[0]
+			started = time.perf_counter()
+			try:
+				status = await getattr(self, f"op_{name}")()
+				error = None if status < 400 else f"HTTP {status}"
+			except (OSError, asyncio.TimeoutError, ConnectionError, ValueError) as e:
+				error = f"{type(e).__name__}: {e}"
+			self.stats.record(name, time.perf_counter() - started, error)
+
+	async def ws_client(self, index, ready, stop):
+		channel = self.channels[index % len(self.channels)]
+		try:
+			connection = await ws_protocol.connect(self.host, self.ws_port, self.ws_path)
+		except (OSError, asyncio.TimeoutError, ws_protocol.ConnectionClosed) as e:
+			self.ws_errors.append(f"connect: {type(e).__name__}: {e}")
+			ready.release()
+			return
+
+		acknowledged = False
+		try:
+			await connection.send(json.dumps({'type': 'subscribe', 'channels': [channel]}))
+			self.subscribers[channel] += 1
+			receiver = asyncio.ensure_future(connection.recv())
+			stopper = asyncio.ensure_future(stop.wait())
+			while True:
+				done, _ = await asyncio.wait({receiver, stopper}, return_when=asyncio.FIRST_COMPLETED)
+				if receiver not in done:
+					break
+				message = receiver.result()
+				arrived = time.monotonic()
+				self.ws_frames += 1
+				data = json.loads(message)
+				events = data.get('events', []) if data.get('type') == 'batch' else [data]
+				for event in events:
+					if event.get('type') == 'subscribed' and not acknowledged:
+						acknowledged = True
+						ready.release()
+					elif event.get('type') == 'update_required' and event.get('message_id'):
+						self.received.setdefault((event.get('channel'), event['message_id']), []).append(arrived)
+				receiver = asyncio.ensure_future(connection.recv())
+			receiver.cancel()
+		except (ws_protocol.ConnectionClosed, ValueError, OSError) as e:
+			self.ws_errors.append(f"{type(e).__name__}: {e}")
+		finally:
+			if not acknowledged:
+				ready.release()
+			await connection.close()
+
+	async def run(self):
+		stop = asyncio.Event()
+		ready = asyncio.Semaphore(0)
+		clients = [asyncio.ensure_future(self.ws_client(index, ready, stop)) for index in range(self.ws_clients)]
+		for _ in range(self.ws_clients):
+			await ready.acquire()
+
+		started = time.monotonic()
+		deadline = started + self.duration
+		await asyncio.gather(*(self.worker(deadline) for _ in range(self.concurrency)))
+		elapsed = time.monotonic() - started
+
+		# Give in-flight deliveries a moment before disconnecting
+		await asyncio.sleep(1.0)
+		stop.set()
+		await asyncio.gather(*clients, return_exceptions=True)
+		return self.report(elapsed)
+
+	def report(self, elapsed):
+		operations = {}
+		for name in OPERATIONS:
+			samples = self.stats.latencies[name]
+			if not samples and not self.stats.errors[name]:
+				continue
+			ordered = sorted(samples)
+			operations[name] = {
+				'requests': len(samples) + self.stats.errors[name],
+				'errors': self.stats.errors[name],
+				'error_samples': self.stats.error_samples[name],
+				'throughput': len(samples) / elapsed if elapsed else 0.0,
+				'p50': percentile(ordered, 0.50),
+				'p95': percentile(ordered, 0.95),
+				'p99': percentile(ordered, 0.99),
+				'summary': summarize(samples),
+			}
+
+		lags = []
+		expected = 0
+		for key, sent in self.sent_at.items():
+			subscribers = self.subscribers.get(key[0], 0)
+			expected += len(sent) * subscribers
+			# Pair the n-th arrival with the n-th send, each send once per subscriber
+			sends = sorted(sent * subscribers)
+			arrivals = sorted(self.received.get(key, ()))
+			lags.extend(arrived - sent_at for arrived, sent_at in zip(arrivals, sends))
+		ordered = sorted(lags)
+		websocket = {
+			'clients': self.ws_clients,
+			'errors': len(self.ws_errors),
+			'error_samples': self.ws_errors[:5],
+			'frames': self.ws_frames,
+			'expected_deliveries': expected,
+			'deliveries': len(lags),
+			'p50': percentile(ordered, 0.50),
+			'p95': percentile(ordered, 0.95),
+			'p99': percentile(ordered, 0.99),
+			'summary': summarize(lags),
+		}
+		return {'elapsed': elapsed, 'operations': operations, 'websocket': websocket}
+
+def start_server(directory, port):
+	"""Launch server.py --unified on directory and wait until it answers"""
+	process = subprocess.Popen(
+		[sys.executable, os.path.join(PYTHON3_DIR, 'server.py'), '-p', str(port), '-d', directory, '--unified'],
+		cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+	)
+	deadline = time.monotonic() + 30
+	while time.monotonic() < deadline:
+		if process.poll() is not None:
+			raise RuntimeError(f"Server exited with status {process.returncode}")
+		try:
+			with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+				return process
+		except OSError:
+			time.sleep(0.2)
+	process.terminate()
+	raise RuntimeError("Server did not start within 30 seconds")
+
+def discover_channels(directory):
+	message_dir = os.path.join(directory, 'message')
+	if not os.path.isdir(message_dir):
+		return []
+	return sorted(name for name in os.listdir(message_dir)
+				  if os.path.isdir(os.path.join(message_dir, name)) and not name.startswith('.'))
+
+def print_report(result):
+	print(f"{'operation':10s} {'requests':>9s} {'errors':>7s} {'req/s':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+	for name, data in result['operations'].items():
+		print(f"{name:10s} {data['requests']:9d} {data['errors']:7d} {data['throughput']:9.1f} "
+			  f"{data['p50'] * 1000:9.2f} {data['p95'] * 1000:9.2f} {data['p99'] * 1000:9.2f}")
+		for sample in data['error_samples']:
+			print(f"  error: {sample}")
+	websocket = result['websocket']
+	if websocket['clients']:
+		print(f"websocket  {websocket['clients']} clients, {websocket['deliveries']}/{websocket['expected_deliveries']} "
+			  f"deliveries, lag p50 {websocket['p50'] * 1000:.2f} ms  p95 {websocket['p95'] * 1000:.2f} ms  "
+			  f"p99 {websocket['p99'] * 1000:.2f} ms")
+		for sample in websocket['error_samples']:
+			print(f"  error: {sample}")
+
+def main():
+	parser = argparse.ArgumentParser(description="Load-test a local GitYap server over HTTP and WebSocket.")
+	parser.add_argument('--host', default='127.0.0.1', help='Server host (default: 127.0.0.1)')
+	parser.add_argument('-p', '--port', type=int, default=8000, help='Server port (default: 8000)')
+	parser.add_argument('--start', metavar='DIRECTORY', help='Start server.py --unified on DIRECTORY (generating a corpus if it has no message/)')
+	parser.add_argument('-m', '--messages', type=int, default=1000, help='Messages to generate with --start (default: 1000)')
+	parser.add_argument('--setup-remote', action='store_true', help='Add a temporary bare repository as origin so /sync pulls locally')
+	parser.add_argument('--channels', nargs='+', help='Channels to use (default: those under message/, or general)')
+	parser.add_argument('-d', '--duration', type=float, default=10.0, help='Seconds of load (default: 10)')
+	parser.add_argument('-c', '--concurrency', type=int, default=8, help='Concurrent HTTP workers (default: 8)')
+	parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f'Operation weights (default: {DEFAULT_MIX})')
+	parser.add_argument('-w', '--ws-clients', type=int, default=10, help='WebSocket subscribers (default: 10)')
+	parser.add_argument('--ws-port', type=int, help='WebSocket port (default: the HTTP port; use port+1 for the classic two-port server)')
+	parser.add_argument('--ws-path', default='/ws', help='WebSocket path (default: /ws)')
+	parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+	parser.add_argument('-o', '--output', help='Write results as JSON to this file')
+	args = parser.parse_args()
+
+	directory = os.path.abspath(args.start) if args.start else None
+	process = None
+	remote = None
+	if directory:
+		if not os.path.isdir(os.path.join(directory, 'message')):
+			print(f"Generating {args.messages} messages in {directory}...", file=sys.stderr)
+			generate_corpus(directory, args.messages, 4, args.seed, git=True)
+		args.port = free_port()
+
+	try:
+		if args.setup_remote:
+			if not directory:
+				parser.error("--setup-remote needs --start DIRECTORY")
+			remote = add_bare_remote(directory)
+		if directory:
+			process = start_server(directory, args.port)
+
+		channels = args.channels or (discover_channels(directory) if directory else []) or channel_names(1)
+		test = LoadTest(args.host, args.port, channels, args.mix, args.concurrency, args.duration,
+						args.ws_clients, args.ws_port or args.port, args.ws_path, args.seed)
+		print(f"Running {args.duration:g}s of {args.mix} against {args.host}:{args.port} "
+			  f"with {args.concurrency} workers and {args.ws_clients} WebSocket clients...", file=sys.stderr)
+		result = asyncio.run(test.run())
+	finally:
+		if process:
+			process.terminate()
+			process.wait()
+		if remote:
+			remove_bare_remote(directory, remote)
+
+	print_report(result)
+
+	if args.output:
+		report = {
+			'created': datetime.now().isoformat(timespec='seconds'),
+			'commit': git_commit(),
+			'machine': machine_info(),
+			'parameters': {
+				'duration': args.duration, 'concurrency': args.concurrency, 'mix': args.mix,
+				'channels': channels, 'ws_clients': args.ws_clients,
+			},
+			'results': result,
+		}
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump(report, f, indent=2)
+		print(f"Results written to {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+	main()
+
+# end template/python3/bench/loadtest.py ; marker comment, please do not remove
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# begin template/python3/bench/router_bench.py ; marker comment, please do not remove
+# to run: python3 bench/router_bench.py [-n 100000] [--json]
+
+# Measures the fixed per-request cost of the serving stack with a no-op route:
+# - router: Router.dispatch alone, with and without middleware hooks
+# - handler: a full CustomHTTPRequestHandler cycle (parse, setup, dispatch,
+#   respond) over an in-memory socket, so nothing but our own overhead is timed
+
+import argparse
+import json
+import os
+import time
+
+from common import FakeSocket, FakeServer
+from handlers.router import Router
+from http_handler import CustomHTTPRequestHandler, build_router
+
+NOOP_PATH = '/__bench/noop'
+
+class FakeRequest:
+	"""Just enough of a request for Router.dispatch"""
+	def __init__(self, path):
+		self.path = path
+
+def noop(request):
+	pass
+
+def noop_respond(request):
+	request.send_response(204)
+	request.end_headers()
+
+def time_loop(func, iterations):
+	started = time.perf_counter()
+	for _ in range(iterations):
+		func()
+	return (time.perf_counter() - started) / iterations
+
+def bench_router(iterations, with_middleware=False):
+	router = Router()
+	router.add('GET', NOOP_PATH, noop)
+	if with_middleware:
+		router.before(lambda request, route: False)
+		router.after(lambda request, route, elapsed: None)
+	request = FakeRequest(NOOP_PATH)
+	return time_loop(lambda: router.dispatch(request, 'GET'), iterations)
+
+def bench_handler(iterations, directory):
+	CustomHTTPRequestHandler.base_directory = directory
+	router = build_router(directory)
+	router.add('GET', NOOP_PATH, noop_respond)
+	CustomHTTPRequestHandler.router = router
+	CustomHTTPRequestHandler.log_message = lambda *args: None
+
+	raw = f"GET {NOOP_PATH} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode('ascii')
+	server = FakeServer()
+
+	def one_request():
+		CustomHTTPRequestHandler(FakeSocket(raw), ('127.0.0.1', 0), server)
+
+	return time_loop(one_request, iterations)
+
+def main():
+	parser = argparse.ArgumentParser(description="Measure per-request overhead with a no-op route.")
+	parser.add_argument('-n', '--iterations', type=int, default=100000, help='Requests per measurement')
+	parser.add_argument('-d', '--directory', type=str, default=os.getcwd(), help='Directory the handler serves')
+	parser.add_argument('--json', action='store_true', help='Print results as JSON')
+	args = parser.parse_args()
+
+	results = {
+		'router_dispatch_us': bench_router(args.iterations) * 1e6,
+		'router_dispatch_middleware_us': bench_router(args.iterations, with_middleware=True) * 1e6,
+		'handler_request_us': bench_handler(max(1, args.iterations // 10), args.directory) * 1e6,
+	}
+
+	if args.json:
+		print(json.dumps(results, indent=2))
+	else:
+		for name, value in results.items():
+			print(f"{name:32s} {value:10.2f}")
+
+if __name__ == "__main__":
+	main()
+
+# end template/python3/bench/router_bench.py ; marker comment, please do not remove
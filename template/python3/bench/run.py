@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# begin template/python3/bench/run.py ; marker comment, please do not remove
+# to run: python3 bench/run.py --messages 10000 --channels 8 --output results.json
+
+# Benchmark suite for the message pipeline. Generates (or reuses) a synthetic
+# corpus and times:
+#   get_channel_files      one channel and "everything"
+#   process_file           per-file parse cost over a sample of files
+#   chat_render            generate_chat_html for one channel
+#   chat_render_everything generate_chat_html for "everything"
+#   log_report             log.html.py generate_html
+#   commit                 commit_text_files over a batch of new messages
+#   post                   POST /post through the HTTP handler
+#   sync                   pull_changes of one new upstream commit from a local
+#                          bare remote
+# Results are printed and optionally written as JSON, one entry per operation
+# with every raw sample and summary statistics.
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime
+
+from common import (PYTHON3_DIR, FakeServer, FakeSocket, git_commit, machine_fingerprint,
+					machine_info, raw_request, summarize, time_call)
+from corpus import add_bare_remote, format_message, generate_corpus, remove_bare_remote
+
+OPERATIONS = (
+	'get_channel_files', 'get_channel_files_everything', 'process_file',
+	'chat_render', 'chat_render_everything', 'log_report', 'commit', 'post', 'sync',
+)
+
+def load_log_module():
+	"""Import log.html.py, whose file name is not a valid module name"""
+	spec = importlib.util.spec_from_file_location('log_html', os.path.join(PYTHON3_DIR, 'log.html.py'))
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+class Suite:
+	def __init__(self, corpus_dir, channel, repeat, process_sample, commit_batch):
+		self.corpus_dir = os.path.abspath(corpus_dir)
+		self.message_dir = os.path.join(self.corpus_dir, 'message')
+		self.channel = channel
+		self.repeat = repeat
+		self.process_sample = process_sample
+		self.commit_batch = commit_batch
+		self.output_dir = tempfile.mkdtemp(prefix='gityap-bench-out-')
+
+	def close(self):
+		shutil.rmtree(self.output_dir, ignore_errors=True)
+
+	def samples(self, func, *args, **kwargs):
+		return [time_call(func, *args, **kwargs)[0] for _ in range(self.repeat)]
+
+	def bench_get_channel_files(self):
+		from chat.channel_manager import get_channel_files
+		return self.samples(get_channel_files, self.message_dir, self.channel)
+
+	def bench_get_channel_files_everything(self):
+		from chat.channel_manager import get_channel_files
+		return self.samples(get_channel_files, self.message_dir, 'everything')
+
+	def bench_process_file(self):
+		"""Average per-file cost over a random sample, one sample per repeat"""
+		from chat.channel_manager import get_channel_files
+		from chat.message_processor import process_file
+		files = get_channel_files(self.message_dir, 'everything')
+		rng = random.Random(0)
+		sample = rng.sample(files, min(self.process_sample, len(files)))
+		results = []
+		for _ in range(self.repeat):
+			started = time.perf_counter()
+			for path in sample:
+				process_file(path, self.corpus_dir, 'everything')
+			results.append((time.perf_counter() - started) / max(1, len(sample)))
+		return results
+
+	def bench_chat_render(self):
+		from chat.html_generator import generate_chat_html
+		output = os.path.join(self.output_dir, f"{self.channel}.html")
+		return self.samples(generate_chat_html, self.corpus_dir, output, channel=self.channel)
+
+	def bench_chat_render_everything(self):
+		from chat.html_generator import generate_chat_html
+		output = os.path.join(self.output_dir, 'everything.html')
+		return self.samples(generate_chat_html, self.corpus_dir, output, channel='everything')
+
+	def bench_log_report(self):
+		log_module = load_log_module()
+		output = os.path.join(self.output_dir, 'log.html')
+		return self.samples(log_module.generate_html, self.corpus_dir, output)
+
+	def bench_commit(self):
+		"""Write commit_batch new messages, then time commit_text_files"""
+		from commit_files import commit_text_files
+		channel_dir = os.path.join(self.message_dir, 'bench-commit')
+		os.makedirs(channel_dir, exist_ok=True)
+		results = []
+		for round_index in range(self.repeat):
+			for index in range(self.commit_batch):
+				path = os.path.join(channel_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{round_index}_{index}.txt")
+				with open(path, 'w', encoding='utf-8') as f:
+					f.write(format_message('bench', 'bench-commit', f"commit benchmark {round_index} {index} #perf"))
+			results.append(time_call(commit_text_files, self.corpus_dir)[0])
+		return results
+
+	def bench_post(self):
+		"""One POST /post through CustomHTTPRequestHandler per sample"""
+		from http_handler import CustomHTTPRequestHandler, build_router
+		CustomHTTPRequestHandler.base_directory = self.corpus_dir
+		CustomHTTPRequestHandler.router = build_router(self.corpus_dir)
+		CustomHTTPRequestHandler.log_message = lambda *args: None
+		server = FakeServer()
+		results = []
+		for index in range(self.repeat):
+			body = json.dumps({'author': 'bench', 'channel': 'bench-post', 'content': f"post benchmark {index} #perf"}).encode('utf-8')
+			raw = raw_request('POST', '/post', body, {'Content-Type': 'application/json'})
+			results.append(time_call(CustomHTTPRequestHandler, FakeSocket(raw), ('127.0.0.1', 0), server)[0])
+		return results
+
+	def bench_sync(self):
+		"""Push one message from a second clone, then time pulling it"""
+		from commit_files import pull_changes
+		remote = add_bare_remote(self.corpus_dir)
+		origin = subprocess.run(['git', '-C', self.corpus_dir, 'remote', 'get-url', 'origin'],
+								capture_output=True, text=True, check=True).stdout.strip()
+		peer = os.path.join(self.output_dir, 'peer')
+		def git(*args):
+			subprocess.run(['git', '-C', peer] + list(args), check=True, capture_output=True)
+
+		try:
+			subprocess.run(['git', 'clone', '-q', origin, peer], check=True, capture_output=True)
+			git('config', 'user.name', 'Bench Peer')
+			git('config', 'user.email', 'peer@bot.local')
+			channel_dir = os.path.join(self.message_dir, self.channel)
+			results = []
+			for index in range(self.repeat):
+				relative = os.path.join('message', self.channel, f"sync_{os.getpid()}_{index}.txt")
+				with open(os.path.join(peer, relative), 'w', encoding='utf-8') as f:
+					f.write(format_message('peer', self.channel, f"sync benchmark {index} #perf"))
+				git('add', relative)
+				git('commit', '-q', '-m', f"sync benchmark {index}")
+				git('push', '-q', 'origin', 'HEAD')
+				elapsed, ok = time_call(pull_changes, channel_dir)
+				if not ok:
+					raise RuntimeError("pull_changes failed")
+				results.append(elapsed)
+			return results
+		finally:
+			if remote:
+				remove_bare_remote(self.corpus_dir, remote)
+
+	def run(self, operations):
+		results = {}
+		for name in operations:
+			print(f"Running {name}...", file=sys.stderr)
+			try:
+				samples = getattr(self, f"bench_{name}")()
+				results[name] = {'samples': samples, 'summary': summarize(samples)}
+			except Exception as e:
+				results[name] = {'error': f"{type(e).__name__}: {e}", 'traceback': traceback.format_exc()}
+		return results
+
+def run_suite(corpus_dir, channel='general', repeat=5, operations=OPERATIONS,
+			  process_sample=500, commit_batch=20):
+	"""Run the selected operations with the corpus as working directory"""
+	previous = os.getcwd()
+	sys.path.insert(0, PYTHON3_DIR)
+	os.chdir(corpus_dir)
+	suite = Suite(corpus_dir, channel, repeat, process_sample, commit_batch)
+	try:
+		return suite.run(operations)
+	finally:
+		suite.close()
+		os.chdir(previous)
+
+def build_report(results, corpus, parameters):
+	"""Results plus what is needed to judge whether two runs are comparable"""
+	machine = machine_info()
+	return {
+		'created': datetime.now().isoformat(timespec='seconds'),
+		'commit': git_commit(),
+		'machine': machine,
+		'fingerprint': machine_fingerprint(machine),
+		'corpus': corpus,
+		'parameters': parameters,
+		'results': results,
+	}
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the GitYap message pipeline.")
+	parser.add_argument('--corpus', help='Existing corpus directory (default: generate one in a temp dir)')
+	parser.add_argument('-m', '--messages', type=int, default=1000, help='Messages to generate (default: 1000)')
+	parser.add_argument('-c', '--channels', type=int, default=4, help='Channels to generate (default: 4)')
+	parser.add_argument('--seed', type=int, default=1, help='Corpus random seed (default: 1)')
+	parser.add_argument('--channel', default='general', help='Channel used for single-channel operations')
+	parser.add_argument('-r', '--repeat', type=int, default=5, help='Samples per operation (default: 5)')
+	parser.add_argument('--only', nargs='+', choices=OPERATIONS, help='Run only these operations')
+	parser.add_argument('--process-sample', type=int, default=500, help='Files per process_file sample')
+	parser.add_argument('--commit-batch', type=int, default=20, help='New files per commit sample')
+	parser.add_argument('-o', '--output', help='Write results as JSON to this file')
+	parser.add_argument('--keep', action='store_true', help='Keep the generated corpus')
+	args = parser.parse_args()
+
+	corpus_dir = args.corpus
+	generated = None
+	corpus_info = None
+	if corpus_dir is None:
+		corpus_dir = tempfile.mkdtemp(prefix='gityap-bench-')
+		generated = corpus_dir
+		print(f"Generating {args.messages} messages in {corpus_dir}...", file=sys.stderr)
+		corpus_info = generate_corpus(corpus_dir, args.messages, args.channels, args.seed, git=True, progress=True)
+
+	try:
+		results = run_suite(corpus_dir, args.channel, args.repeat, args.only or OPERATIONS,
+							args.process_sample, args.commit_batch)
+	finally:
+		if generated and not args.keep:
+			shutil.rmtree(generated, ignore_errors=True)
+
+	report = build_report(results, corpus_info or {'path': os.path.abspath(corpus_dir)}, {
+		'channel': args.channel, 'repeat': args.repeat,
+		'process_sample': args.process_sample, 'commit_batch': args.commit_batch,
+	})
+
+	for name, result in results.items():
+		if 'error' in result:
+			print(f"{name:30s} ERROR {result['error']}")
+		else:
+			summary = result['summary']
+			print(f"{name:30s} median {summary['median'] * 1000:10.3f} ms   p95 {summary['p95'] * 1000:10.3f} ms")
+
+	if args.output:
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump(report, f, indent=2)
+		print(f"Results written to {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+	main()
+
+# end template/python3/bench/run.py ; marker comment, please do not remove
@@ -0,0 +1,165 @@
+# begin template/python3/broadcast.py ; marker comment, please do not remove
+
+# Slow-client isolation for WebSocket fan-out.
+# Every client gets a bounded outbound queue drained by its own writer task,
+# so broadcasting only appends to queues and never waits on a socket. When a
+# client falls behind, the overflow policy either drops its oldest pending
+# frames or disconnects it.
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from config import WS_QUEUE_SIZE, WS_OVERFLOW_POLICY, WS_SEND_TIMEOUT
+
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DISCONNECT = 'disconnect'
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DISCONNECT)
+
+class DeliveryStats:
+	"""Counters and delivery lag (enqueue to send completion) across all clients"""
+
+	def __init__(self):
+		self.enqueued = 0
+		self.delivered = 0
+		self.dropped = 0
+		self.disconnected = 0
+		self.send_errors = 0
+		self.lag_total = 0.0
+		self.lag_max = 0.0
+		self.lag_last = 0.0
+
+	def record_delivery(self, lag: float):
+		self.delivered += 1
+		self.lag_total += lag
+		self.lag_last = lag
+		if lag > self.lag_max:
+			self.lag_max = lag
+
+	def snapshot(self) -> Dict[str, Any]:
+		return {
+			'enqueued': self.enqueued,
+			'delivered': self.delivered,
+			'dropped': self.dropped,
+			'disconnected': self.disconnected,
+			'send_errors': self.send_errors,
+			'lag_avg_seconds': self.lag_total / self.delivered if self.delivered else 0.0,
+			'lag_max_seconds': self.lag_max,
+			'lag_last_seconds': self.lag_last,
+		}
+
+class ClientChannel:
+	"""Outbound queue and writer task for one WebSocket client"""
+
+	def __init__(self, websocket, stats: DeliveryStats, max_queue: int, overflow: str, send_timeout: float):
+		self.websocket = websocket
+		self.stats = stats
+		self.max_queue = max_queue
+		self.overflow = overflow
+		self.send_timeout = send_timeout
+		self.queue: Deque[Tuple[str, float]] = deque()
+		self.wakeup = asyncio.Event()
+		self.closed = False
+		self.task: Optional[asyncio.Task] = None
+
+	def start(self):
+		self.task = asyncio.ensure_future(self.writer())
+
+	def enqueue(self, message: str, enqueued_at: float):
+		"""Queue a frame without waiting; applies the overflow policy"""
+		if self.closed:
+			return
+		if len(self.queue) >= self.max_queue:
+			if self.overflow == OVERFLOW_DISCONNECT:
+				self.stats.disconnected += 1
+				self.close()
+				return
+			self.queue.popleft()
+			self.stats.dropped += 1
+		self.queue.append((message, enqueued_at))
+		self.stats.enqueued += 1
+		self.wakeup.set()
+
+	async def writer(self):
+		try:
+			while not self.closed:
+				if not self.queue:
+					self.wakeup.clear()
+					await self.wakeup.wait()
+					continue
+				message, enqueued_at = self.queue.popleft()
+				await asyncio.wait_for(self.websocket.send(message), self.send_timeout)
+				self.stats.record_delivery(time.monotonic() - enqueued_at)
+		except asyncio.CancelledError:
+			pass
+		except asyncio.TimeoutError:
+			# A send that cannot complete in time marks a stalled client
+			self.stats.disconnected += 1
+			self.close()
+		except Exception:
+			self.stats.send_errors += 1
+			self.close()
+
+	def close(self):
+		"""Stop the writer and close the socket in the background"""
+		if self.closed:
+			return
+		self.closed = True
+		self.queue.clear()
+		self.wakeup.set()
+		asyncio.ensure_future(self._close_socket())
+
+	async def _close_socket(self):
+		try:
+			await self.websocket.close()
+		except Exception:
+			pass
+
+class Broadcaster:
+	"""Fan frames out to every registered client through its own queue"""
+
+	def __init__(self, max_queue: int = WS_QUEUE_SIZE, overflow: str = WS_OVERFLOW_POLICY,
+				 send_timeout: float = WS_SEND_TIMEOUT):
+		if overflow not in OVERFLOW_POLICIES:
+			raise ValueError(f"Unknown overflow policy: {overflow}")
+		self.max_queue = max_queue
+		self.overflow = overflow
+		self.send_timeout = send_timeout
+		self.clients: Dict[Any, ClientChannel] = {}
+		self.stats = DeliveryStats()
+
+	def add(self, websocket) -> ClientChannel:
+		client = ClientChannel(websocket, self.stats, self.max_queue, self.overflow, self.send_timeout)
+		self.clients[websocket] = client
+		client.start()
+		return client
+
+	def remove(self, websocket):
+		client = self.clients.pop(websocket, None)
+		if client is not None:
+			client.closed = True
+			client.wakeup.set()
+			if client.task is not None:
+				client.task.cancel()
+
+	def broadcast(self, message: str):
+		"""Queue a frame for every client; never blocks on a slow socket"""
+		now = time.monotonic()
+		for client in list(self.clients.values()):
+			client.enqueue(message, now)
+
+	def send_to(self, websocket, message: str, enqueued_at: Optional[float] = None):
+		"""Queue a frame for a single client"""
+		client = self.clients.get(websocket)
+		if client is not None:
+			client.enqueue(message, time.monotonic() if enqueued_at is None else enqueued_at)
+
+	def snapshot(self) -> Dict[str, Any]:
+		data = self.stats.snapshot()
+		data['clients'] = len(self.clients)
+		data['queued'] = sum(len(client.queue) for client in self.clients.values())
+		data['overflow_policy'] = self.overflow
+		return data
+
+# end template/python3/broadcast.py ; marker comment, please do not remove
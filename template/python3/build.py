@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+# begin template/python3/build.py ; marker comment, please do not remove
+# to run: python3 build.py -d REPO -o OUTPUT_DIR
+
+# Static-site build: renders every channel page, "everything" and log.html
+# into OUTPUT_DIR with the same layout the server uses (chat/<channel>.html,
+# chat.html, log.html, index.html, css/, js/), so a plain static file server
+# or CDN can answer read traffic while server.py only takes posts.
+#
+# OUTPUT_DIR/.build-manifest.json records a hash of each page's inputs
+# (templates, the channel list, and name/size/mtime of the message files the
+# page reads); a rerun only renders pages whose hash changed or whose output
+# is missing. Channel pages render in parallel first, then "everything" and
+# log.html, which read every channel and find the message manifest warm.
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chat.archive import ARCHIVE_DIR, INDEX_SUFFIX
+from chat.channel_manager import get_available_channels
+from chat.html_generator import generate_chat_html
+
+BUILD_MANIFEST = '.build-manifest.json'
+CHAT_TEMPLATES = ('chat_page.html', 'chat_message.html', 'chat_message_form.html')
+LOG_TEMPLATES = ('html/page.html', 'html/page_row.html', 'css/webmail.css')
+# Files copied as they are: (source relative to template/, target relative to OUTPUT_DIR)
+ASSET_DIRS = (('css', 'css'), ('js', 'js'))
+
+def file_hash(path):
+	digest = hashlib.sha256()
+	try:
+		with open(path, 'rb') as f:
+			for block in iter(lambda: f.read(65536), b''):
+				digest.update(block)
+	except FileNotFoundError:
+		return 'missing'
+	return digest.hexdigest()
+
+def tree_signature(directory, digest):
+	"""Feed name, size and mtime of every .txt file and pack index under directory into digest"""
+	for root, dirs, files in os.walk(directory):
+		dirs.sort()
+		for name in sorted(files):
+			if name.endswith(('.txt', INDEX_SUFFIX)):
+				stat = os.stat(os.path.join(root, name))
+				digest.update(f"{os.path.relpath(os.path.join(root, name), directory)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+
+def git_head(repo_path):
+	result = subprocess.run(['git', '-C', repo_path, 'rev-parse', 'HEAD'], capture_output=True, text=True)
+	return result.stdout.strip() if result.returncode == 0 else 'none'
+
+class Page:
+	"""One output file and what it is built from"""
+
+	def __init__(self, name, output, kind, channel=None):
+		self.name = name
+		self.output = output
+		self.kind = kind
+		self.channel = channel
+
+	def input_hash(self, repo_path, channels, template_hashes):
+		digest = hashlib.sha256()
+		digest.update(f"{self.kind}\0{self.channel}\0".encode('utf-8'))
+		message_dir = os.path.join(repo_path, 'message')
+		archive_dir = os.path.join(repo_path, ARCHIVE_DIR)
+		if self.kind == 'chat':
+			digest.update(json.dumps([template_hashes[name] for name in CHAT_TEMPLATES] + sorted(channels)).encode('utf-8'))
+			if self.channel == 'everything':
+				tree_signature(message_dir, digest)
+				tree_signature(archive_dir, digest)
+			else:
+				tree_signature(os.path.join(message_dir, self.channel), digest)
+				tree_signature(os.path.join(archive_dir, self.channel), digest)
+		else:
+			# The log report also shows commit times
+			digest.update(json.dumps([template_hashes[name] for name in LOG_TEMPLATES] + [git_head(repo_path)]).encode('utf-8'))
+			tree_signature(message_dir, digest)
+		return digest.hexdigest()
+
+def load_log_module():
+	"""Import log.html.py, whose file name is not a valid module name"""
+	spec = importlib.util.spec_from_file_location('log_html', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log.html.py'))
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+def render_page(repo_path, page_name, kind, channel, output):
+	"""Render one page to a temporary file and move it into place; runs in a worker"""
+	started = time.perf_counter()
+	os.makedirs(os.path.dirname(output), exist_ok=True)
+	fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(output), prefix='.build-', suffix='.html')
+	os.close(fd)
+	try:
+		if kind == 'chat':
+			# Pages are already spread over processes; no nested Pool
+			generate_chat_html(repo_path, temp_path, channel=channel, parallel=False)
+		else:
+			load_log_module().generate_html(repo_path, temp_path)
+		os.chmod(temp_path, 0o644)
+		os.replace(temp_path, output)
+	finally:
+		if os.path.exists(temp_path):
+			os.unlink(temp_path)
+	return page_name, time.perf_counter() - started
+
+def copy_assets(repo_path, output_dir, manifest, force):
+	"""Copy css/, js/ and index.html when their content changed"""
+	template_dir = os.path.join(repo_path, 'template')
+	copies = [(os.path.join(template_dir, 'html', 'index.html'), 'index.html')]
+	for source, target in ASSET_DIRS:
+		source_dir = os.path.join(template_dir, source)
+		if os.path.isdir(source_dir):
+			copies += [(os.path.join(source_dir, name), os.path.join(target, name)) for name in sorted(os.listdir(source_dir))]
+
+	copied = 0
+	for source, target in copies:
+		if not os.path.isfile(source):
+			continue
+		key = f"asset:{target}"
+		digest = file_hash(source)
+		destination = os.path.join(output_dir, target)
+		if not force and manifest.get(key) == digest and os.path.exists(destination):
+			continue
+		os.makedirs(os.path.dirname(destination), exist_ok=True)
+		shutil.copyfile(source, destination)
+		manifest[key] = digest
+		copied += 1
+	return copied
+
+def build(repo_path, output_dir, jobs=None, force=False, include_log=True):
+	"""Render stale pages; returns (rendered, skipped, failed) page names"""
+	repo_path = os.path.abspath(repo_path)
+	output_dir = os.path.abspath(output_dir)
+	os.makedirs(output_dir, exist_ok=True)
+	manifest_path = os.path.join(output_dir, BUILD_MANIFEST)
+	try:
+		with open(manifest_path, 'r', encoding='utf-8') as f:
+			manifest = json.load(f)
+	except (FileNotFoundError, ValueError):
+		manifest = {}
+
+	template_dir = os.path.join(repo_path, 'template')
+	template_hashes = {name: file_hash(os.path.join(template_dir, 'html', name)) for name in CHAT_TEMPLATES}
+	template_hashes.update({name: file_hash(os.path.join(template_dir, name)) for name in LOG_TEMPLATES})
+
+	channels = [channel for channel in get_available_channels(repo_path) if channel != 'everything']
+	chat_pages = [Page(f"chat/{channel}.html", os.path.join(output_dir, 'chat', f"{channel}.html"), 'chat', channel)
+				  for channel in channels]
+	# /chat.html shows general
+	chat_pages.append(Page('chat.html', os.path.join(output_dir, 'chat.html'), 'chat', 'general'))
+	merged_pages = [Page('chat/everything.html', os.path.join(output_dir, 'chat', 'everything.html'), 'chat', 'everything')]
+	if include_log:
+		merged_pages.append(Page('log.html', os.path.join(output_dir, 'log.html'), 'log'))
+
+	rendered, skipped, failed = [], [], []
+	hashes = {}
+
+	def stale(pages):
+		result = []
+		for page in pages:
+			hashes[page.name] = page.input_hash(repo_path, channels, template_hashes)
+			if force or manifest.get(page.name) != hashes[page.name] or not os.path.exists(page.output):
+				result.append(page)
+			else:
+				skipped.append(page.name)
+		return result
+
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+		# Channel pages first; "everything" and the log then read warm manifests
+		for phase in (chat_pages, merged_pages):
+			futures = {
+				executor.submit(render_page, repo_path, page.name, page.kind, page.channel, page.output): page
+				for page in stale(phase)
+			}
+			for future in as_completed(futures):
+				page = futures[future]
+				try:
+					_, elapsed = future.result()
+					manifest[page.name] = hashes[page.name]
+					rendered.append(page.name)
+					print(f"  built {page.name} ({elapsed * 1000:.0f} ms)")
+				except Exception as e:
+					manifest.pop(page.name, None)
+					failed.append(page.name)
+					print(f"  failed {page.name}: {type(e).__name__}: {e}")
+
+	copied = copy_assets(repo_path, output_dir, manifest, force)
+	if copied:
+		print(f"  copied {copied} asset(s)")
+
+	with open(manifest_path, 'w', encoding='utf-8') as f:
+		json.dump(manifest, f, indent=2, sort_keys=True)
+	return rendered, skipped, failed
+
+def main():
+	parser = argparse.ArgumentParser(description="Render all GitYap pages to a static directory.")
+	parser.add_argument('-d', '--directory', type=str, default=os.getcwd(),
+					   help='Repository to build from (default: current directory)')
+	parser.add_argument('-o', '--output', type=str, default='site',
+					   help='Output directory, relative to the repository unless absolute (default: site)')
+	parser.add_argument('-j', '--jobs', type=int, default=None, help='Pages rendered in parallel (default: CPU count)')
+	parser.add_argument('-f', '--force', action='store_true', help='Render every page, ignoring the build manifest')
+	parser.add_argument('--no-log', action='store_true', help='Skip log.html')
+	args = parser.parse_args()
+
+	repo_path = os.path.abspath(args.directory)
+	output_dir = os.path.join(repo_path, args.output)
+	# Templates are looked up relative to the repository, as in the server
+	os.chdir(repo_path)
+
+	started = time.perf_counter()
+	rendered, skipped, failed = build(repo_path, output_dir, args.jobs, args.force, not args.no_log)
+	print(f"Built {len(rendered)} page(s), {len(skipped)} up to date, {len(failed)} failed "
+		  f"in {time.perf_counter() - started:.2f}s -> {output_dir}")
+	if failed:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
+
+# end build.py ; marker comment, please do not remove
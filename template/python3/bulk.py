@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+
+# begin template/python3/bulk.py ; marker comment, please do not remove
+# to run: python3 bulk.py import FILE [-d REPO] [-c CHANNEL]
+#         python3 bulk.py export CHANNEL [-d REPO] [-o FILE]
+
+# Bulk import and export of messages, for moving chat history in or out
+# without a POST and a render per message.
+#
+# import reads JSONL, mbox or CSV and writes message files straight into
+# message/<channel>/ (flat or sharded, see config.MESSAGE_LAYOUT):
+#   - ids come from the message time (YYYYmmdd_HHMMSS, _NNNN for further
+#     messages in that second) and never collide with files on disk
+#   - files get the message time as mtime, which pages show as its time
+#   - replies keep their thread when the parent is earlier in the import
+#     or anywhere in the same batch
+#   - files are written by a pool of worker processes, one batch at a time,
+#     and each batch is committed through commit_files.commit_paths with the
+#     paths the workers wrote (no status walk or manifest pass per batch)
+# JSONL and CSV records use the fields of POST /post (author, content,
+# channel, tags, reply_to) plus optional id and timestamp (ISO 8601, epoch
+# seconds or an RFC 2822 date); bulk.py export writes records that import
+# reads back. Either may be gzipped (.jsonl.gz, .csv.gz).
+#
+# export streams a channel (or everything) newest first as JSONL, one
+# message at a time, so memory use does not grow with the channel.
+
+import argparse
+import csv
+import email.utils
+import gzip
+import json
+import mailbox
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from chat.archive import archive_dir_of, load_index, month_of
+from chat.channel_manager import format_message, iter_channel_files, message_path
+from chat.manifest import parse_message
+from chat.message_processor import in_channel
+from commit_files import commit_paths, init_git_repo, push_changes
+from config import MESSAGE_LAYOUT
+
+# Messages written and committed together
+BATCH_SIZE = 10000
+# Messages per task handed to a worker
+CHUNK_SIZE = 500
+
+channel_regex = re.compile(r'^[a-zA-Z0-9_-]+$')
+message_id_regex = re.compile(r'^\d{8}_\d{6}(_[A-Za-z0-9]+)*$')
+reply_to_regex = re.compile(r'^[A-Za-z0-9_-]+$')
+
+FORMATS = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl', '.mbox': 'mbox', '.csv': 'csv'}
+
+def parse_time(value):
+	"""Local naive datetime of a record's timestamp, or None"""
+	if value in (None, ''):
+		return None
+	if isinstance(value, (int, float)):
+		return datetime.fromtimestamp(value)
+	value = str(value).strip()
+	for parse in (datetime.fromisoformat, email.utils.parsedate_to_datetime,
+				  lambda text: datetime.strptime(text, '%Y%m%d_%H%M%S')):
+		try:
+			moment = parse(value)
+		except (TypeError, ValueError):
+			continue
+		return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+	try:
+		return datetime.fromtimestamp(float(value))
+	except ValueError:
+		return None
+
+def open_source(path, newline=None):
+	"""Text file of a JSONL or CSV source, gunzipped if it ends in .gz"""
+	opener = gzip.open if path.endswith('.gz') else open
+	return opener(path, 'rt', encoding='utf-8', newline=newline)
+
+def source_format_of(path):
+	"""Format named by the file extension (under any .gz), or None"""
+	root, extension = os.path.splitext(path)
+	if extension.lower() == '.gz':
+		root, extension = os.path.splitext(root)
+	return FORMATS.get(extension.lower())
+
+def read_jsonl(path):
+	with open_source(path) as f:
+		for position, line in enumerate(f, 1):
+			if not line.strip():
+				continue
+			try:
+				data = json.loads(line)
+			except ValueError as e:
+				yield position, None, f"Invalid JSON: {e}"
+				continue
+			if not isinstance(data, dict):
+				yield position, None, "Expected a JSON object"
+				continue
+			yield position, data, None
+
+def read_csv(path):
+	with open_source(path, newline='') as f:
+		for position, row in enumerate(csv.DictReader(f), 2):
+			tags = row.get('tags') or ''
+			row['tags'] = [tag for tag in re.split(r'[\s,]+', tags) if tag]
+			yield position, row, None
+
+def _mail_body(message):
+	part = message
+	if message.is_multipart():
+		part = next((part for part in message.walk() if part.get_content_type() == 'text/plain'), None)
+		if part is None:
+			return ''
+	payload = part.get_payload(decode=True) or b''
+	return payload.decode(part.get_content_charset() or 'utf-8', errors='replace')
+
+def read_mbox(path):
+	for position, message in enumerate(mailbox.mbox(path, create=False), 1):
+		name, address = email.utils.parseaddr(message.get('From', ''))
+		subject = (message.get('Subject') or '').strip()
+		body = _mail_body(message).strip()
+		yield position, {
+			'id': (message.get('Message-ID') or '').strip() or None,
+			'author': name or address,
+			'content': f"{subject}\n\n{body}".strip() if subject else body,
+			'timestamp': message.get('Date'),
+			'reply_to': (message.get('In-Reply-To') or '').strip() or None,
+		}, None
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv, 'mbox': read_mbox}
+
+class IdAllocator:
+	"""Message ids for imported messages, unique in the import and on disk"""
+
+	def __init__(self, message_dir):
+		self.message_dir = message_dir
+		self.archive_dir = archive_dir_of(message_dir)
+		# second -> next suffix to try
+		self.counts = {}
+		self.taken = set()
+		# Directory (or pack) -> names in it, listed once instead of a stat per id
+		self.listings = {}
+
+	def _listing(self, directory):
+		names = self.listings.get(directory)
+		if names is None:
+			try:
+				names = self.listings[directory] = set(os.listdir(directory))
+			except FileNotFoundError:
+				names = self.listings[directory] = set()
+		return names
+
+	def _packed(self, channel, message_id):
+		pack_base = os.path.join(self.archive_dir, channel, month_of(message_id))
+		names = self.listings.get(pack_base)
+		if names is None:
+			names = self.listings[pack_base] = set(load_index(pack_base))
+		return message_id in names
+
+	def free(self, channel, message_id):
+		if message_id in self.taken:
+			return False
+		name = f"{message_id}.txt"
+		for layout in ('flat', 'sharded'):
+			if name in self._listing(os.path.dirname(message_path(self.message_dir, channel, message_id, layout))):
+				return False
+		return not self._packed(channel, message_id)
+
+	def claim(self, channel, message_id):
+		"""Keep a record's own id if it is still free; returns whether it was"""
+		if message_id_regex.match(message_id) and self.free(channel, message_id):
+			self.taken.add(message_id)
+			return True
+		return False
+
+	def allocate(self, channel, moment):
+		second = moment.strftime('%Y%m%d_%H%M%S')
+		count = self.counts.get(second, 0)
+		while True:
+			message_id = second if count == 0 else f"{second}_{count:04d}"
+			count += 1
+			if self.free(channel, message_id):
+				break
+		self.counts[second] = count
+		self.taken.add(message_id)
+		return message_id
+
+def write_chunk(message_dir, layout, items):
+	"""Write [(channel, message id, text, mtime)]; runs in a worker. Returns (written paths, errors)"""
+	written = []
+	errors = []
+	directories = set()
+	for channel, message_id, text, mtime in items:
+		path = message_path(message_dir, channel, message_id, layout)
+		try:
+			directory = os.path.dirname(path)
+			if directory not in directories:
+				os.makedirs(directory, exist_ok=True)
+				directories.add(directory)
+			with open(path, 'x', encoding='utf-8') as f:
+				f.write(text)
+			os.utime(path, (mtime, mtime))
+			written.append(path)
+		except OSError as e:
+			# FileExistsError only if something else wrote the id since it was allocated
+			errors.append(f"{channel}/{message_id}: {e}")
+	return written, errors
+
+def write_batch(executor, message_dir, layout, batch):
+	chunks = [batch[start:start + CHUNK_SIZE] for start in range(0, len(batch), CHUNK_SIZE)]
+	written = []
+	for chunk_written, errors in executor.map(write_chunk, [message_dir] * len(chunks), [layout] * len(chunks), chunks):
+		written.extend(chunk_written)
+		for error in errors:
+			print(f"Error writing {error}")
+	return written
+
+def import_messages(repo_path, source, source_format=None, default_channel='general', jobs=None,
+					batch_size=BATCH_SIZE, commit=True, layout=None):
+	"""Import every valid record of source; returns (imported, rejected)"""
+	repo_path = os.path.abspath(repo_path)
+	message_dir = os.path.join(repo_path, 'message')
+	layout = layout or MESSAGE_LAYOUT
+	source_format = source_format or source_format_of(source)
+	if source_format not in READERS:
+		raise ValueError(f"Unknown format for {source}; use --format jsonl, mbox or csv")
+	if source_format == 'mbox' and source.endswith('.gz'):
+		raise ValueError(f"Gunzip {source} first; mbox is read in place")
+
+	if commit and not init_git_repo(repo_path):
+		raise OSError(f"Cannot initialize a git repository in {repo_path}")
+
+	allocator = IdAllocator(message_dir)
+	# Source id -> imported id, so replies find their parent
+	imported_ids = {}
+	imported = rejected = batches = 0
+	started = time.perf_counter()
+	now = datetime.now()
+
+	def reject(position, error):
+		nonlocal rejected
+		rejected += 1
+		if rejected <= 20:
+			print(f"{source}:{position}: {error}")
+
+	def flush(batch):
+		nonlocal imported, batches
+		items = []
+		for channel, message_id, author, content, tags, reply_to, mtime in batch:
+			reply_to = imported_ids.get(reply_to, reply_to) if reply_to else None
+			if reply_to and not reply_to_regex.match(reply_to):
+				reply_to = None  # e.g. a mail Message-ID whose message is not in the import
+			items.append((channel, message_id, format_message(author, channel, content, tags, reply_to), mtime))
+		written = write_batch(executor, message_dir, layout, items)
+		imported += len(written)
+		batches += 1
+		if commit and written:
+			commit_paths(repo_path, written,
+						 f"Import {len(written)} messages from {os.path.basename(source)} (batch {batches})")
+		print(f"{imported} messages imported ({imported / (time.perf_counter() - started):.0f}/s)")
+
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+		batch = []
+		for position, record, error in READERS[source_format](source):
+			if error:
+				reject(position, error)
+				continue
+			content = record.get('content') or ''
+			author = record.get('author') or 'Guest'
+			channel = record.get('channel') or default_channel
+			tags = record.get('tags') or []
+			if not isinstance(content, str) or not content:
+				reject(position, "Missing content")
+				continue
+			if not isinstance(channel, str) or not channel_regex.match(channel):
+				reject(position, f"Invalid channel name: {channel}")
+				continue
+			if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+				reject(position, "Invalid tags")
+				continue
+
+			moment = parse_time(record.get('timestamp'))
+			source_id = record.get('id')
+			if isinstance(source_id, str) and allocator.claim(channel, source_id):
+				message_id = source_id
+				moment = moment or datetime.strptime(message_id[:15], '%Y%m%d_%H%M%S')
+			else:
+				moment = moment or now
+				message_id = allocator.allocate(channel, moment)
+			if source_id:
+				imported_ids[str(source_id)] = message_id
+
+			reply_to = record.get('reply_to')
+			# Mapped at flush time, when parents later in the batch have their ids
+			# too (exports list replies before their parents)
+			batch.append((channel, message_id, str(author), content, tags,
+						  str(reply_to) if reply_to else None, moment.timestamp()))
+			if len(batch) >= batch_size:
+				flush(batch)
+				batch = []
+		if batch:
+			flush(batch)
+
+	if commit and batches:
+		# One push for the whole import instead of one per batch
+		push_changes(repo_path)
+	return imported, rejected
+
+def export_messages(repo_path, channel, out):
+	"""Write a channel newest first as JSONL to out; returns the number written"""
+	count = 0
+	for path in iter_channel_files(os.path.join(repo_path, 'message'), channel):
+		# Parsed directly, not through the manifest, so nothing accumulates
+		try:
+			entry, body = parse_message(path)
+		except OSError:
+			continue
+		if not in_channel(entry, channel):
+			continue
+		out.write(json.dumps({
+			'id': os.path.splitext(os.path.basename(path))[0],
+			'channel': entry['channel'],
+			'author': entry['author'],
+			'timestamp': datetime.fromtimestamp(entry['timestamp'], tz=timezone.utc).isoformat(),
+			'reply_to': entry['reply_to'],
+			'hashtags': entry['hashtags'],
+			'content': body,
+		}, ensure_ascii=False) + '\n')
+		count += 1
+	return count
+
+def main():
+	parser = argparse.ArgumentParser(description="Import messages into or export them from a GitYap repository.")
+	parser.add_argument('-d', '--directory', type=str, default=os.getcwd(),
+					   help='Repository (default: current directory)')
+	# -d is also accepted after the command; no default there, so it never
+	# overrides one given before it
+	repository = argparse.ArgumentParser(add_help=False)
+	repository.add_argument('-d', '--directory', type=str, default=argparse.SUPPRESS, help='Repository')
+	commands = parser.add_subparsers(dest='command', required=True)
+
+	importer = commands.add_parser('import', parents=[repository], help='Import messages from JSONL, mbox or CSV')
+	importer.add_argument('source', help='File to import')
+	importer.add_argument('-f', '--format', choices=sorted(READERS), help='Input format (default: from the file extension)')
+	importer.add_argument('-c', '--channel', default='general', help='Channel of records without one (default: general)')
+	importer.add_argument('-j', '--jobs', type=int, default=None, help='Writer processes (default: CPU count)')
+	importer.add_argument('-b', '--batch-size', type=int, default=BATCH_SIZE,
+						  help=f'Messages per batch and commit (default: {BATCH_SIZE})')
+	importer.add_argument('--no-commit', action='store_true', help='Write the files without committing them')
+
+	exporter = commands.add_parser('export', parents=[repository], help='Export a channel as JSONL, newest first')
+	exporter.add_argument('channel', help="Channel to export, or 'everything'")
+	exporter.add_argument('-o', '--output', default='-', help='Output file, gzipped if it ends in .gz (default: stdout)')
+	args = parser.parse_args()
+
+	if args.command == 'import':
+		started = time.perf_counter()
+		try:
+			imported, rejected = import_messages(args.directory, args.source, args.format, args.channel,
+												 args.jobs, args.batch_size, commit=not args.no_commit)
+		except (OSError, ValueError) as e:
+			print(f"Error importing {args.source}: {e}")
+			sys.exit(1)
+		elapsed = time.perf_counter() - started
+		print(f"Imported {imported} messages, rejected {rejected}, in {elapsed:.2f}s ({imported / elapsed:.0f}/s)")
+	else:
+		if not channel_regex.match(args.channel):
+			print(f"Invalid channel name: {args.channel}")
+			sys.exit(1)
+		if args.output == '-':
+			count = export_messages(args.directory, args.channel, sys.stdout)
+		else:
+			opener = gzip.open if args.output.endswith('.gz') else open
+			with opener(args.output, 'wt', encoding='utf-8') as out:
+				count = export_messages(args.directory, args.channel, out)
+		print(f"Exported {count} messages", file=sys.stderr)
+
+if __name__ == "__main__":
+	main()
+
+# end bulk.py ; marker comment, please do not remove
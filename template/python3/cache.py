@@ -0,0 +1,201 @@
+# begin template/python3/cache.py ; marker comment, please do not remove
+
+# Process-wide in-memory caches.
+# Each Cache is an LRU bounded by entry count and (optionally) total size in
+# bytes, with a time-to-live per entry. All operations take the cache's lock,
+# so the server's request threads and background pull threads can share one
+# instance. Caches are created through the registry by name, so every module
+# that asks for 'page' gets the same object and an invalidation in one
+# handler is seen by all of them.
+#
+# Usage:
+#   page_cache = cache.get_cache('page', ttl=30, max_entries=256)
+#   page_cache.set('chat_general', html)
+#   page_cache.get('chat_general')      # None once expired or evicted
+#   cache.invalidate_channel('general') # page and git entries of a channel
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+from config import PAGE_CACHE_TTL, PAGE_CACHE_MAX_ENTRIES, PAGE_CACHE_MAX_BYTES, GIT_CACHE_TTL, GIT_CACHE_MAX_ENTRIES
+
+def default_size(value: Any) -> int:
+	"""Approximate size of a cached value in bytes"""
+	if isinstance(value, str):
+		# Pages are mostly ASCII
+		return len(value)
+	if isinstance(value, (bytes, bytearray)):
+		return len(value)
+	return sys.getsizeof(value)
+
+class Cache:
+	"""Thread-safe LRU with a TTL, an entry budget and an optional byte budget"""
+
+	def __init__(self, name: str = 'default', ttl: float = 60, max_entries: int = 1024,
+				 max_bytes: int = 0, sizeof: Callable[[Any], int] = default_size):
+		self.name = name
+		self.ttl = ttl
+		self.max_entries = max_entries
+		# 0 means no byte budget
+		self.max_bytes = max_bytes
+		self.sizeof = sizeof
+		# key -> (value, expires at, size), least recently used first
+		self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+		self._bytes = 0
+		self._lock = threading.Lock()
+		self._hits = metrics.counter('cache_hits_total', cache=name)
+		self._misses = metrics.counter('cache_misses_total', cache=name)
+		self._expired = metrics.counter('cache_evictions_total', cache=name, reason='expired')
+		self._evicted = metrics.counter('cache_evictions_total', cache=name, reason='capacity')
+		metrics.gauge('cache_entries', lambda: len(self._entries), cache=name)
+		metrics.gauge('cache_bytes', lambda: self._bytes, cache=name)
+
+	def get(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
+		with self._lock:
+			item = self._entries.get(key)
+			if item is not None:
+				if item[1] > time.monotonic():
+					self._entries.move_to_end(key)
+					self._hits.inc()
+					return item[0]
+				self._remove(key)
+				self._expired.inc()
+			self._misses.inc()
+			return default
+
+	def set(self, key: str, value: Any, ttl: Optional[float] = None):
+		size = self.sizeof(value)
+		if self.max_bytes and size > self.max_bytes:
+			# Would evict everything else and still not fit
+			self.invalidate(key)
+			return
+		expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+		with self._lock:
+			if key in self._entries:
+				self._remove(key)
+			self._entries[key] = (value, expires, size)
+			self._bytes += size
+			if len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+				self._shrink()
+
+	def invalidate(self, key: str) -> bool:
+		"""Drop key; returns whether it was cached"""
+		with self._lock:
+			if key in self._entries:
+				self._remove(key)
+				return True
+			return False
+
+	def invalidate_prefix(self, prefix: str) -> int:
+		with self._lock:
+			keys = [key for key in self._entries if key.startswith(prefix)]
+			for key in keys:
+				self._remove(key)
+			return len(keys)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self._bytes = 0
+
+	def __len__(self):
+		return len(self._entries)
+
+	def _remove(self, key: str):
+		_, _, size = self._entries.pop(key)
+		self._bytes -= size
+
+	def _shrink(self):
+		"""Drop expired entries, then least recently used ones, until within budget"""
+		now = time.monotonic()
+		for key in [key for key, item in self._entries.items() if item[1] <= now]:
+			self._remove(key)
+			self._expired.inc()
+		while len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+			key = next(iter(self._entries))
+			self._remove(key)
+			self._evicted.inc()
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			return {
+				'entries': len(self._entries),
+				'bytes': self._bytes,
+				'max_entries': self.max_entries,
+				'max_bytes': self.max_bytes,
+				'ttl': self.ttl,
+				'hits': self._hits.value,
+				'misses': self._misses.value,
+				'expired': self._expired.value,
+				'evicted': self._evicted.value,
+			}
+
+class CacheRegistry:
+	"""Named caches of the process; the first get_cache for a name creates it"""
+
+	def __init__(self):
+		self._caches: Dict[str, Cache] = {}
+		self._lock = threading.Lock()
+
+	def get_cache(self, name: str, **options) -> Cache:
+		cache = self._caches.get(name)
+		if cache is None:
+			with self._lock:
+				cache = self._caches.get(name)
+				if cache is None:
+					cache = self._caches[name] = Cache(name, **options)
+		return cache
+
+	def stats(self) -> Dict[str, Dict[str, Any]]:
+		return {name: cache.stats() for name, cache in list(self._caches.items())}
+
+	def clear(self):
+		for cache in list(self._caches.values()):
+			cache.clear()
+
+# The process-wide registry and the caches the handlers share
+registry = CacheRegistry()
+get_cache = registry.get_cache
+
+# Rendered chat pages, keyed by page_key(channel)
+page_cache = get_cache('page', ttl=PAGE_CACHE_TTL, max_entries=PAGE_CACHE_MAX_ENTRIES, max_bytes=PAGE_CACHE_MAX_BYTES)
+# Per-channel git state, keyed by channel name
+git_cache = get_cache('git', ttl=GIT_CACHE_TTL, max_entries=GIT_CACHE_MAX_ENTRIES)
+
+# Bumped by every page invalidation. A render stores its page only if the
+# generation did not change while it ran, so a render that started before a
+# new message arrived cannot put the old page back.
+_page_generation = 0
+# Invalidations come from several threads (posts, watcher, pull); an
+# increment lost between two of them would let a stale render be cached
+_page_generation_lock = threading.Lock()
+
+def page_key(channel: str) -> str:
+	return f'chat_{channel}'
+
+def page_generation() -> int:
+	return _page_generation
+
+def _next_page_generation():
+	global _page_generation
+	with _page_generation_lock:
+		_page_generation += 1
+
+def invalidate_pages():
+	"""Forget every rendered page"""
+	_next_page_generation()
+	page_cache.invalidate_prefix(page_key(''))
+
+def invalidate_channel(channel: str):
+	"""Forget everything cached for a channel whose messages changed"""
+	_next_page_generation()
+	page_cache.invalidate(page_key(channel))
+	# The merged view contains every channel
+	page_cache.invalidate(page_key('everything'))
+	git_cache.invalidate(channel)
+
+# end template/python3/cache.py ; marker comment, please do not remove
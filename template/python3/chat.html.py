@@ -2,6 +2,7 @@
 import argparse
 from chat.html_generator import generate_chat_html
 from chat.file_reader import DEBUG
+from profiling import profile_render
 
 if __name__ == "__main__":
 	parser = argparse.ArgumentParser(description="Generate chat HTML from repository messages.")
@@ -19,12 +20,13 @@ if __name__ == "__main__":
 	# Remove the output filename modification
 	output_file = args.output_file
 
-	generate_chat_html(
-		repo_path=repo_path,
-		output_file=output_file,
-		channel=args.channel,
-		max_messages=args.max_messages,
-		max_message_length=args.max_message_length,
-		title=args.title
-	)
+	with profile_render(args.channel):
+		generate_chat_html(
+			repo_path=repo_path,
+			output_file=output_file,
+			channel=args.channel,
+			max_messages=args.max_messages,
+			max_message_length=args.max_message_length,
+			title=args.title
+		)
 # end chat.html.py
\ No newline at end of file
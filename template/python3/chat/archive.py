@@ -0,0 +1,147 @@
+# begin template/python3/chat/archive.py ; marker comment, please do not remove
+# Packed (archived) messages, read side.
+#
+# archive_messages.py moves messages older than a cutoff out of message/ into
+# one pack per channel and month:
+#   archive/<channel>/YYYY-MM.jsonl.gz   one gzip member per message, each a
+#                                        JSON line {id, path, mtime, size,
+#                                        encoding, content_hash, content}
+#   archive/<channel>/YYYY-MM.idx.json   {message id: [offset, length, mtime, size]}
+# so reading one message is a seek plus a single-member decompress. Packs are
+# append-only: a later run adds members and rewrites the index.
+#
+# Readers address a packed message by a virtual path,
+#   <repo>/archive/<channel>/YYYY-MM/<id>.txt
+# whose basename (the message id) is that of the file it replaced. The
+# manifest and channel_manager accept these paths wherever they take a
+# message path, so the renderer, the API, search and threads read packed
+# and loose messages alike.
+import gzip
+import json
+import os
+import re
+import threading
+from collections import namedtuple
+
+ARCHIVE_DIR = 'archive'
+PACK_SUFFIX = '.jsonl.gz'
+INDEX_SUFFIX = '.idx.json'
+INDEX_VERSION = 1
+
+_month_regex = re.compile(r'^\d{4}-\d{2}$')
+
+# Enough of os.stat_result for the manifest's validity check
+PackedStat = namedtuple('PackedStat', 'st_mtime st_size')
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def archive_dir_of(message_dir):
+    """<repo>/archive for <repo>/message"""
+    return os.path.join(os.path.dirname(os.path.abspath(message_dir)), ARCHIVE_DIR)
+
+def month_of(message_id):
+    """YYYY-MM pack name of a message id"""
+    return f"{message_id[:4]}-{message_id[4:6]}"
+
+def packed_location(path):
+    """(pack base path without suffix, message id) of a virtual path, or None"""
+    parts = os.path.normpath(path).split(os.sep)
+    if len(parts) < 4 or parts[-4] != ARCHIVE_DIR or not _month_regex.match(parts[-2]) \
+            or not parts[-1].endswith('.txt'):
+        return None
+    return os.path.dirname(path), parts[-1][:-len('.txt')]
+
+def is_packed(path):
+    return packed_location(path) is not None
+
+def load_index(pack_base):
+    """{message id: [offset, length, mtime, size]} of a pack; cached until the index changes"""
+    index_path = pack_base + INDEX_SUFFIX
+    try:
+        mtime = os.stat(index_path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = _indexes.get(index_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable pack index {index_path}: {e}")
+        return {}
+    messages = data.get('messages', {}) if data.get('version') == INDEX_VERSION else {}
+    with _indexes_lock:
+        _indexes[index_path] = (mtime, messages)
+    return messages
+
+def _index_entry(path):
+    location = packed_location(path)
+    if location is None:
+        return None
+    pack_base, message_id = location
+    return load_index(pack_base).get(message_id)
+
+def stat_message(path):
+    """os.stat of a message file, or the recorded mtime and size of a packed one"""
+    if not is_packed(path):
+        return os.stat(path)
+    entry = _index_entry(path)
+    if entry is None:
+        raise FileNotFoundError(f"Not in pack: {path}")
+    return PackedStat(entry[2], entry[3])
+
+def read_record(path):
+    """The stored record of a packed message"""
+    entry = _index_entry(path)
+    if entry is None:
+        raise FileNotFoundError(f"Not in pack: {path}")
+    offset, length = entry[0], entry[1]
+    with open(os.path.dirname(path) + PACK_SUFFIX, 'rb') as f:
+        f.seek(offset)
+        return json.loads(gzip.decompress(f.read(length)))
+
+def packed_path(archive_dir, channel, message_id):
+    """Virtual path of a packed message, or None if no pack holds it"""
+    pack_base = os.path.join(archive_dir, channel, month_of(message_id))
+    if message_id not in load_index(pack_base):
+        return None
+    return os.path.join(pack_base, f"{message_id}.txt")
+
+def pack_names(archive_dir, channel):
+    """YYYY-MM of every pack of a channel, newest first"""
+    try:
+        names = [name[:-len(INDEX_SUFFIX)] for name in os.listdir(os.path.join(archive_dir, channel))
+                 if name.endswith(INDEX_SUFFIX)]
+    except FileNotFoundError:
+        return []
+    return sorted((name for name in names if _month_regex.match(name)), reverse=True)
+
+def iter_packed_files(archive_dir, channel):
+    """Virtual paths of a channel's packed messages, newest first; indexes load as reached"""
+    for name in pack_names(archive_dir, channel):
+        pack_base = os.path.join(archive_dir, channel, name)
+        for message_id in sorted(load_index(pack_base), reverse=True):
+            yield os.path.join(pack_base, f"{message_id}.txt")
+
+def archived_channels(archive_dir):
+    try:
+        with os.scandir(archive_dir) as entries:
+            return sorted(entry.name for entry in entries if entry.is_dir() and not entry.name.startswith('.'))
+    except FileNotFoundError:
+        return []
+
+def pack_summary(archive_dir, channel):
+    """(count, latest id, latest mtime) of a channel's packed messages"""
+    count = 0
+    latest_id = None
+    latest_time = None
+    for name in pack_names(archive_dir, channel):
+        index = load_index(os.path.join(archive_dir, channel, name))
+        count += len(index)
+        if index and latest_id is None:
+            latest_id = max(index)
+            latest_time = index[latest_id][2]
+    return count, latest_id, latest_time
+# end template/python3/chat/archive.py ; marker comment, please do not remove
@@ -1,39 +1,177 @@
 # begin template/python3/chat/channel_manager.py
+import heapq
 import os
+import threading
+from datetime import datetime
+
+from .archive import archive_dir_of, archived_channels, iter_packed_files, packed_path
 
 def get_available_channels(repo_path):
     """Get list of available channels from message directory structure"""
-    message_dir = os.path.join(repo_path, "message")
-    if not os.path.exists(message_dir):
-        os.makedirs(message_dir)
-        os.makedirs(os.path.join(message_dir, "general"))
-        return ["everything", "general"]
-
-    #channels = ["everything"]  # Always include "everything" channel
-    channels = []
-    for item in os.listdir(message_dir):
-        if os.path.isdir(os.path.join(message_dir, item)):
-            channels.append(item)
-    return channels if len(channels) > 1 else ["everything", "general"]
+    # Kept up to date from directory mtimes instead of listing message/ each time
+    from .channel_registry import registry_for
+    return registry_for(repo_path).names()
 
-def get_channel_files(message_dir, channel):
-    if channel == 'everything':
-        file_paths = []
-        for root, _, files in os.walk(message_dir):
-            for file in files:
-                if file.endswith(".txt"):
-                    file_paths.append(os.path.join(root, file))
+def shard_of(message_id):
+    """(YYYY, MM, DD) directories of a message id in the sharded layout, or None"""
+    if len(message_id) < 8 or not message_id[:8].isdigit():
+        return None
+    return message_id[:4], message_id[4:6], message_id[6:8]
+
+def message_path(message_dir, channel, message_id, layout=None):
+    """Where a new message file goes: message/<channel>/<id>.txt, or
+    message/<channel>/YYYY/MM/DD/<id>.txt when the layout is 'sharded'"""
+    if layout is None:
+        from config import MESSAGE_LAYOUT as layout
+    shard = shard_of(message_id) if layout == 'sharded' else None
+    return os.path.join(message_dir, channel, *(shard or ()), f"{message_id}.txt")
+
+_id_lock = threading.Lock()
+_last_second = ''
+_same_second = 0
+
+def new_message_id(now=None):
+    """A message id unique within this process.
+
+    YYYYmmdd_HHMMSS, with _NNNN appended for further messages in the same
+    second; the suffixed ids sort after the bare one and before the next
+    second, so name order stays recency order."""
+    global _last_second, _same_second
+    second = (now or datetime.now()).strftime('%Y%m%d_%H%M%S')
+    with _id_lock:
+        if second <= _last_second:
+            # Same second, or the clock went back: keep counting from the last one
+            second = _last_second
+            _same_second += 1
+        else:
+            _last_second, _same_second = second, 0
+        count = _same_second
+    return second if count == 0 else f"{second}_{count:04d}"
+
+def format_message(author, channel, content, tags=(), reply_to=None):
+    """Text of a message file"""
+    text = f"Author: {author}\nChannel: {channel}\n"
+    if reply_to:
+        text += f"Reply-To: {reply_to}\n"
+    # text += f"Timestamp: {timestamp}\n\n" #todo
+    text += content
+    if tags:
+        text += f"\n\nTags: {' '.join(tags)}"
+    return text
+
+def create_message_file(message_dir, channel, text, layout=None):
+    """Write a new message file; returns (message id, path).
+
+    The file is created exclusively, so a message never overwrites another
+    (e.g. one written in the same second by another process)."""
+    while True:
+        message_id = new_message_id()
+        path = message_path(message_dir, channel, message_id, layout)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with open(path, 'x', encoding='utf-8') as f:
+                f.write(text)
+            return message_id, path
+        except FileExistsError:
+            continue
+
+def _newest_first(directory):
+    """Yield .txt files under directory in descending name order, lazily.
+
+    Message files are named YYYYmmdd_HHMMSS.txt, so name order is recency
+    order; subdirectories are only listed when the walk reaches them. In the
+    sharded layout (YYYY/MM/DD directories) name order of the directories is
+    recency order too, so taking the newest n files lists only the newest
+    days. A directory holding both files and shards (half-migrated) is merged."""
+    try:
+        entries = sorted(os.scandir(directory), key=lambda entry: entry.name, reverse=True)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    # Skip .git and other hidden directories (channels may be their own repository)
+    directories = [entry.path for entry in entries if entry.is_dir() and not entry.name.startswith('.')]
+    files = [entry.path for entry in entries if entry.name.endswith(".txt") and not entry.is_dir()]
+    if not directories:
+        yield from files
+    elif not files:
+        for path in directories:
+            yield from _newest_first(path)
     else:
-        channel_dir = os.path.join(message_dir, channel)
-        if not os.path.exists(channel_dir):
-            os.makedirs(channel_dir)
-
-        file_paths = []
-        for root, _, files in os.walk(channel_dir):
-            for file in files:
-                if file.endswith(".txt"):
-                    file_paths.append(os.path.join(root, file))
-    return file_paths
+        yield from heapq.merge(iter(files), *map(_newest_first, directories), key=recency_key, reverse=True)
+
+def channel_dir_signature(channel_dir):
+    """Changes when a file is added to or removed from the newest directory of a channel.
+
+    For the flat layout that is the channel directory's mtime; for the sharded
+    layout the mtimes down the newest YYYY/MM/DD chain are added, since a new
+    file only touches its day directory."""
+    parts = []
+    directory = channel_dir
+    while True:
+        try:
+            parts.append(str(os.stat(directory).st_mtime_ns))
+            with os.scandir(directory) as entries:
+                shards = [entry.name for entry in entries if entry.is_dir() and entry.name.isdigit()]
+        except (FileNotFoundError, NotADirectoryError):
+            parts.append('-')
+            break
+        if not shards:
+            break
+        directory = os.path.join(directory, max(shards))
+    return '/'.join(parts)
+
+def recency_key(path):
+    return os.path.basename(path)
+
+def _with_packed(loose, archive_dir, channel):
+    """Merge a channel's packed messages (chat/archive.py) into its loose files"""
+    if not os.path.isdir(os.path.join(archive_dir, channel)):
+        return loose
+    return heapq.merge(loose, iter_packed_files(archive_dir, channel), key=recency_key, reverse=True)
+
+def iter_channel_files(message_dir, channel):
+    """Message files of a channel, newest first, packed messages included.
+
+    'everything' is a k-way merge of the per-channel streams, so taking the
+    first n files costs O(channels + n log channels) instead of a walk and
+    sort of the whole repository."""
+    archive_dir = archive_dir_of(message_dir)
+    if channel != 'everything':
+        # A channel without a directory has no loose files; reading never creates it
+        return _with_packed(_newest_first(os.path.join(message_dir, channel)), archive_dir, channel)
+
+    sources = []
+    loose_files = []
+    channels = set()
+    try:
+        entries = list(os.scandir(message_dir))
+    except FileNotFoundError:
+        entries = []
+    for entry in entries:
+        # Skip .git and other hidden directories, as _newest_first does
+        if entry.is_dir() and not entry.name.startswith('.'):
+            channels.add(entry.name)
+            sources.append(_with_packed(_newest_first(entry.path), archive_dir, entry.name))
+        elif entry.name.endswith(".txt"):
+            loose_files.append(entry.path)
+    # Channels whose every message is packed
+    for channel in archived_channels(archive_dir):
+        if channel not in channels:
+            sources.append(iter_packed_files(archive_dir, channel))
+    if loose_files:
+        sources.append(iter(sorted(loose_files, key=recency_key, reverse=True)))
+    return heapq.merge(*sources, key=recency_key, reverse=True)
+
+def find_message_file(message_dir, channel, message_id):
+    """Path of a message file by channel and id in either layout or a pack, or None"""
+    for layout in ('flat', 'sharded'):
+        path = message_path(message_dir, channel, message_id, layout)
+        if os.path.isfile(path):
+            return path
+    return packed_path(archive_dir_of(message_dir), channel, message_id)
+
+def get_channel_files(message_dir, channel):
+    """All message files of a channel, newest first"""
+    return list(iter_channel_files(message_dir, channel))
 # end template/python3/chat/channel_manager.py
 
 
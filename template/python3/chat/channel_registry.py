@@ -0,0 +1,216 @@
+# begin template/python3/chat/channel_registry.py ; marker comment, please do not remove
+# In-memory registry of channels: message count, latest message id and time.
+#
+# Every render needs the channel list for the nav, and listing message/ plus
+# an isdir per entry each time adds up. The registry keeps one record per
+# channel and only rescans a channel when
+#   - its directory mtime changed (a file was added, removed or renamed; in
+#     the sharded layout, the mtimes of its newest YYYY/MM/DD chain) or its
+#     archive directory changed (chat/archive.py), or
+#   - it was invalidated (post, pull, watcher event)
+# and only relists message/ and archive/ when their mtimes changed. Records are
+# saved to <repo>/cache/channels.json so chat.html.py, which starts a fresh
+# process per render, also starts warm. The nav fragment is built once per
+# (channel list, active channel) and reused until a channel changes.
+import html
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+from .archive import ARCHIVE_DIR, archived_channels, pack_summary
+from .channel_manager import channel_dir_signature
+from .manifest import _atomic_write_json
+
+REGISTRY_VERSION = 3
+REGISTRY_FILE = os.path.join('cache', 'channels.json')
+
+def _scan_channel(channel_dir):
+    """(count, latest id, latest mtime) of the .txt files under channel_dir"""
+    count = 0
+    latest_name = ''
+    latest_path = None
+    stack = [channel_dir]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        stack.append(entry.path)
+                    elif entry.name.endswith('.txt'):
+                        count += 1
+                        if entry.name > latest_name:
+                            latest_name, latest_path = entry.name, entry.path
+        except FileNotFoundError:
+            continue
+    latest_time = None
+    if latest_path is not None:
+        try:
+            latest_time = os.stat(latest_path).st_mtime
+        except OSError:
+            pass
+    return count, os.path.splitext(latest_name)[0] or None, latest_time
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+class ChannelRegistry:
+    """Channel records of one repository"""
+
+    def __init__(self, repo_path):
+        self.repo_path = os.path.abspath(repo_path)
+        self.message_dir = os.path.join(self.repo_path, 'message')
+        self.archive_dir = os.path.join(self.repo_path, ARCHIVE_DIR)
+        self.path = os.path.join(self.repo_path, REGISTRY_FILE)
+        self._lock = threading.RLock()
+        self._listing_mtime = None
+        # name -> {'count', 'latest_id', 'latest_time', 'signature'}
+        self._channels = {}
+        self._stale = set()
+        self._nav = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == REGISTRY_VERSION:
+                self._listing_mtime = data.get('listing_mtime')
+                self._channels = data.get('channels', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable channel registry {self.path}: {e}")
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                _atomic_write_json(self.path, {
+                    'version': REGISTRY_VERSION,
+                    'listing_mtime': self._listing_mtime,
+                    'channels': self._channels,
+                })
+                self._dirty = False
+            except OSError as e:
+                print(f"Error writing channel registry {self.path}: {e}")
+
+    def invalidate(self, channel=None):
+        """Rescan channel (or every channel) on next use"""
+        with self._lock:
+            if channel is None:
+                self._listing_mtime = None
+                self._stale.update(self._channels)
+            else:
+                self._stale.add(channel)
+
+    def _refresh(self):
+        """Bring the records up to date; returns whether anything changed"""
+        changed = False
+        listing_mtime = _mtime_ns(self.message_dir)
+        if listing_mtime is None:
+            os.makedirs(os.path.join(self.message_dir, 'general'), exist_ok=True)
+            listing_mtime = _mtime_ns(self.message_dir)
+        # A channel may live only in archive/: archiving can empty its message
+        # directory, and git does not keep empty directories
+        listing_mtime = f"{listing_mtime}|{_mtime_ns(self.archive_dir)}"
+        if listing_mtime != self._listing_mtime:
+            names = {entry.name for entry in os.scandir(self.message_dir) if entry.is_dir()}
+            names.update(archived_channels(self.archive_dir))
+            for name in set(self._channels) - names:
+                del self._channels[name]
+                changed = True
+            for name in names - set(self._channels):
+                self._channels[name] = {'count': 0, 'latest_id': None, 'latest_time': None, 'signature': None}
+                changed = True
+            self._listing_mtime = listing_mtime
+            self._dirty = True
+
+        for name, record in self._channels.items():
+            # Packs are written by archive_messages.py, which replaces the index
+            signature = (f"{channel_dir_signature(os.path.join(self.message_dir, name))}"
+                         f"|{_mtime_ns(os.path.join(self.archive_dir, name))}")
+            if signature == record['signature'] and name not in self._stale:
+                continue
+            count, latest_id, latest_time = _scan_channel(os.path.join(self.message_dir, name))
+            packed_count, packed_id, packed_time = pack_summary(self.archive_dir, name)
+            if packed_count:
+                count += packed_count
+                if latest_id is None or packed_id > latest_id:
+                    latest_id, latest_time = packed_id, packed_time
+            if (count, latest_id, latest_time) != (record['count'], record['latest_id'], record['latest_time']):
+                changed = True
+            record.update(count=count, latest_id=latest_id, latest_time=latest_time, signature=signature)
+            self._dirty = True
+        self._stale.clear()
+        if changed:
+            self._nav.clear()
+        return changed
+
+    def channels(self):
+        """{name: record} for every channel, up to date"""
+        with self._lock:
+            self._refresh()
+            self.save()
+            return {name: dict(record) for name, record in self._channels.items()}
+
+    def names(self):
+        """Channel names in nav order; same contract as get_available_channels"""
+        with self._lock:
+            self._refresh()
+            self.save()
+            return self._names()
+
+    def _names(self):
+        names = sorted(self._channels)
+        return names if len(names) > 1 else ['everything', 'general']
+
+    def nav_html(self, active):
+        """The channel nav with active highlighted, rebuilt only when a channel changed"""
+        with self._lock:
+            self._refresh()
+            self.save()
+            nav = self._nav.get(active)
+            if nav is not None:
+                return nav
+            parts = ['<div class="channel-nav">']
+            for name in self._names():
+                record = self._channels.get(name)
+                active_class = 'active' if name == active else ''
+                count = f' data-count="{record["count"]}" title="{record["count"]} messages"' if record else ''
+                parts.append(f'<a href="/chat/{html.escape(name)}.html" class="channel-link {active_class}"{count}>{html.escape(name)}</a>')
+            parts.append('</div>')
+            nav = self._nav[active] = ''.join(parts)
+            return nav
+
+    def as_json(self):
+        """JSON-friendly channel list for /api/channels"""
+        channels = self.channels()
+        return [
+            {
+                'name': name,
+                'count': record['count'],
+                'latest_id': record['latest_id'],
+                'latest_time': datetime.fromtimestamp(record['latest_time'], tz=timezone.utc).isoformat()
+                               if record['latest_time'] is not None else None,
+            }
+            for name, record in sorted(channels.items())
+        ]
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def registry_for(repo_path):
+    """The process-wide ChannelRegistry of a repository"""
+    key = os.path.abspath(repo_path)
+    registry = _registries.get(key)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.setdefault(key, ChannelRegistry(key))
+    return registry
+# end template/python3/chat/channel_registry.py ; marker comment, please do not remove
@@ -0,0 +1,65 @@
+# begin template/python3/chat/delta.py ; marker comment, please do not remove
+# Messages newer than a client's cursor, for /api/chat/<channel>/since/<cursor>.
+#
+# The cursor is the message id (file name without .txt) of the newest message
+# the client has. Ids are YYYYmmdd_HHMMSS timestamps and files are walked
+# newest first, so the walk stops at the first id that is not newer than the
+# cursor; an idle channel costs one directory listing. Messages that arrive
+# with an older id than the cursor (e.g. pulled from a peer that posted
+# earlier) are not reported; clients learn about those from update_required
+# events and reload the page.
+import hashlib
+import os
+
+from .channel_manager import channel_dir_signature, iter_channel_files
+from .manifest import manifest_for, read_body
+from .message_processor import in_channel, to_message
+
+def channel_signature(repo_path, channel):
+    """Changes whenever a message file is added to or removed from the channel"""
+    message_dir = os.path.join(repo_path, 'message')
+    if channel == 'everything':
+        directories = [message_dir]
+        try:
+            with os.scandir(message_dir) as entries:
+                directories += sorted(entry.path for entry in entries if entry.is_dir())
+        except FileNotFoundError:
+            pass
+    else:
+        directories = [os.path.join(message_dir, channel)]
+    return ','.join(f"{os.path.basename(directory)}:{channel_dir_signature(directory)}" for directory in directories)
+
+def delta_etag(repo_path, channel, cursor, limit, template_mtime=0):
+    """Strong ETag of the response to a since request, without reading any message"""
+    key = f"{channel}\0{cursor}\0{limit}\0{template_mtime}\0{channel_signature(repo_path, channel)}"
+    return '"' + hashlib.sha1(key.encode('utf-8')).hexdigest() + '"'
+
+def messages_since(repo_path, channel, cursor, limit=50):
+    """(messages newest first, more) for messages with an id greater than cursor.
+
+    more is True when there were over limit new messages; the client should
+    then reload the whole page."""
+    message_dir = os.path.join(repo_path, 'message')
+    manifest = manifest_for(repo_path)
+    messages = []
+    more = False
+    try:
+        for path in iter_channel_files(message_dir, channel):
+            message_id = os.path.splitext(os.path.basename(path))[0]
+            if cursor and message_id <= cursor:
+                break
+            if len(messages) == limit:
+                more = True
+                break
+            try:
+                entry = manifest.get(path)
+                if not in_channel(entry, channel):
+                    continue
+                body = read_body(path, entry)
+            except OSError:
+                continue  # Deleted while we looked
+            messages.append(to_message(path, entry, body))
+    finally:
+        manifest.save()
+    return messages, more
+# end template/python3/chat/delta.py ; marker comment, please do not remove
@@ -2,72 +2,179 @@
 import os
 from datetime import datetime, timezone
 from multiprocessing import Pool
-from functools import partial
-from .file_reader import read_file, truncate_message
-from .channel_manager import get_available_channels, get_channel_files
-from .message_processor import process_file
-
-def generate_chat_html(repo_path, output_file, channel='general', max_messages=50, max_message_length=300, title="GitYap Chat"):
-    HTML_TEMPLATE = read_file('./template/html/chat_page.html')
-    MESSAGE_TEMPLATE = read_file('./template/html/chat_message.html')
-    MESSAGE_FORM_TEMPLATE = read_file('./template/html/chat_message_form.html')
-
-    channels = get_available_channels(repo_path)
-    
-    channel_nav = '<div class="channel-nav">'
-    for ch in channels:
-        active_class = 'active' if ch == channel else ''
-        channel_nav += f'<a href="/chat/{ch}.html" class="channel-link {active_class}">{ch}</a>'
-    channel_nav += '</div>'
+from itertools import islice
+from .file_reader import truncate_message
+from .channel_manager import iter_channel_files
+from .channel_registry import registry_for
+from .thread_index import thread_index_for
+from .manifest import manifest_for, read_body
+from .message_processor import in_channel, parse_file, to_message
+import profiling
+import templates
+from config import RENDER_LAZY_FULL_MESSAGES
 
+# Below this many cache misses, parsing in-process beats starting a Pool
+PARALLEL_PARSE_THRESHOLD = 16
+
+def render_message(message_template, out, msg, key, max_message_length=300, lazy_full_message=False):
+    """Append one rendered message to out; key makes its element ids unique on the page.
+
+    With lazy_full_message, a truncated message ships only its preview and
+    chat.js fetches the rest from /api/message/<channel>/<id> on expand."""
+    truncated_content, is_truncated = truncate_message(msg['content'], max_message_length)
+    expand_link = (
+        f'<a href="#" class="expand-link" data-key="{key}" data-message-id="{msg["message_id"]}" '
+        f'data-channel="{msg["channel"]}">{"Show More" if is_truncated else ""}</a>'
+    )
+    if is_truncated and not lazy_full_message:
+        full_content = f'<div class="full-message" id="full-message-{key}" style="display: none;">{msg["content"]}</div>'
+    else:
+        full_content = ''
+
+    reply_class = 'reply' if msg.get('reply_to') else ''
+    reply_to = f'<div class="reply-to">Replying to: <a href="/thread/{msg["reply_to"]}">{msg["reply_to"]}</a></div>' if msg.get('reply_to') else ''
+
+    message_template.render_into(
+        out,
+        author=msg['author'],
+        content=truncated_content,
+        full_content=full_content,
+        expand_link=expand_link,
+        timestamp=msg['timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
+        hashtags=' '.join(msg['hashtags']),
+        message_id=msg['message_id'],
+        reply_class=reply_class,
+        reply_to=reply_to
+    )
+
+def generate_chat_html(repo_path, output_file, channel='general', max_messages=50, max_message_length=300, title="GitYap Chat", parallel=True,
+                       lazy_full_messages=RENDER_LAZY_FULL_MESSAGES):
+    # Parsed once per process and re-read only when the files change
+    template_dir = os.path.join(repo_path, 'template', 'html')
+    page_template = templates.get(os.path.join(template_dir, 'chat_page.html'))
+    message_template = templates.get(os.path.join(template_dir, 'chat_message.html'))
+    message_form_template = templates.get(os.path.join(template_dir, 'chat_message_form.html'))
+
+    channel_nav = registry_for(repo_path).nav_html(channel)
+
+    # Files arrive newest first (merged across channels for "everything");
+    # only as many are looked at as it takes to fill the page, and only
+    # files missing from the manifest are parsed
     message_dir = os.path.join(repo_path, "message")
-    file_paths = get_channel_files(message_dir, channel)
+    recent_files = iter_channel_files(message_dir, channel)
+    manifest = manifest_for(repo_path)
 
-    with Pool() as pool:
-        process_func = partial(process_file, repo_path=repo_path, target_channel=channel)
-        messages = pool.map(process_func, file_paths)
+    messages = []
+    pool_options = profiling.pool_options()
+    pool = None
+    try:
+        while len(messages) < max_messages:
+            batch = list(islice(recent_files, max_messages - len(messages)))
+            if not batch:
+                break
+            entries = [manifest.lookup(path) for path in batch]
+            misses = [path for path, entry in zip(batch, entries) if entry is None]
+            parsed = {}
+            if parallel and len(misses) >= PARALLEL_PARSE_THRESHOLD:
+                if pool is None:
+                    pool = Pool(**pool_options)
+                results = pool.map(parse_file, misses)
+            else:
+                results = [parse_file(path) for path in misses]
+            for path, result in zip(misses, results):
+                if result is not None:
+                    manifest.store(path, result[0])
+                    parsed[path] = result
 
-    messages = [msg for msg in messages if msg is not None]
-    messages.sort(key=lambda x: (-x['timestamp'].timestamp(), x['file_path']))
-    messages = messages[:max_messages]
+            for path, entry in zip(batch, entries):
+                if entry is None:
+                    if path not in parsed:
+                        continue
+                    entry, body = parsed[path]
+                    if not in_channel(entry, channel):
+                        continue
+                elif in_channel(entry, channel):
+                    body = read_body(path, entry)
+                else:
+                    continue
+                messages.append(to_message(path, entry, body))
+    finally:
+        if pool is not None:
+            if pool_options:
+                # Let profiled workers exit normally so their profiles are written
+                pool.close()
+                pool.join()
+            pool.terminate()
+        manifest.save()
 
     chat_messages = []
     for idx, msg in enumerate(messages):
-        truncated_content, is_truncated = truncate_message(msg['content'], max_message_length)
-        expand_link = f'<a href="#" class="expand-link" data-message-id="{idx}">{"Show More" if is_truncated else ""}</a>'
-        full_content = f'<div class="full-message" id="full-message-{idx}" style="display: none;">{msg["content"]}</div>' if is_truncated else ''
-
-        reply_class = 'reply' if msg.get('reply_to') else ''
-        reply_to = f'<div class="reply-to">Replying to: {msg["reply_to"]}</div>' if msg.get('reply_to') else ''
-
-        message_html = MESSAGE_TEMPLATE.format(
-            author=msg['author'],
-            content=truncated_content,
-            full_content=full_content,
-            expand_link=expand_link,
-            timestamp=msg['timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-            hashtags=' '.join(msg['hashtags']),
-            message_id=msg['message_id'],
-            reply_class=reply_class,
-            reply_to=reply_to
-        )
-        chat_messages.append(message_html)
-
-    message_form = MESSAGE_FORM_TEMPLATE.format(
-        current_channel=channel
-    )
+        render_message(message_template, chat_messages, msg, idx, max_message_length, lazy_full_messages)
 
-    html_content = HTML_TEMPLATE.format(
-        chat_messages=''.join(chat_messages),
+    message_form = []
+    message_form_template.render_into(message_form, current_channel=channel)
+
+    html_content = page_template.render(
+        chat_messages=chat_messages,
         message_count=len(messages),
         current_time=datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
         title=f"{title} - #{channel}",
         channel_nav=channel_nav,
-        message_form=message_form
+        message_form=message_form,
+        # Newest message on the page; chat.js asks for messages after it
+        cursor=messages[0]['message_id'] if messages else ''
     )
 
     with open(output_file, 'w', encoding='utf-8') as f:
         f.write(html_content)
+
+
+def generate_thread_html(repo_path, message_id, max_message_length=300, title="GitYap Thread"):
+    """The thread containing message_id as a page, or None if it is unknown.
+
+    Costs O(thread size): the thread index gives the members and their files."""
+    members = thread_index_for(repo_path).thread(message_id)
+    if members is None:
+        return None
+    template_dir = os.path.join(repo_path, 'template', 'html')
+    page_template = templates.get(os.path.join(template_dir, 'chat_page.html'))
+    message_template = templates.get(os.path.join(template_dir, 'chat_message.html'))
+    message_form_template = templates.get(os.path.join(template_dir, 'chat_message_form.html'))
+    manifest = manifest_for(repo_path)
+
+    chat_messages = []
+    channel = 'general'
+    count = 0
+    for idx, (member_id, depth, path) in enumerate(members):
+        indent = f'<div class="thread-message" style="margin-left: {min(depth, 8) * 1.5}em">'
+        if path is None:
+            chat_messages.append(f'{indent}<div class="message deleted">Message {member_id} is no longer available</div></div>')
+            continue
+        try:
+            entry = manifest.get(path)
+            msg = to_message(path, entry, read_body(path, entry))
+        except OSError:
+            continue
+        if count == 0:
+            # The form posts into the channel of the first message shown
+            channel = msg['channel']
+        chat_messages.append(indent)
+        render_message(message_template, chat_messages, msg, idx, max_message_length, RENDER_LAZY_FULL_MESSAGES)
+        chat_messages.append('</div>')
+        count += 1
+    manifest.save()
+
+    message_form = []
+    message_form_template.render_into(message_form, current_channel=channel)
+    return page_template.render(
+        chat_messages=chat_messages,
+        message_count=count,
+        current_time=datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        title=f"{title} - {members[0][0]}",
+        channel_nav=registry_for(repo_path).nav_html(channel),
+        message_form=message_form,
+        cursor=''
+    )
 # end template/python3/chat/html_generator.py
 
 
@@ -0,0 +1,232 @@
+# begin template/python3/chat/manifest.py ; marker comment, please do not remove
+# Parsed-message metadata cache.
+#
+# Parsing a message file means reading it, guessing its encoding with chardet
+# and running a few regexes, which dominates render time. The result is kept
+# at two levels:
+#   - an in-memory LRU of the most recently used entries, per process
+#   - one JSON manifest per channel, <repo>/cache/manifest/<channel>.json,
+#     so a fresh process (every chat.html.py run) starts warm
+# A channel's manifest is loaded on an LRU miss and let go once it is saved,
+# so between scans only the LRU stays in memory.
+# An entry is valid while the file's mtime and size are unchanged. Entries
+# hold metadata only (author, channel, reply-to, hashtags, content hash,
+# timestamp, encoding); the body is re-read with the recorded encoding when
+# it is needed, which skips the encoding detection. Packed messages
+# (chat/archive.py) are parsed from their pack record and never go stale.
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .archive import is_packed, read_record, stat_message
+from .file_reader import extract_metadata
+
+MANIFEST_VERSION = 1
+MANIFEST_DIR = os.path.join('cache', 'manifest')
+LRU_SIZE = 10000
+
+channel_regex = re.compile(r'Channel:\s*(.+)')
+reply_to_regex = re.compile(r'Reply-To:\s*(.+)')
+header_regex = re.compile(r'(author|channel|reply-to):\s*.+', re.IGNORECASE)
+
+def detect_encoding(raw_data):
+    """Cheap UTF-8 check first; chardet only for files that are not UTF-8"""
+    try:
+        raw_data.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        import chardet
+        return chardet.detect(raw_data)['encoding'] or 'utf-8'
+
+def strip_headers(content):
+    return header_regex.sub('', content).strip()
+
+def parse_message(file_path, stat=None):
+    """Parse one message file (or packed message); returns (entry, body)"""
+    if is_packed(file_path):
+        record = read_record(file_path)
+        return _entry(record['content'], record['mtime'], record['size'], record['encoding'],
+                      record['content_hash'], os.path.basename(os.path.dirname(os.path.dirname(file_path))))
+    stat = stat or os.stat(file_path)
+    with open(file_path, 'rb') as f:
+        raw_data = f.read()
+    encoding = detect_encoding(raw_data)
+    content = raw_data.decode(encoding, errors='replace')
+    return _entry(content, stat.st_mtime, stat.st_size, encoding,
+                  hashlib.sha256(raw_data).hexdigest(), os.path.basename(os.path.dirname(file_path)))
+
+def _entry(content, mtime, size, encoding, content_hash, default_channel):
+    author, hashtags = extract_metadata(content)
+    channel_match = channel_regex.search(content)
+    reply_match = reply_to_regex.search(content)
+    entry = {
+        'mtime': mtime,
+        'size': size,
+        'author': author,
+        'channel': channel_match.group(1) if channel_match else default_channel,
+        'reply_to': reply_match.group(1) if reply_match else None,
+        'hashtags': hashtags,
+        'content_hash': content_hash,
+        'timestamp': mtime,
+        'encoding': encoding,
+    }
+    return entry, strip_headers(content)
+
+def read_body(file_path, entry):
+    """Message body (headers removed), decoded with the recorded encoding"""
+    if is_packed(file_path):
+        return strip_headers(read_record(file_path)['content'])
+    with open(file_path, 'rb') as f:
+        content = f.read().decode(entry['encoding'] or 'utf-8', errors='replace')
+    return strip_headers(content)
+
+def _atomic_write_json(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.manifest-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+class ChannelManifest:
+    """Entries of one channel keyed by path relative to the repository"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.entries = data.get('entries', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable manifest {path}: {e}")
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            _atomic_write_json(self.path, {'version': MANIFEST_VERSION, 'entries': self.entries})
+            self.dirty = False
+        except OSError as e:
+            print(f"Error writing manifest {self.path}: {e}")
+
+class MessageManifest:
+    """LRU of parsed entries in front of the per-channel manifests of one repository"""
+
+    def __init__(self, repo_path, lru_size=LRU_SIZE):
+        self.repo_path = os.path.abspath(repo_path)
+        self.manifest_dir = os.path.join(self.repo_path, MANIFEST_DIR)
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self._channels = {}
+        self._lock = threading.RLock()
+        # Called as listener(file_path, entry) on store and (file_path, None) on forget
+        self._listeners = []
+
+    def _relative(self, file_path):
+        return os.path.relpath(os.path.abspath(file_path), self.repo_path)
+
+    def _channel_manifest(self, relative_path):
+        # message/<channel>/... or archive/<channel>/... ; files directly under message/ share one manifest
+        parts = relative_path.split(os.sep)
+        name = parts[1] if len(parts) > 2 else '_loose'
+        manifest = self._channels.get(name)
+        if manifest is None:
+            manifest = self._channels[name] = ChannelManifest(os.path.join(self.manifest_dir, f"{name}.json"))
+        return manifest
+
+    def lookup(self, file_path, stat=None):
+        """Cached entry if it still matches the file, else None"""
+        relative_path = self._relative(file_path)
+        try:
+            stat = stat or stat_message(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._lru.get(relative_path)
+            if entry is None:
+                entry = self._channel_manifest(relative_path).entries.get(relative_path)
+            if entry is None or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+                return None
+            self._remember(relative_path, entry)
+            return entry
+
+    def store(self, file_path, entry):
+        relative_path = self._relative(file_path)
+        with self._lock:
+            manifest = self._channel_manifest(relative_path)
+            manifest.entries[relative_path] = entry
+            manifest.dirty = True
+            self._remember(relative_path, entry)
+        self._notify(file_path, entry)
+
+    def forget(self, file_path):
+        relative_path = self._relative(file_path)
+        with self._lock:
+            self._lru.pop(relative_path, None)
+            manifest = self._channel_manifest(relative_path)
+            if manifest.entries.pop(relative_path, None) is not None:
+                manifest.dirty = True
+        self._notify(file_path, None)
+
+    def add_listener(self, listener):
+        """Follow entry changes (indexes built on top of the manifest)"""
+        self._listeners.append(listener)
+
+    def _notify(self, file_path, entry):
+        # Outside the lock, so listeners may take their own locks and call back in
+        for listener in self._listeners:
+            try:
+                listener(file_path, entry)
+            except Exception as e:
+                print(f"Error updating index for {file_path}: {e}")
+
+    def _remember(self, relative_path, entry):
+        self._lru[relative_path] = entry
+        self._lru.move_to_end(relative_path)
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get(self, file_path):
+        """Entry for a file, parsing (and recording) it on a miss"""
+        stat = stat_message(file_path)
+        entry = self.lookup(file_path, stat)
+        if entry is None:
+            entry, _ = parse_message(file_path, stat)
+            self.store(file_path, entry)
+        return entry
+
+    def save(self):
+        """Write every manifest that changed since it was loaded, then let them go"""
+        with self._lock:
+            for name, manifest in list(self._channels.items()):
+                manifest.save()
+                if not manifest.dirty:
+                    # Loaded again on the next miss; kept if writing it failed
+                    del self._channels[name]
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+def manifest_for(repo_path):
+    """The process-wide MessageManifest of a repository"""
+    key = os.path.abspath(repo_path)
+    manifest = _manifests.get(key)
+    if manifest is None:
+        with _manifests_lock:
+            manifest = _manifests.setdefault(key, MessageManifest(key))
+    return manifest
+# end template/python3/chat/manifest.py ; marker comment, please do not remove
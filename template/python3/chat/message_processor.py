@@ -1,46 +1,47 @@
 # begin template/python3/chat/message_processor.py
 import os
-import re
 from datetime import datetime, timezone
-from .file_reader import read_file, extract_metadata
+from .manifest import parse_message
 
-def process_file(file_path, repo_path, target_channel='general'):
-    relative_path = os.path.relpath(file_path, repo_path)
+def parse_file(file_path):
+    """(entry, body) for a message file, or None if it cannot be read; runs in Pool workers"""
     try:
-        modification_time = datetime.fromtimestamp(os.path.getmtime(file_path), tz=timezone.utc)
-        content = read_file(file_path)
-        author, hashtags = extract_metadata(content)
+        return parse_message(file_path)
+    except Exception as e:
+        print(f"Error reading file {file_path}: {str(e)}")
+        return None
 
-        # Extract channel from content or directory structure
-        channel_match = re.search(r'Channel:\s*(.+)', content)
-        if channel_match:
-            channel = channel_match.group(1)
-        else:
-            channel = os.path.basename(os.path.dirname(file_path))
+def in_channel(entry, target_channel):
+    return target_channel == 'everything' or entry['channel'] == target_channel
 
-        # Extract reply_to if it exists
-        reply_to = None
-        reply_match = re.search(r'Reply-To:\s*(.+)', content)
-        if reply_match:
-            reply_to = reply_match.group(1)
+def message_time(file_path, entry):
+    """When a message was written: from its id (YYYYmmdd_HHMMSS, local time), else the file mtime"""
+    message_id = os.path.splitext(os.path.basename(file_path))[0]
+    try:
+        return datetime.strptime(message_id[:15], '%Y%m%d_%H%M%S').astimezone(timezone.utc)
+    except ValueError:
+        return datetime.fromtimestamp(entry['timestamp'], tz=timezone.utc)
 
-        content = re.sub(r'(author|channel|reply-to):\s*.+', '', content, flags=re.IGNORECASE).strip()
+def to_message(file_path, entry, body):
+    """The message dict the renderer works with"""
+    return {
+        'author': entry['author'],
+        'content': body,
+        'timestamp': datetime.fromtimestamp(entry['timestamp'], tz=timezone.utc),
+        'hashtags': entry['hashtags'],
+        'channel': entry['channel'],
+        'file_path': file_path,
+        'message_id': os.path.splitext(os.path.basename(file_path))[0],
+        'reply_to': entry['reply_to']
+    }
 
-        if target_channel == 'everything' or channel == target_channel:
-            return {
-                'author': author,
-                'content': content,
-                'timestamp': modification_time,
-                'hashtags': hashtags,
-                'channel': channel,
-                'file_path': file_path,
-                'message_id': os.path.splitext(os.path.basename(file_path))[0],
-                'reply_to': reply_to
-            }
+def process_file(file_path, repo_path, target_channel='general'):
+    """Parse a message file without the cache; None if it belongs to another channel"""
+    result = parse_file(file_path)
+    if result is None:
         return None
-    except Exception as e:
-        print(f"Error reading file {file_path}: {str(e)}")
+    entry, body = result
+    if not in_channel(entry, target_channel):
         return None
+    return to_message(file_path, entry, body)
 # end template/python3/chat/message_processor.py
-
-
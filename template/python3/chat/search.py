@@ -0,0 +1,54 @@
+# begin template/python3/chat/search.py ; marker comment, please do not remove
+# Message search over the manifest: scans a channel (or everything) newest
+# first, matching every query term against author, hashtags and body, and
+# stops at the first `limit` hits. Metadata comes from the manifest; bodies
+# are read with their recorded encoding.
+import os
+from itertools import islice
+
+from .channel_manager import iter_channel_files
+from .manifest import manifest_for, read_body
+from .message_processor import in_channel, message_time
+
+def search_messages(repo_path, query, channel='everything', limit=50, scan_limit=None):
+    """Newest-first matches as JSON-friendly dicts"""
+    terms = [term.lower() for term in query.split() if term]
+    manifest = manifest_for(repo_path)
+    files = iter_channel_files(os.path.join(repo_path, 'message'), channel)
+    if scan_limit:
+        files = islice(files, scan_limit)
+
+    results = []
+    try:
+        for file_path in files:
+            try:
+                entry = manifest.get(file_path)
+            except OSError:
+                continue
+            if not in_channel(entry, channel):
+                continue
+
+            metadata = ' '.join([entry['author'], entry['channel']] + entry['hashtags']).lower()
+            pending = [term for term in terms if term not in metadata]
+            body = None
+            if pending:
+                body = read_body(file_path, entry)
+                lowered = body.lower()
+                if any(term not in lowered for term in pending):
+                    continue
+
+            results.append({
+                'message_id': os.path.splitext(os.path.basename(file_path))[0],
+                'channel': entry['channel'],
+                'author': entry['author'],
+                'hashtags': entry['hashtags'],
+                'reply_to': entry['reply_to'],
+                'timestamp': message_time(file_path, entry).isoformat(),
+                'content': body if body is not None else read_body(file_path, entry),
+            })
+            if len(results) >= limit:
+                break
+    finally:
+        manifest.save()
+    return results
+# end template/python3/chat/search.py ; marker comment, please do not remove
@@ -0,0 +1,168 @@
+# begin template/python3/chat/thread_index.py ; marker comment, please do not remove
+# Reply threads: parent -> children links between messages.
+#
+# Messages name their parent with a "Reply-To: <message id>" header. The
+# index maps every message id to its parent and file, and every parent to
+# its children, so a thread is found by walking up to the root (thread
+# depth) and then down through the children (thread size), never by
+# scanning a channel.
+#
+# It is built once from the message manifest (parsing only files the
+# manifest does not know yet), packed messages included, and then follows the manifest's store/forget
+# calls, which the watcher and the post handler drive, so it stays current
+# without rescans. The server builds it in the background at startup (warm)
+# so no request pays for the initial walk; a thread request that arrives
+# before the build finishes waits for it.
+import os
+import threading
+
+from .archive import ARCHIVE_DIR, archived_channels, is_packed, iter_packed_files, packed_path, stat_message
+from .manifest import manifest_for, parse_message
+
+# Threads are cut off past this many messages
+MAX_THREAD_MESSAGES = 500
+
+def _message_id(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+class ThreadIndex:
+    def __init__(self, repo_path):
+        self.repo_path = os.path.abspath(repo_path)
+        self.message_dir = os.path.join(self.repo_path, 'message')
+        self.archive_dir = os.path.join(self.repo_path, ARCHIVE_DIR)
+        self.manifest = manifest_for(self.repo_path)
+        self._lock = threading.RLock()
+        self._parent = {}
+        self._children = {}
+        self._paths = {}
+        self._built = False
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        with self._lock:
+            if self._built:
+                return
+            # Follow changes first so nothing written during the walk is missed
+            self.manifest.add_listener(self._on_change)
+            for root, _, files in os.walk(self.message_dir):
+                for name in files:
+                    if name.endswith('.txt'):
+                        self._index(os.path.join(root, name))
+            for channel in archived_channels(self.archive_dir):
+                for path in iter_packed_files(self.archive_dir, channel):
+                    self._index(path)
+            self.manifest.save()
+            self._built = True
+
+    def warm(self):
+        """Build the index on a background thread"""
+        def build():
+            try:
+                self._ensure_built()
+            except Exception as e:
+                print(f"Error building thread index for {self.repo_path}: {e}")
+        threading.Thread(target=build, name='thread-index', daemon=True).start()
+
+    def _index(self, path):
+        try:
+            stat = stat_message(path)
+            entry = self.manifest.lookup(path, stat)
+            if entry is None:
+                entry, _ = parse_message(path, stat)
+                self.manifest.store(path, entry)
+        except OSError:
+            return
+        self._add(path, entry)
+
+    def _on_change(self, path, entry):
+        with self._lock:
+            if entry is not None:
+                self._add(path, entry)
+                return
+            self._remove(path)
+            # A file removed by archive_messages.py lives on in its pack
+            parts = os.path.relpath(os.path.abspath(path), self.message_dir).split(os.sep)
+            if len(parts) > 1 and not is_packed(path):
+                packed = packed_path(self.archive_dir, parts[0], _message_id(path))
+                if packed is not None:
+                    self._index(packed)
+
+    def _add(self, path, entry):
+        message_id = _message_id(path)
+        parent = (entry.get('reply_to') or '').strip() or None
+        previous = self._parent.get(message_id)
+        if previous is not None and previous != parent:
+            self._children.get(previous, set()).discard(message_id)
+        self._parent[message_id] = parent
+        self._paths[message_id] = path
+        if parent is not None and parent != message_id:
+            self._children.setdefault(parent, set()).add(message_id)
+
+    def _remove(self, path):
+        message_id = _message_id(path)
+        if self._paths.get(message_id) != path:
+            return
+        del self._paths[message_id]
+        parent = self._parent.pop(message_id, None)
+        if parent is not None:
+            children = self._children.get(parent)
+            if children is not None:
+                children.discard(message_id)
+                if not children:
+                    del self._children[parent]
+        # Replies to it stay linked to its id, so their thread holds together
+
+    def root_of(self, message_id):
+        """Topmost id above message_id; may be a message that no longer exists"""
+        self._ensure_built()
+        with self._lock:
+            seen = {message_id}
+            current = message_id
+            while True:
+                parent = self._parent.get(current)
+                if parent is None or parent in seen:
+                    return current
+                seen.add(parent)
+                current = parent
+
+    def thread(self, message_id):
+        """[(message id, depth, path)] of the whole thread in reading order, or None.
+
+        path is None for a root that is referenced but no longer exists."""
+        self._ensure_built()
+        with self._lock:
+            if message_id not in self._paths and message_id not in self._children:
+                return None
+            root = self.root_of(message_id)
+            result = []
+            seen = set()
+            stack = [(root, 0)]
+            while stack and len(result) < MAX_THREAD_MESSAGES:
+                current, depth = stack.pop()
+                if current in seen:
+                    continue
+                seen.add(current)
+                result.append((current, depth, self._paths.get(current)))
+                # Oldest reply first once popped
+                for child in sorted(self._children.get(current, ()), reverse=True):
+                    stack.append((child, depth + 1))
+            return result
+
+    def children(self, message_id):
+        self._ensure_built()
+        with self._lock:
+            return sorted(self._children.get(message_id, ()))
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def thread_index_for(repo_path):
+    """The process-wide ThreadIndex of a repository"""
+    key = os.path.abspath(repo_path)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(key, ThreadIndex(key))
+    return index
+# end template/python3/chat/thread_index.py ; marker comment, please do not remove
@@ -4,85 +4,82 @@
 # File: commit_files.py
 
 import os
-import re
+import shlex
 import subprocess
 import sys
 from datetime import datetime
-import json
-import hashlib
-
-def calculate_file_hash(file_path):
-	sha256_hash = hashlib.sha256()
-	with open(file_path, "rb") as f:
-		for byte_block in iter(lambda: f.read(4096), b""):
-			sha256_hash.update(byte_block)
-	return sha256_hash.hexdigest()
-
-def extract_metadata(content, file_path):
-	metadata = {
-		'author': '',
-		'title': os.path.basename(file_path),
-		'hashtags': [],
-		'file_hash': calculate_file_hash(file_path)
-	}
-
-	# Extract author
-	author_match = re.search(r'Author:\s*(.+)', content)
-	if author_match:
-		metadata['author'] = author_match.group(1)
-
-	# Extract title (assuming it's the first line of the file)
-	title_match = re.search(r'^(.+)', content)
-	if title_match:
-		metadata['title'] = title_match.group(1).strip()
-
-	# Extract hashtags
-	metadata['hashtags'] = re.findall(r'#\w+', content)
-
-	return metadata
-
-def store_metadata(file_path, metadata):
-	metadata_dir = os.path.join(os.path.dirname(file_path), 'metadata')
-	os.makedirs(metadata_dir, exist_ok=True)
-
-	metadata_file = os.path.join(metadata_dir, f"{os.path.basename(file_path)}.json")
-
-	with open(metadata_file, 'w', encoding='utf-8') as f:
-		json.dump(metadata, f, indent=2)
-
-	return metadata_file
-
-def run_git_command(command):
-	process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-	output, error = process.communicate()
-	return output.decode('utf-8').strip(), error.decode('utf-8').strip()
-
-def has_remote():
+import time
+import metrics
+from chat.manifest import manifest_for
+
+# Paths per git update-index command line (one process per file is slow for big
+# commits; each process rewrites the whole index, and the command stays well under 128KB)
+GIT_ADD_BATCH = 1000
+
+def git_subcommand(command):
+	"""Name of the git subcommand in a command line, for metrics labels"""
+	words = command.split()
+	index = 1
+	while index < len(words) and words[index].startswith('-'):
+		# Skip global options such as -C <path>
+		index += 2 if words[index] in ('-C', '-c') else 1
+	return words[index] if index < len(words) else 'unknown'
+
+def run_git(command, cwd=None, input=None):
+	"""Run a git command line, feeding it input (bytes) if given; returns (returncode, stdout, stderr)"""
+	subcommand = git_subcommand(command)
+	started = time.perf_counter()
+	process = subprocess.Popen(command, stdin=subprocess.PIPE if input is not None else None,
+							   stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, cwd=cwd)
+	output, error = process.communicate(input)
+	metrics.counter('git_commands_total', command=subcommand).inc()
+	metrics.histogram('git_command_seconds', command=subcommand).observe(time.perf_counter() - started)
+	return process.returncode, output.decode('utf-8').strip(), error.decode('utf-8').strip()
+
+def run_git_command(command, cwd=None):
+	_, output, error = run_git(command, cwd)
+	return output, error
+
+def git_toplevel(directory):
+	"""Root of the git repository holding directory, or None"""
+	returncode, output, _ = run_git("git rev-parse --show-toplevel", directory)
+	return output if returncode == 0 and output else None
+
+def tracked_files(toplevel, directory):
+	"""Absolute paths of the files git tracks under directory"""
+	returncode, output, error = run_git(
+		f"git ls-files -z -- {shlex.quote(os.path.relpath(directory, toplevel))}", toplevel)
+	if returncode != 0:
+		print(f"Error listing tracked files in {directory}: {error}")
+		return set()
+	return {os.path.join(toplevel, path) for path in output.split('\0') if path}
+
+def has_remote(cwd=None):
 	"""Check if the repository has a remote configured"""
-	output, error = run_git_command("git remote")
+	output, error = run_git_command("git remote", cwd)
 	return bool(output.strip())
 
-def can_push():
+def can_push(cwd=None):
 	"""Check if we can push to the remote"""
-	if not has_remote():
+	if not has_remote(cwd):
 		return False
 
 	# Try to get the remote URL
-	output, error = run_git_command("git remote get-url origin")
+	output, error = run_git_command("git remote get-url origin", cwd)
 	if error or not output:
 		return False
 
 	# Check if we have credentials configured
-	output, error = run_git_command("git config --get remote.origin.url")
+	output, error = run_git_command("git config --get remote.origin.url", cwd)
 	return bool(output.strip())
 
-def push_changes():
+def push_changes(cwd=None):
 	"""Push changes to remote if possible"""
-	if not can_push():
+	if not can_push(cwd):
 		print("No remote configured or push access not available")
 		return False
 
-	output, error = run_git_command("git push origin HEAD")
+	output, error = run_git_command("git push origin HEAD", cwd)
 	if error and "rejected" in error.lower():
 		print(f"Push failed: {error}")
 		return False
@@ -108,41 +105,39 @@ def init_git_repo(repo_path):
 
 def pull_changes(repo_path="."):
 	"""Pull changes from remote repository"""
-	curr_dir = os.getcwd()
-	os.chdir(repo_path)
-	
+	# Commands run with cwd=repo_path instead of os.chdir(), which would move
+	# the working directory of every thread in a running server
 	try:
-		if not has_remote():
+		if not has_remote(repo_path):
 			print("No remote configured, skipping pull")
 			return False
-			
-		# Fetch changes first
-		output, error = run_git_command("git fetch")
-		if error:
+
+		# Fetch changes first; git reports progress on stderr, so only the
+		# exit status tells whether it failed
+		returncode, output, error = run_git("git fetch", repo_path)
+		if returncode != 0:
 			print(f"Error fetching changes: {error}")
 			return False
-			
+
 		# Check if we need to pull
-		status_output, _ = run_git_command("git status -uno")
+		status_output, _ = run_git_command("git status -uno", repo_path)
 		if "Your branch is behind" in status_output:
 			# Pull changes
-			output, error = run_git_command("git pull --no-rebase")
-			if error:
+			returncode, output, error = run_git("git pull --no-rebase", repo_path)
+			if returncode != 0:
 				print(f"Error pulling changes: {error}")
 				return False
 			print("Successfully pulled changes from remote repository")
 			return True
-		
+
 		print("Local repository is up to date")
 		return True
-		
+
 	except Exception as e:
 		print(f"Error in pull_changes: {str(e)}")
 		return False
-	finally:
-		os.chdir(curr_dir)
 
-def commit_text_files(repo_path=".", initialize=True):
+def commit_text_files(repo_path=".", initialize=True, verbose=True, commit_message=None, push=True):
 	"""Modified to handle repository initialization"""
 	if initialize and not init_git_repo(repo_path):
 		print("Failed to initialize git repository")
@@ -169,42 +164,44 @@ def commit_text_files(repo_path=".", initialize=True):
 			print("No uncommitted .txt files found.")
 			return True
 
-		# Process each file and store metadata
-		metadata_files = []
+		# Record message files in the manifest (chat/manifest.py) so the
+		# renderer and log report find them already parsed
+		manifest = manifest_for('.')
 		for file_path in txt_files:
+			if not file_path.startswith('message/'):
+				continue
 			try:
-				with open(file_path, 'r', encoding='utf-8') as f:
-					content = f.read()
-
-				metadata = extract_metadata(content, file_path)
-				metadata_file = store_metadata(file_path, metadata)
-				metadata_files.append(metadata_file)
-
-				print(f"File: {file_path}")
-				print(f"Author: {metadata['author']}")
-				print(f"Title: {metadata['title']}")
-				print(f"Hashtags: {', '.join(metadata['hashtags'])}")
-				print(f"File Hash: {metadata['file_hash']}")
-				print()
+				entry = manifest.get(file_path)
+
+				if verbose:
+					print(f"File: {file_path}")
+					print(f"Author: {entry['author']}")
+					print(f"Hashtags: {', '.join(entry['hashtags'])}")
+					print(f"File Hash: {entry['content_hash']}")
+					print()
 			except Exception as e:
 				print(f"Error processing file {file_path}: {str(e)}")
+		manifest.save()
 
-		# Add all .txt files and metadata files to staging
-		files_to_add = txt_files + metadata_files
-		for file in files_to_add:
-			run_git_command(f"git add {file}")
+		# Add all .txt files to staging, many per git process. update-index takes
+		# the paths as they are; git add would match each one as a pathspec
+		# against every file in the (possibly huge) channel directory
+		for start in range(0, len(txt_files), GIT_ADD_BATCH):
+			batch = txt_files[start:start + GIT_ADD_BATCH]
+			run_git_command("git update-index --add --remove -- " + ' '.join(shlex.quote(file) for file in batch))
 
 		# Create commit message
-		commit_message = f"Auto-commit {len(txt_files)} text files and metadata on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} by commit_files.py"
+		commit_message = commit_message or f"Auto-commit {len(txt_files)} text files on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} by commit_files.py"
 
 		# Commit the changes
-		run_git_command(f'git commit -m "{commit_message}"')
+		run_git_command(f"git commit -m {shlex.quote(commit_message)}")
 
-		print(f"Committed {len(txt_files)} text files and their metadata.")
+		print(f"Committed {len(txt_files)} text files.")
 		print("Commit message:", commit_message)
 
 		# Try to push changes if possible
-		push_changes()
+		if push:
+			push_changes()
 
 		return True
 
@@ -214,6 +211,25 @@ def commit_text_files(repo_path=".", initialize=True):
 	finally:
 		os.chdir(curr_dir)
 
+def commit_paths(repo_path, paths, commit_message):
+	"""Stage and commit files whose paths are already known (a bulk import).
+
+	Skips what commit_text_files does to find and parse the changes: no
+	status/diff/ls-files walk and no manifest pass. The paths go to a single
+	update-index on stdin, so no command line limit applies."""
+	if not paths:
+		return True
+	listing = b''.join(os.fsencode(os.path.relpath(path, repo_path)) + b'\0' for path in paths)
+	returncode, _, error = run_git("git update-index --add -z --stdin", repo_path, input=listing)
+	if returncode != 0:
+		print(f"Error staging files: {error}")
+		return False
+	returncode, _, error = run_git(f"git commit -q -m {shlex.quote(commit_message)}", repo_path)
+	if returncode != 0:
+		print(f"Error committing files: {error}")
+		return False
+	return True
+
 if __name__ == "__main__":
 	repo_path = sys.argv[1] if len(sys.argv) > 1 else "."
 	commit_text_files(repo_path=repo_path)
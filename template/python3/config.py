@@ -1,5 +1,7 @@
 # begin template/python3/config.py ; marker comment, please do not remove
 
+import os
+
 # Configuration constants
 SCRIPT_TYPES = ['py', 'pl', 'rb', 'sh', 'js']
 INTERPRETERS = ['python3', 'perl', 'ruby', 'bash', 'node']
@@ -15,4 +17,78 @@ MIME_TYPES = {
 	'gif': 'image/gif',
 }
 
+# WebSocket fan-out: per-client outbound queue length, what to do when a
+# client's queue is full ('drop_oldest' or 'disconnect'), and how long a
+# single send may take before the client is considered stalled (seconds)
+WS_QUEUE_SIZE = 256
+WS_OVERFLOW_POLICY = 'drop_oldest'
+WS_SEND_TIMEOUT = 10.0
+
+# Events published within this many seconds are coalesced into one frame
+# per subscribed client
+WS_COALESCE_INTERVAL = 0.05
+
+# Profiling: fraction of requests per route profiled with cProfile, whether
+# the render path (chat.html.py and its worker processes) is always
+# profiled, and where pstats/collapsed-stack dumps are written
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_RENDER = False
+PROFILE_DIR = 'profiles'
+
+# Token required by admin-only features (/admin/* and ?profile=1), sent as
+# the X-Admin-Token header or a token= query parameter. When empty, only
+# requests from the local machine are treated as admin.
+ADMIN_TOKEN = os.environ.get('GITYAP_ADMIN_TOKEN', '')
+
+# Render chat pages inside the server process instead of running chat.html.py
+# per request, so parsed templates (templates.py) stay loaded between renders
+RENDER_IN_PROCESS = os.environ.get('GITYAP_RENDER_IN_PROCESS', '') not in ('', '0')
+
+# Pages carry only the preview of long messages; the full text is fetched
+# from /api/message/<channel>/<id> when expanded (False embeds it hidden)
+RENDER_LAZY_FULL_MESSAGES = True
+
+# Where new message files go: 'flat' (message/<channel>/<id>.txt) or
+# 'sharded' (message/<channel>/YYYY/MM/DD/<id>.txt, for very large channels).
+# Readers understand both; migrate_layout.py moves existing files.
+MESSAGE_LAYOUT = os.environ.get('GITYAP_MESSAGE_LAYOUT', 'flat')
+
+# POST /post/batch: NDJSON bodies are read a line at a time up to this many
+# bytes (413 beyond); longer lines are rejected on their own
+POST_BATCH_MAX_BYTES = int(os.environ.get('GITYAP_POST_BATCH_MAX_BYTES', 8 * 1024 * 1024))
+POST_BATCH_MAX_LINE_BYTES = 256 * 1024
+
+# Watching message/ for changes made outside the server (git pull, scripts,
+# files copied in): backend 'auto' (inotify, else polling), 'inotify' or
+# 'poll'; polling re-lists changed directories every WATCH_POLL_INTERVAL
+# seconds and stats every file every WATCH_FULL_SCAN_INTERVAL seconds
+WATCH_MESSAGES = True
+WATCH_BACKEND = 'auto'
+WATCH_POLL_INTERVAL = 1.0
+WATCH_FULL_SCAN_INTERVAL = 60.0
+
+# In-memory caches (cache.py): seconds an entry stays valid, and the entry
+# and byte budgets past which least recently used entries are dropped
+# (a byte budget of 0 means none)
+PAGE_CACHE_TTL = 30
+PAGE_CACHE_MAX_ENTRIES = 256
+PAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+GIT_CACHE_TTL = 60
+GIT_CACHE_MAX_ENTRIES = 1024
+
+# Chat page renders: concurrent requests for a page always share one render;
+# with stale-while-revalidate, a request for a page that has changed gets the
+# previously rendered page at once while one background render refreshes it.
+# Waiters give up after RENDER_WAIT_TIMEOUT seconds.
+RENDER_STALE_WHILE_REVALIDATE = os.environ.get('GITYAP_STALE_WHILE_REVALIDATE', '') not in ('', '0')
+RENDER_WAIT_TIMEOUT = 60.0
+
+# Server-Sent Events (/events, unified server only): seconds between
+# heartbeat comments on an idle stream, the reconnect delay suggested to
+# browsers (milliseconds), and how many missed messages a reconnecting
+# stream replays before telling the client to reload instead
+SSE_HEARTBEAT_INTERVAL = 15.0
+SSE_RETRY_MS = 3000
+SSE_REPLAY_LIMIT = 50
+
 # end config.py ; marker comment, please do not remove
\ No newline at end of file
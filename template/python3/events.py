@@ -0,0 +1,38 @@
+# begin template/python3/events.py ; marker comment, please do not remove
+
+# In-process publish/subscribe for chat events (new messages, updates).
+# Handlers publish from whatever thread they run on; the WebSocket side
+# attaches its event loop and receives every event on that loop.
+
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[int] = None
+_listener: Optional[Callable[[Dict[str, Any]], None]] = None
+
+def attach(loop: asyncio.AbstractEventLoop, listener: Callable[[Dict[str, Any]], None]):
+	"""Deliver published events to listener on the given loop"""
+	global _loop, _loop_thread, _listener
+	_loop = loop
+	_loop_thread = threading.get_ident()
+	_listener = listener
+
+def detach():
+	global _loop, _loop_thread, _listener
+	_loop = _loop_thread = _listener = None
+
+def publish(event_type: str, **payload):
+	"""Publish an event; a no-op when no event loop is attached"""
+	loop, listener = _loop, _listener
+	if loop is None or listener is None or loop.is_closed():
+		return
+
+	event = {'type': event_type, **payload}
+	if threading.get_ident() == _loop_thread:
+		listener(event)
+	else:
+		loop.call_soon_threadsafe(listener, event)
+
+# end template/python3/events.py ; marker comment, please do not remove
@@ -0,0 +1,29 @@
+# begin template/python3/handlers/admin_handler.py ; marker comment, please do not remove
+import json
+import profiling
+from handlers.responses import send_json
+
+class AdminHandler:
+	"""Admin-only runtime controls"""
+
+	def serve_profile_settings(self, request):
+		"""GET /admin/profile: current profiling settings"""
+		if not profiling.is_admin(request):
+			return send_json(request, {'error': 'Forbidden'}, 403)
+		send_json(request, profiling.settings.as_dict())
+
+	def update_profile_settings(self, request):
+		"""POST /admin/profile with JSON {sample_rate, render, directory}"""
+		if not profiling.is_admin(request):
+			return send_json(request, {'error': 'Forbidden'}, 403)
+		try:
+			content_length = int(request.headers.get('Content-Length', 0) or 0)
+			if content_length < 0:
+				raise ValueError('negative Content-Length')
+			data = json.loads(request.rfile.read(content_length).decode('utf-8') or '{}')
+			profiling.settings.update(data)
+		except (ValueError, TypeError) as e:
+			return send_json(request, {'error': f'Invalid settings: {str(e)}'}, 400)
+		send_json(request, profiling.settings.as_dict())
+
+# end template/python3/handlers/admin_handler.py ; marker comment, please do not remove
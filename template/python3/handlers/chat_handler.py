@@ -1,21 +1,38 @@
 # begin template/python3/handlers/chat_handler.py ; marker comment, please include this, including this comment
+import hashlib
 import os
 import re
-from datetime import datetime
-from utils import page_cache, git_cache
+from datetime import datetime, timezone
+import email.utils
+from cache import page_cache, page_key, page_generation, invalidate_channel
 import json
+import urllib.parse
+import metrics
+import events
+import threading
+from config import RENDER_IN_PROCESS, RENDER_STALE_WHILE_REVALIDATE, RENDER_WAIT_TIMEOUT, RENDER_LAZY_FULL_MESSAGES
+from singleflight import SingleFlight
+from chat.channel_registry import registry_for
+from chat.channel_manager import find_message_file
+from handlers.responses import send_body, send_json
 
 class ChatHandler:
 	DEBUG = False  # Flag for outputting debug information
 
-	def __init__(self, request_handler):
-		self.handler = request_handler
+	def __init__(self, directory, script_handler, static_handler):
+		self.directory = directory
+		self.script_handler = script_handler
+		self.static_handler = static_handler
+		self.stale_while_revalidate = RENDER_STALE_WHILE_REVALIDATE
+		# One render per channel at a time, shared by everyone waiting for it
+		self.renders = SingleFlight('chat_render')
+		self.stale_served = metrics.counter('stale_pages_served_total', page='chat')
 
-	def handle_chat_get_request(self, path):
+	def handle_chat_get_request(self, request, path):
 		"""Handle GET requests for chat pages"""
 		parts = path.split('/')
 		if len(parts) != 3:
-			self.handler.send_error(404, "Invalid channel URL")
+			request.send_error(404, "Invalid channel URL")
 			return
 
 		channel = parts[2]
@@ -26,31 +43,31 @@ class ChatHandler:
 			print(f"Processing chat request for channel: {channel}")
 
 		if not self.is_valid_channel_name(channel):
-			self.handler.send_error(400, "Invalid channel name")
+			request.send_error(400, "Invalid channel name")
 			return
 
 		# Create chat directory if it doesn't exist
-		chat_dir = os.path.join(self.handler.directory, 'chat')
+		chat_dir = os.path.join(self.directory, 'chat')
 		os.makedirs(chat_dir, exist_ok=True)
 
 		# Create message directory for channel if it doesn't exist
-		message_dir = os.path.join(self.handler.directory, 'message', channel)
+		message_dir = os.path.join(self.directory, 'message', channel)
 		os.makedirs(message_dir, exist_ok=True)
 
-		self.generate_and_serve_chat(channel)
+		self.generate_and_serve_chat(request, channel)
 
-	def generate_and_serve_chat(self, channel='general'):
+	def generate_and_serve_chat(self, request, channel='general'):
 		"""Generate and serve the chat page with caching"""
 		if self.DEBUG:
 			print(f"Generating chat page for channel: {channel}")
 
 		# New file path structure - use absolute path from the start
-		chat_dir = os.path.join(self.handler.directory, 'chat')
+		chat_dir = os.path.join(self.directory, 'chat')
 		os.makedirs(chat_dir, exist_ok=True)  # Ensure chat directory exists
-		output_file = os.path.join(self.handler.directory, 'chat', f'{channel}.html')
+		output_file = os.path.join(self.directory, 'chat', f'{channel}.html')
 
 		# Also check for old-style filename
-		old_output_file = os.path.join(self.handler.directory, 'chat', f'{channel}_{channel}.html')
+		old_output_file = os.path.join(self.directory, 'chat', f'{channel}_{channel}.html')
 		if os.path.exists(old_output_file):
 			try:
 				os.remove(old_output_file)
@@ -60,72 +77,96 @@ class ChatHandler:
 				if self.DEBUG:
 					print(f"Error removing old file {old_output_file}: {e}")
 
-		cache_key = f'chat_{channel}'
-		cached_content = page_cache.get(cache_key)
-
-		#if cached_content: #todo fix this to not use cache if a new comment was just posted
-		#	print(f"Serving cached content for channel: {channel}")
-		#	self.handler.send_response(200)
-		#	self.handler.send_header('Content-type', 'text/html')
-		#	self.handler.end_headers()
-		#	self.handler.wfile.write(cached_content.encode('utf-8'))
-		#	return
-
-		self.schedule_git_pull(channel)
+		cache_key = page_key(channel)
+		content = page_cache.get(cache_key)
+		if content is not None:
+			self.send_page(request, content)
+			return
 
-		# Force regenerate the file if it exists
-		if os.path.exists(output_file):
+		if self.stale_while_revalidate and os.path.exists(output_file):
+			# Serve the last rendered page now; one background render
+			# refreshes it for the next request
 			try:
-				os.remove(output_file)
-				if self.DEBUG:
-					print(f"Removed existing {output_file}")
-			except Exception as e:
-				if self.DEBUG:
-					print(f"Error removing {output_file}: {e}")
+				with open(output_file, 'rb') as f:
+					content = f.read()
+			except OSError:
+				content = None
+			if content is not None:
+				if self.renders.start(channel, lambda: self.refresh_chat(channel, output_file)):
+					self.schedule_git_pull(channel)
+				self.stale_served.inc()
+				self.send_page(request, content)
+				return
 
-		if self.DEBUG:
-			print(f"Running chat.html.py script for channel: {channel}")
 		try:
-			# Use absolute path for output file
-			self.handler.script_handler.run_script(
-				'chat.html.py',
-				'--channel', channel,
-				'--output_file', output_file
-			)
+			content = self.renders.do(channel, lambda: self.render_chat(channel, output_file, True),
+									  timeout=RENDER_WAIT_TIMEOUT)
 		except Exception as e:
 			if self.DEBUG:
-				print(f"Error running chat.html.py script: {e}")
-
-		if os.path.exists(output_file):
-			try:
-				with open(output_file, 'rb') as f:
-					content = f.read()
-				page_cache.set(cache_key, content.decode('utf-8'))
-				self.handler.send_response(200)
-				self.handler.send_header('Content-type', 'text/html')
-				self.handler.end_headers()
-				self.handler.wfile.write(content)
-				if self.DEBUG:
-					print(f"Successfully served chat page for channel: {channel}")
-			except Exception as e:
-				if self.DEBUG:
-					print(f"Error reading {output_file}: {e}")
-				self.handler.send_error(500, f"Error reading chat page: {str(e)}")
-		else:
-			if self.DEBUG:
-				print(f"Failed to generate {output_file}")
-			self.handler.send_error(500, "Failed to generate chat page")
+				print(f"Failed to generate {output_file}: {e}")
+			request.send_error(500, "Failed to generate chat page")
+			return
+		self.send_page(request, content)
+
+	def render_chat(self, channel, output_file, pull=False):
+		"""Render one channel page; concurrent callers share it through self.renders"""
+		if pull:
+			self.schedule_git_pull(channel)
+		generation = page_generation()
+		# Render next to the page and swap it in, so readers of the old file
+		# never see it missing or half written
+		temp_file = f"{output_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+		if self.DEBUG:
+			print(f"Running chat.html.py script for channel: {channel}")
+		try:
+			with metrics.histogram('render_seconds', page='chat').time():
+				if RENDER_IN_PROCESS:
+					from chat.html_generator import generate_chat_html
+					generate_chat_html(self.directory, temp_file, channel=channel)
+				else:
+					self.script_handler.run_script(
+						'chat.html.py',
+						'--channel', channel,
+						'--output_file', temp_file
+					)
+			# run_script reports failures instead of raising
+			with open(temp_file, 'rb') as f:
+				content = f.read()
+			os.replace(temp_file, output_file)
+		finally:
+			if os.path.exists(temp_file):
+				os.remove(temp_file)
+
+		# A message that arrived during the render is not in this page
+		if page_generation() == generation:
+			page_cache.set(page_key(channel), content)
+		return content
+
+	def refresh_chat(self, channel, output_file):
+		"""Background render for stale-while-revalidate; viewers of the stale page reload"""
+		generation = page_generation()
+		self.render_chat(channel, output_file)
+		if page_generation() == generation:
+			events.publish('update_required', channel=channel, source='render')
+
+	def regenerate(self, channel):
+		"""Render a channel page in the background after new messages were written"""
+		output_file = os.path.join(self.directory, 'chat', f'{channel}.html')
+		os.makedirs(os.path.dirname(output_file), exist_ok=True)
+		self.renders.start(channel, lambda: self.render_chat(channel, output_file))
+
+	def send_page(self, request, content):
+		send_body(request, content, 'text/html')
 
 	def schedule_git_pull(self, channel):
 		"""Schedule git pull in background"""
-		import threading
 		def pull_async():
-			channel_repo_path = os.path.join(self.handler.directory, 'message', channel)
+			channel_repo_path = os.path.join(self.directory, 'message', channel)
 			if os.path.exists(channel_repo_path):
 				from commit_files import pull_changes
 				if pull_changes(channel_repo_path):
-					page_cache.invalidate(f'chat/{channel}') #todo is this right?
-					git_cache.invalidate(channel)
+					invalidate_channel(channel)
+					registry_for(self.directory).invalidate(channel)
 
 		thread = threading.Thread(target=pull_async)
 		thread.daemon = True
@@ -138,168 +179,173 @@ class ChatHandler:
 			return True
 		return bool(re.match(r'^[a-zA-Z0-9_-]+$', channel))
 
-	def generate_and_serve_report(self):
+	def generate_and_serve_report(self, request):
 		"""Generate and serve the log report"""
-		self.handler.script_handler.run_script_if_needed('log.html', 'log.html')
-		self.handler.static_handler.serve_static_file('log.html')
-
-	def handle_chat_post(self):
-		"""Handle POST request for chat messages"""
+		with metrics.histogram('render_seconds', page='log').time():
+			self.script_handler.run_script_if_needed('log.html', 'log.html')
+		self.static_handler.serve_static_file(request, 'log.html')
+
+	def handle_search(self, request):
+		"""GET /api/search?q=<terms>[&channel=<name>][&limit=<n>]"""
+		query = urllib.parse.parse_qs(urllib.parse.urlparse(request.path).query)
+		terms = query.get('q', [''])[0].strip()
+		channel = query.get('channel', ['everything'])[0]
+		if not terms:
+			return send_json(request, {'error': 'Missing query'}, 400)
+		if not self.is_valid_channel_name(channel):
+			return send_json(request, {'error': 'Invalid channel name'}, 400)
 		try:
-			if self.DEBUG:
-				print("\n=== Starting chat post handling ===")
-
-			# Get and decode request data
-			content_length = int(self.handler.headers.get('Content-Length', 0))
-			if self.DEBUG:
-				print(f"Content Length: {content_length}")
-			post_data = self.handler.rfile.read(content_length).decode('utf-8')
-			if self.DEBUG:
-				print(f"Raw POST data: {post_data}")
-
-			# Parse JSON data
-			try:
-				data = json.loads(post_data)
-				if self.DEBUG:
-					print(f"Parsed data: {json.dumps(data, indent=2)}")
-			except json.JSONDecodeError as e:
-				if self.DEBUG:
-					print(f"JSON decode error: {str(e)}")
-				self._send_json_response({
-					'error': 'Invalid JSON format',
-					'debug_info': {
-						'error_message': str(e),
-						'error_position': e.pos,
-						'raw_data': post_data
-					}
-				}, 400)
-				return
-
-			# Extract fields
-			author = data.get('author', 'Guest')
-			content = data.get('content', '')
-			tags = data.get('tags', [])
-			channel = data.get('channel', 'general')
-
-			if self.DEBUG:
-				print(f"Extracted fields:")
-				print(f"- Author: {author}")
-				print(f"- Content: {content}")
-				print(f"- Tags: {tags}")
-				print(f"- Channel: {channel}")
-
-			if not content:
-				if self.DEBUG:
-					print("Error: Missing content")
-				self._send_json_response({
-					'error': 'Missing content',
-					'debug_info': {'received_data': data}
-				}, 400)
-				return
-
-			if not self.is_valid_channel_name(channel):
-				if self.DEBUG:
-					print(f"Error: Invalid channel name: {channel}")
-				self._send_json_response({
-					'error': 'Invalid channel name',
-					'debug_info': {'channel': channel}
-				}, 400)
-				return
-
-			# Create message directory
-			message_dir = os.path.join(self.handler.directory, 'message', channel)
-			if self.DEBUG:
-				print(f"Message directory path: {message_dir}")
-
-			try:
-				os.makedirs(message_dir, exist_ok=True)
-				if self.DEBUG:
-					print(f"Created/verified directory at: {message_dir}")
-			except OSError as e:
-				if self.DEBUG:
-					print(f"Error creating directory: {str(e)}")
-				self._send_json_response({
-					'error': 'Failed to create message directory',
-					'debug_info': {'error': str(e)}
-				}, 500)
-				return
-
-			# Generate timestamp and filename
-			timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-			filename = f"{timestamp}.txt"
-			filepath = os.path.join(message_dir, filename)
-			if self.DEBUG:
-				print(f"Will save message to: {filepath}")
+			limit = max(1, min(200, int(query.get('limit', ['50'])[0])))
+		except ValueError:
+			return send_json(request, {'error': 'Invalid limit'}, 400)
+
+		from chat.search import search_messages
+		results = search_messages(self.directory, terms, channel, limit)
+		send_json(request, {'query': terms, 'channel': channel, 'results': results})
+
+	def handle_channels(self, request):
+		"""GET /api/channels: every channel with its message count and latest message"""
+		body = {'channels': registry_for(self.directory).as_json()}
+		etag = '"' + hashlib.sha1(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest() + '"'
+		if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+			request.send_response(304)
+			request.send_header('ETag', etag)
+			request.send_header('Cache-Control', 'no-cache')
+			request.end_headers()
+			return
+		send_json(request, body, headers={'ETag': etag})
 
-			# Write message to file
-			try:
-				with open(filepath, 'w', encoding='utf-8') as f:
-					f.write(f"Author: {author}\n")
-					f.write(f"Channel: {channel}\n")
-					#f.write(f"Timestamp: {timestamp}\n\n") #todo
-					f.write(content)
-					if tags:
-						f.write(f"\n\nTags: {' '.join(tags)}")
-			except IOError as e:
-				if self.DEBUG:
-					print(f"Error writing file: {str(e)}")
-				self._send_json_response({
-					'error': 'Failed to write message',
-					'debug_info': {'error': str(e)}
-				}, 500)
-				return
+	def handle_message(self, request, channel, message_id):
+		"""GET /api/message/<channel>/<message_id>: one full message, with ETag and Last-Modified"""
+		if not self.is_valid_channel_name(channel):
+			return send_json(request, {'error': 'Invalid channel name'}, 400)
+		from chat.manifest import manifest_for, read_body
+		path = find_message_file(os.path.join(self.directory, 'message'), channel, message_id)
+		if path is None:
+			return send_json(request, {'error': 'Message not found'}, 404)
+		try:
+			entry = manifest_for(self.directory).get(path)
+			body = read_body(path, entry)
+		except OSError:
+			return send_json(request, {'error': 'Message not found'}, 404)
+
+		# The content hash changes with any edit, so the ETag is strong
+		etag = f'"{entry["content_hash"]}"'
+		last_modified = email.utils.formatdate(entry['mtime'], usegmt=True)
+		validators = {'ETag': etag, 'Last-Modified': last_modified, 'Cache-Control': 'public, max-age=60'}
+		if_none_match = request.headers.get('If-None-Match')
+		if if_none_match is not None:
+			not_modified = etag in [tag.strip() for tag in if_none_match.split(',')]
+		else:
+			not_modified = self._not_modified_since(request.headers.get('If-Modified-Since'), entry['mtime'])
+		if not_modified:
+			request.send_response(304)
+			for name, value in validators.items():
+				request.send_header(name, value)
+			request.end_headers()
+			return
 
-			# Regenerate chat.html
-			if self.DEBUG:
-				print("Regenerating chat.html...")
-			try:
-				self.generate_and_serve_chat(channel)
-				if self.DEBUG:
-					print("Successfully regenerated chat.html")
-			except Exception as e:
-				if self.DEBUG:
-					print(f"Error regenerating chat.html: {str(e)}")
+		send_json(request, {
+			'message_id': message_id,
+			'channel': entry['channel'],
+			'author': entry['author'],
+			'timestamp': datetime.fromtimestamp(entry['timestamp'], tz=timezone.utc).isoformat(),
+			'hashtags': entry['hashtags'],
+			'reply_to': entry['reply_to'],
+			'content': body,
+		}, headers=validators)
 
-			# Invalidate cache
-			page_cache.invalidate(f'chat/{channel}')
-			git_cache.invalidate(channel)
+	@staticmethod
+	def _not_modified_since(header, mtime):
+		if not header:
+			return False
+		try:
+			since = email.utils.parsedate_to_datetime(header)
+		except (TypeError, ValueError):
+			return False
+		return int(mtime) <= since.timestamp()
+
+	def handle_thread(self, request, message_id):
+		"""GET /thread/<message_id>: the whole reply thread as a page"""
+		from chat.html_generator import generate_thread_html
+		with metrics.histogram('render_seconds', page='thread').time():
+			page = generate_thread_html(self.directory, message_id)
+		if page is None:
+			request.send_error(404, "Thread not found")
+			return
+		self.send_page(request, page.encode('utf-8'))
+
+	def handle_thread_api(self, request, message_id):
+		"""GET /api/thread/<message_id>: the reply thread as JSON, in reading order"""
+		from chat.thread_index import thread_index_for
+		from chat.manifest import manifest_for, read_body
+		members = thread_index_for(self.directory).thread(message_id)
+		if members is None:
+			return send_json(request, {'error': 'Thread not found'}, 404)
+		manifest = manifest_for(self.directory)
+		messages = []
+		for member_id, depth, path in members:
+			item = {'message_id': member_id, 'depth': depth, 'exists': path is not None}
+			if path is not None:
+				try:
+					entry = manifest.get(path)
+					item.update(
+						channel=entry['channel'],
+						author=entry['author'],
+						timestamp=datetime.fromtimestamp(entry['timestamp'], tz=timezone.utc).isoformat(),
+						hashtags=entry['hashtags'],
+						reply_to=entry['reply_to'],
+						content=read_body(path, entry),
+					)
+				except OSError:
+					item['exists'] = False
+			messages.append(item)
+		manifest.save()
+		send_json(request, {'root': members[0][0], 'message_id': message_id, 'messages': messages})
+
+	def handle_since(self, request, channel, cursor):
+		"""GET /api/chat/<channel>/since/<cursor>[?limit=<n>]: messages newer than cursor"""
+		if not self.is_valid_channel_name(channel):
+			return send_json(request, {'error': 'Invalid channel name'}, 400)
+		query = urllib.parse.parse_qs(urllib.parse.urlparse(request.path).query)
+		try:
+			limit = max(1, min(200, int(query.get('limit', ['50'])[0])))
+		except ValueError:
+			return send_json(request, {'error': 'Invalid limit'}, 400)
+
+		from chat.delta import delta_etag, messages_since
+		from chat.html_generator import render_message
+		import templates
+		message_template = templates.get(os.path.join(self.directory, 'template', 'html', 'chat_message.html'))
+
+		# Answered from directory mtimes alone while nothing was added
+		etag = delta_etag(self.directory, channel, cursor, limit, message_template.mtime)
+		if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+			request.send_response(304)
+			request.send_header('ETag', etag)
+			request.send_header('Cache-Control', 'no-cache')
+			request.end_headers()
+			return
 
-			if self.DEBUG:
-				print("=== Chat post handling complete ===\n")
-			self._send_json_response({
-				'status': 'success',
-				'timestamp': timestamp,
-				'debug_info': {
-					'filepath': filepath,
-					'channel': channel,
-					'message_length': len(content)
-				}
+		messages, more = messages_since(self.directory, channel, cursor, limit)
+		items = []
+		for msg in messages:
+			html = []
+			render_message(message_template, html, msg, msg['message_id'], lazy_full_message=RENDER_LAZY_FULL_MESSAGES)
+			items.append({
+				'message_id': msg['message_id'],
+				'author': msg['author'],
+				'channel': msg['channel'],
+				'timestamp': msg['timestamp'].isoformat(),
+				'hashtags': msg['hashtags'],
+				'reply_to': msg['reply_to'],
+				'html': ''.join(html),
 			})
-
-		except Exception as e:
-			import traceback
-			trace = traceback.format_exc()
-			if self.DEBUG:
-				print(f"Unexpected error: {str(e)}")
-				print(f"Traceback:\n{trace}")
-			self._send_json_response({
-				'error': str(e),
-				'debug_info': {
-						'traceback': trace,
-						'error_type': type(e).__name__
-				}
-			}, 500)
-
-	def _send_json_response(self, data, status=200):
-		"""Helper method to send JSON responses"""
-		response = json.dumps(data)
-		response_bytes = response.encode('utf-8')
-
-		self.handler.send_response(status)
-		self.handler.send_header('Content-Type', 'application/json')
-		self.handler.send_header('Content-Length', len(response_bytes))
-		self.handler.send_header('Cache-Control', 'no-cache')
-		self.handler.end_headers()
-		self.handler.wfile.write(response_bytes)
+		send_json(request, {
+			'channel': channel,
+			'cursor': messages[0]['message_id'] if messages else cursor,
+			'messages': items,
+			'more': more,
+		}, headers={'ETag': etag})
 
 # end chat_handler.py ; marker comment, please include this, including this comment
\ No newline at end of file
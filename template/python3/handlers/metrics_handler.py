@@ -0,0 +1,24 @@
+# begin template/python3/handlers/metrics_handler.py ; marker comment, please do not remove
+import urllib.parse
+import metrics
+from handlers.responses import send_body, send_json
+
+class MetricsHandler:
+	"""Serve the process-wide metrics registry"""
+
+	def __init__(self, registry=None):
+		self.registry = registry or metrics.registry
+
+	def serve_metrics(self, request):
+		"""GET /metrics: Prometheus text format, or JSON with ?format=json"""
+		query = urllib.parse.parse_qs(urllib.parse.urlparse(request.path).query)
+		if query.get('format', [''])[0] == 'json':
+			return self.serve_metrics_json(request)
+		send_body(request, self.registry.render_prometheus(), 'text/plain; version=0.0.4; charset=utf-8',
+				  headers={'Cache-Control': 'no-cache'})
+
+	def serve_metrics_json(self, request):
+		"""GET /metrics.json"""
+		send_json(request, self.registry.as_dict())
+
+# end template/python3/handlers/metrics_handler.py ; marker comment, please do not remove
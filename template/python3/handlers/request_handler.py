@@ -1,113 +1,59 @@
 # begin template/python3/http/request_handler.py ; marker comment, please do not remove, including this message
 import json
-import urllib.parse
+import re
 import os
-from datetime import datetime
 from typing import Optional, Union, Dict, Any
-from http.server import BaseHTTPRequestHandler
-from handlers.script_handler import ScriptHandler
-
-# Cache classes remain unchanged
-class PageCache:
-	def __init__(self):
-		self.cache = {}
-	
-	def invalidate(self, key: str) -> None:
-		if key in self.cache:
-			del self.cache[key]
-
-class GitCache:
-	def __init__(self):
-		self.cache = {}
-	
-	def invalidate(self, key: str) -> None:
-		if key in self.cache:
-			del self.cache[key]
-
-# Initialize cache objects
-page_cache = PageCache()
-git_cache = GitCache()
-
-class ChatHandler:
-	def __init__(self, request_handler):
-		"""Initialize ChatHandler with a request handler instance"""
-		if not isinstance(request_handler, BaseHTTPRequestHandler):
-			raise TypeError("request_handler must be an instance of BaseHTTPRequestHandler")
-			
-		self.handler = request_handler
-		self.script_handler = ScriptHandler(request_handler)  # Use ScriptHandler instead of ChatHandler
-	
-	@staticmethod
-	def is_valid_channel_name(channel: str) -> bool:
-		"""Validate channel name - only alphanumeric and underscores allowed"""
-		return channel.isalnum() or all(c.isalnum() or c == '_' for c in channel)
-	
-	def run_script(self, filename: str) -> None:
-		"""Run a script to regenerate files"""
-		self.script_handler.run_script(filename)
+import events
+from config import POST_BATCH_MAX_BYTES, POST_BATCH_MAX_LINE_BYTES
+import cache
+from chat.channel_registry import registry_for
+from chat.channel_manager import create_message_file, format_message
+from chat.manifest import manifest_for
+from handlers.responses import NO_STORE, send_json
 
 class RequestHandler:
 	DEBUG = False
 
-	def __init__(self, request_handler):
+	def __init__(self, directory, chat_handler, script_handler):
 		"""
-		Initialize the RequestHandler with a BaseHTTPRequestHandler instance
+		Initialize the RequestHandler with the shared chat and script handlers.
+		Instances hold no per-request state; the live BaseHTTPRequestHandler
+		is passed to every method instead.
 		"""
-		if not isinstance(request_handler, BaseHTTPRequestHandler):
-			raise TypeError("request_handler must be an instance of BaseHTTPRequestHandler")
-			
-		self.handler = request_handler
-		self.directory = os.getenv('CHAT_DIRECTORY', './chat')
-		self.chat_handler = ChatHandler(request_handler)
-		
-		# These attributes will be set during request handling
-		self._headers = None
-		self._rfile = None
-		self._wfile = None
-
-	@property
-	def headers(self):
-		if self._headers is None and hasattr(self.handler, 'headers'):
-			self._headers = self.handler.headers
-		return self._headers
-
-	@property
-	def rfile(self):
-		if self._rfile is None and hasattr(self.handler, 'rfile'):
-			self._rfile = self.handler.rfile
-		return self._rfile
-
-	@property
-	def wfile(self):
-		if self._wfile is None and hasattr(self.handler, 'wfile'):
-			self._wfile = self.handler.wfile
-		return self._wfile
+		self.directory = os.getenv('CHAT_DIRECTORY', directory)
+		self.chat_handler = chat_handler
+		self.script_handler = script_handler
 
 	@staticmethod
 	def debug_print(*args, **kwargs):
 		if RequestHandler.DEBUG:
 			print(*args, **kwargs)
 
-	def handle_chat_post(self):
+	def handle_chat_post(self, request):
 		"""Handle POST request for chat messages"""
 		try:
 			self.debug_print("\n=== Starting chat post handling ===")
 			
 			# Check initial conditions
-			if not self.headers or not self.rfile:
+			if not request.headers or not request.rfile:
 				self.debug_print("Error: Headers or request body not initialized")
-				return self.send_json_response({
+				return self.send_json_response(request, {
 					'error': 'Request not properly initialized',
 					'debug_info': {
-						'headers_present': bool(self.headers),
-						'rfile_present': bool(self.rfile)
+						'headers_present': bool(request.headers),
+						'rfile_present': bool(request.rfile)
 					}
 				}, 400)
 
 			# Get and decode request data
-			content_length = int(self.headers.get('Content-Length', 0))
+			try:
+				content_length = int(request.headers.get('Content-Length', 0) or 0)
+			except ValueError:
+				content_length = -1
+			if content_length < 0:
+				return self.send_json_response(request, {'error': 'Invalid Content-Length'}, 400)
 			self.debug_print(f"Content Length: {content_length}")
-			post_data = self.rfile.read(content_length).decode('utf-8')
+			post_data = request.rfile.read(content_length).decode('utf-8')
 			self.debug_print(f"Raw POST data: {post_data}")
 
 			# Parse JSON data
@@ -116,7 +62,7 @@ class RequestHandler:
 				self.debug_print(f"Parsed data: {json.dumps(data, indent=2)}")
 			except json.JSONDecodeError as e:
 				self.debug_print(f"JSON decode error: {str(e)}")
-				return self.send_json_response({
+				return self.send_json_response(request, {
 					'error': 'Invalid JSON format',
 					'debug_info': {
 						'error_message': str(e),
@@ -127,108 +73,41 @@ class RequestHandler:
 					}
 				}, 400)
 
-			# Extract fields
-			author = data.get('author', '')
-			content = data.get('content', '')
-			tags = data.get('tags', [])
-			channel = data.get('channel', 'general')
-			
-			self.debug_print(f"Extracted fields:")
-			self.debug_print(f"- Author: {author}")
-			self.debug_print(f"- Content: {content}")
-			self.debug_print(f"- Tags: {tags}")
-			self.debug_print(f"- Channel: {channel}")
-
-			if not author:
-				author = 'Guest'
-				self.debug_print("Using default author: Guest")
-
-			if not content:
-				self.debug_print("Error: Missing content")
-				return self.send_json_response({
-					'error': 'Missing content',
+			# Extract and check fields
+			fields, error = self.validate_message(data)
+			self.debug_print(f"Extracted fields: {fields}")
+			if error:
+				self.debug_print(f"Error: {error}")
+				return self.send_json_response(request, {
+					'error': error,
 					'debug_info': {'received_data': data}
 				}, 400)
+			channel = fields['channel']
 
-			if not self.chat_handler.is_valid_channel_name(channel):
-				self.debug_print(f"Error: Invalid channel name: {channel}")
-				return self.send_json_response({
-					'error': 'Invalid channel name',
-					'debug_info': {'channel': channel}
-				}, 400)
-
-			# Create message directory with correct path
-			message_dir = os.path.join('./message', channel)  # Changed path
-			self.debug_print(f"Message directory path: {message_dir}")
-			
-			try:
-				os.makedirs(message_dir, exist_ok=True)
-				self.debug_print(f"Created/verified directory at: {message_dir}")
-			except OSError as e:
-				self.debug_print(f"Error creating directory: {str(e)}")
-				return self.send_json_response({
-					'error': 'Failed to create message directory',
-					'debug_info': {'error': str(e)}
-				}, 500)
-
-			# Generate timestamp and filename
-			timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-			filename = f"{timestamp}.txt"
-			filepath = os.path.join(message_dir, filename)
-			self.debug_print(f"Will save message to: {filepath}")
-
-			# Write message to file
+			# Write message to file; the id is unique even for posts in the same second
+			message_dir = os.path.join(self.directory, 'message')
 			try:
 				self.debug_print("Writing message to file...")
-				with open(filepath, 'w', encoding='utf-8') as f:
-					f.write(f"Author: {author}\n")
-					f.write(f"Channel: {channel}\n")
-					# f.write(f"Timestamp: {timestamp}\n\n") #todo
-					f.write(content)
-					if tags:
-						f.write(f"\n\nTags: {' '.join(tags)}")
-				
-				# Verify file was written
-				if os.path.exists(filepath):
-					self.debug_print(f"Successfully wrote file. Size: {os.path.getsize(filepath)} bytes")
-					with open(filepath, 'r', encoding='utf-8') as f:
-						self.debug_print(f"File content verification:\n{f.read()}")
-				else:
-					self.debug_print("Warning: File not found after writing!")
-					
-			except IOError as e:
+				timestamp, filepath = create_message_file(message_dir, channel, format_message(**fields))
+				self.debug_print(f"Successfully wrote file: {filepath}")
+			except OSError as e:
 				self.debug_print(f"Error writing file: {str(e)}")
-				return self.send_json_response({
+				return self.send_json_response(request, {
 					'error': 'Failed to write message',
 					'debug_info': {'error': str(e)}
 				}, 500)
 
-			# Regenerate chat.html
-			self.debug_print("Attempting to regenerate chat.html...")
-			try:
-				if hasattr(self.chat_handler, 'run_script'):
-					self.chat_handler.run_script('chat.html')
-					self.debug_print("Successfully regenerated chat.html")
-				else:
-					self.debug_print("Warning: chat_handler.run_script method not found")
-			except Exception as e:
-				self.debug_print(f"Error regenerating chat.html: {str(e)}")
-				# Continue anyway as the message was saved
-
-			# Invalidate cache
-			self.debug_print("Invalidating caches...")
-			page_cache.invalidate(f'chat/{channel}')
-			git_cache.invalidate(channel)
-			self.debug_print("Cache invalidation complete")
+			# Index, invalidate caches, regenerate the page and notify subscribers
+			self.messages_written({channel: [(timestamp, filepath)]})
 
 			self.debug_print("=== Chat post handling complete ===\n")
-			return self.send_json_response({
+			return self.send_json_response(request, {
 				'status': 'success',
 					'timestamp': timestamp,
 					'debug_info': {
 						'filepath': filepath,
 						'channel': channel,
-						'message_length': len(content)
+						'message_length': len(fields['content'])
 					}
 			})
 
@@ -237,7 +116,7 @@ class RequestHandler:
 			trace = traceback.format_exc()
 			self.debug_print(f"Unexpected error: {str(e)}")
 			self.debug_print(f"Traceback:\n{trace}")
-			return self.send_json_response({
+			return self.send_json_response(request, {
 				'error': str(e),
 				'debug_info': {
 					'traceback': trace,
@@ -245,66 +124,189 @@ class RequestHandler:
 				}
 			}, 500)
 			
-	def handle_post_request(self, path: str):
-		"""Route POST requests to appropriate handlers"""
-		parsed_path = urllib.parse.urlparse(path)
-		path = parsed_path.path
-
-		if path == '/sync':
-			return self.handle_sync_request()
-		elif path in ['/post', '/chat.html']:
-			return self.handle_chat_post()
+	def handle_batch_post(self, request):
+		"""Handle POST /post/batch: one JSON message per line (NDJSON), any channels.
+
+		Lines are read, checked and written one at a time, up to
+		POST_BATCH_MAX_BYTES; bad lines are reported and skipped. Each channel
+		that received messages is invalidated, regenerated and announced once."""
+		length = request.headers.get('Content-Length')
+		if length is None:
+			return self.send_json_response(request, {'error': 'Content-Length required'}, 411)
+		try:
+			length = int(length)
+		except ValueError:
+			length = -1
+		if length < 0:
+			return self.send_json_response(request, {'error': 'Invalid Content-Length'}, 400)
+		if length > POST_BATCH_MAX_BYTES:
+			return self.send_json_response(request, {
+				'error': 'Batch too large',
+				'limit': POST_BATCH_MAX_BYTES
+			}, 413)
+
+		message_dir = os.path.join(self.directory, 'message')
+		written = {}
+		accepted = []
+		errors = []
+		try:
+			for line_number, line in self.read_lines(request.rfile, length):
+				if line is None:
+					errors.append({'line': line_number, 'error': 'Line too long'})
+					continue
+				if not line.strip():
+					continue
+				try:
+					data = json.loads(line)
+				except ValueError as e:
+					errors.append({'line': line_number, 'error': f'Invalid JSON: {e}'})
+					continue
+				if not isinstance(data, dict):
+					errors.append({'line': line_number, 'error': 'Expected a JSON object'})
+					continue
+				try:
+					fields, error = self.validate_message(data)
+					if error:
+						errors.append({'line': line_number, 'error': error})
+						continue
+					message_id, filepath = create_message_file(message_dir, fields['channel'], format_message(**fields))
+				except Exception as e:
+					errors.append({'line': line_number, 'error': f'Failed to write message: {e}'})
+					continue
+				written.setdefault(fields['channel'], []).append((message_id, filepath))
+				accepted.append({'line': line_number, 'message_id': message_id, 'channel': fields['channel']})
+		except OSError as e:
+			# The body could not be read to the end (connection lost, timed out)
+			errors.append({'line': None, 'error': f'Failed to read request body: {e}'})
+		finally:
+			# Whatever is on disk is indexed and announced, even if the batch broke off
+			self.messages_written(written)
+
+		self.debug_print(f"Batch post: {len(accepted)} written, {len(errors)} rejected, channels {sorted(written)}")
+		if not errors:
+			status = 'success'
 		else:
-			return self.send_json_response({'error': 'Method not allowed'}, 405)
+			status = 'partial' if accepted else 'error'
+		return self.send_json_response(request, {
+			'status': status,
+			'accepted': len(accepted),
+			'rejected': len(errors),
+			'messages': accepted,
+			'errors': errors
+		}, 400 if status == 'error' else 200)
 
-	def handle_sync_request(self):
+	@staticmethod
+	def read_lines(rfile, length):
+		"""(line number, line) for the next length bytes of rfile, read a line at a time.
+
+		A line longer than POST_BATCH_MAX_LINE_BYTES is skipped and given as None."""
+		remaining = length
+		line_number = 0
+		while remaining > 0:
+			line = rfile.readline(min(remaining, POST_BATCH_MAX_LINE_BYTES + 1))
+			if not line:
+				break
+			remaining -= len(line)
+			line_number += 1
+			if len(line) > POST_BATCH_MAX_LINE_BYTES:
+				while remaining > 0 and not line.endswith(b'\n'):
+					line = rfile.readline(min(remaining, 64 * 1024))
+					if not line:
+						break
+					remaining -= len(line)
+				yield line_number, None
+				continue
+			yield line_number, line
+
+	def validate_message(self, data):
+		"""(fields, None) for a valid posted message, else (fields, error message)"""
+		fields = {
+			'author': data.get('author') or 'Guest',
+			'content': data.get('content', ''),
+			'tags': data.get('tags') or [],
+			'channel': data.get('channel', 'general'),
+			'reply_to': data.get('reply_to') or '',
+		}
+		if not fields['content']:
+			return fields, 'Missing content'
+		if not isinstance(fields['content'], str) or not isinstance(fields['author'], str):
+			return fields, 'Invalid content or author'
+		if not isinstance(fields['tags'], list) or not all(isinstance(tag, str) for tag in fields['tags']):
+			return fields, 'Invalid tags'
+		if not isinstance(fields['channel'], str) or not self.chat_handler.is_valid_channel_name(fields['channel']):
+			return fields, 'Invalid channel name'
+		if not isinstance(fields['reply_to'], str):
+			return fields, 'Invalid reply_to'
+		fields['reply_to'] = fields['reply_to'].strip()
+		if fields['reply_to'] and not re.match(r'^[A-Za-z0-9_-]+$', fields['reply_to']):
+			return fields, 'Invalid reply_to'
+		return fields, None
+
+	def messages_written(self, written):
+		"""After writing {channel: [(message id, path)]}: index the files, then
+		invalidate, regenerate and notify once per channel"""
+		manifest = manifest_for(self.directory)
+		for messages in written.values():
+			for _, filepath in messages:
+				# Record it in the message index (and the thread index that follows it)
+				try:
+					manifest.get(filepath)
+				except OSError as e:
+					self.debug_print(f"Error indexing message: {str(e)}")
+		manifest.save()
+
+		# Every invalidation first: each one keeps renders started before it from being cached
+		self.debug_print("Invalidating caches...")
+		for channel in written:
+			cache.invalidate_channel(channel)
+			registry_for(self.directory).invalidate(channel)
+
+		for channel, messages in written.items():
+			self.chat_handler.regenerate(channel)
+			# Let WebSocket and event stream subscribers know the channel changed
+			events.publish('update_required', channel=channel, message_id=messages[-1][0], count=len(messages))
+
+	def method_not_allowed(self, request):
+		"""Answer POSTs to paths that do not accept them"""
+		return self.send_json_response(request, {'error': 'Method not allowed'}, 405)
+
+	def handle_sync_request(self, request):
 		"""Handle manual sync request"""
 		try:
-			content_length = int(self.headers.get('Content-Length', 0))
-			post_data = self.rfile.read(content_length).decode('utf-8')
+			content_length = int(request.headers.get('Content-Length', 0) or 0)
+		except ValueError:
+			content_length = -1
+		if content_length < 0:
+			return self.send_json_response(request, {'error': 'Invalid Content-Length'}, 400)
+		try:
+			post_data = request.rfile.read(content_length).decode('utf-8')
 			data = json.loads(post_data)
 
 			channel = data.get('channel', 'general')
 			if not self.chat_handler.is_valid_channel_name(channel):
-				return self.send_json_response({'error': 'Invalid channel name'}, 400)
+				return self.send_json_response(request, {'error': 'Invalid channel name'}, 400)
 
 			channel_repo_path = os.path.join(self.directory, 'message', channel)
 			if not os.path.exists(channel_repo_path):
-				return self.send_json_response({'error': 'Channel not found'}, 404)
+				return self.send_json_response(request, {'error': 'Channel not found'}, 404)
 
 			from commit_files import pull_changes
 			if pull_changes(channel_repo_path):
 				# Invalidate cache after successful sync
-				page_cache.invalidate(f'chat/{channel}')
-				git_cache.invalidate(channel)
-				return self.send_json_response({'status': 'success'})
+				cache.invalidate_channel(channel)
+				registry_for(self.directory).invalidate(channel)
+				events.publish('update_required', channel=channel)
+				return self.send_json_response(request, {'status': 'success'})
 			else:
-				return self.send_json_response({'error': 'Sync failed'}, 500)
+				return self.send_json_response(request, {'error': 'Sync failed'}, 500)
 
 		except json.JSONDecodeError as e:
-			return self.send_json_response({'error': f'Invalid JSON: {str(e)}'}, 400)
+			return self.send_json_response(request, {'error': f'Invalid JSON: {str(e)}'}, 400)
 		except Exception as e:
-			return self.send_json_response({'error': str(e)}, 500)
-
-	def send_json_response(self, data: Dict[str, Any], status: int = 200) -> None:
-		"""Send a JSON response with the specified status code"""
-		if not self.wfile:
-			raise RuntimeError("Response writer not properly initialized")
-
-		response = json.dumps(data)
-		response_bytes = response.encode('utf-8')
+			return self.send_json_response(request, {'error': str(e)}, 500)
 
-		self.handler.send_response(status)
-		self.handler.send_header('Content-Type', 'application/json')
-		self.handler.send_header('Content-Length', len(response_bytes))
-		self.handler.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-		self.handler.send_header('Pragma', 'no-cache')
-		self.handler.send_header('Expires', '0')
-		self.handler.end_headers()
-		self.handler.wfile.write(response_bytes)
+	def send_json_response(self, request, data: Dict[str, Any], status: int = 200) -> None:
+		"""Send a JSON response that is never cached"""
+		send_json(request, data, status, NO_STORE)
 
-	def send_error(self, code: int, message: str):
-		"""Send an error as JSON response"""
-		return self.send_json_response({'error': message}, code)
-	
 # end request_handler.py ; marker comment, please do not remove, including this message
\ No newline at end of file
@@ -0,0 +1,29 @@
+# begin template/python3/handlers/responses.py ; marker comment, please do not remove
+# Response writers shared by the handlers.
+import json
+
+# For POST results and other answers that must never be reused
+NO_STORE = {
+	'Cache-Control': 'no-cache, no-store, must-revalidate',
+	'Pragma': 'no-cache',
+	'Expires': '0',
+}
+
+def send_body(request, body, content_type, status=200, headers=None):
+	"""Send a complete response with body (str or bytes) and any extra headers"""
+	if isinstance(body, str):
+		body = body.encode('utf-8')
+	request.send_response(status)
+	request.send_header('Content-Type', content_type)
+	request.send_header('Content-Length', len(body))
+	for name, value in (headers or {}).items():
+		request.send_header(name, value)
+	request.end_headers()
+	request.wfile.write(body)
+
+def send_json(request, data, status=200, headers=None):
+	"""Send data as JSON; Cache-Control defaults to no-cache"""
+	headers = {'Cache-Control': 'no-cache', **(headers or {})}
+	send_body(request, json.dumps(data), 'application/json', status, headers)
+
+# end template/python3/handlers/responses.py ; marker comment, please do not remove
@@ -0,0 +1,106 @@
+# begin template/python3/handlers/router.py ; marker comment, please do not remove
+import re
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+class Route:
+	"""A compiled route: the callable plus a stable name used by middleware"""
+	__slots__ = ('method', 'name', 'func')
+
+	def __init__(self, method: str, name: str, func: Callable):
+		self.method = method
+		self.name = name
+		self.func = func
+
+class Router:
+	"""Route table compiled once at startup and shared by every request.
+
+	Lookups are tried in this order: exact path (dict lookup), path prefix,
+	then regular expression. Regex named groups are passed to the route
+	callable as keyword arguments. Route callables take the live HTTP request
+	handler as their first argument, so the handler objects behind them can
+	be shared singletons that keep no per-request state.
+
+	Middleware:
+	- before hooks are called as hook(request, route) before the route runs;
+	  a hook that returns True has answered the request itself and the
+	  route is skipped.
+	- after hooks are called as hook(request, route, elapsed_seconds) once
+	  the route (or a short-circuiting before hook) has finished.
+	"""
+
+	def __init__(self):
+		self._exact: Dict[Tuple[str, str], Route] = {}
+		self._prefix: Dict[str, List[Tuple[str, Route]]] = {}
+		self._patterns: Dict[str, List[Tuple[re.Pattern, Route]]] = {}
+		self._fallback: Dict[str, Route] = {}
+		self.before_hooks: List[Callable] = []
+		self.after_hooks: List[Callable] = []
+
+	def add(self, method: str, path: str, func: Callable, name: Optional[str] = None):
+		"""Register an exact path"""
+		self._exact[(method, path)] = Route(method, name or path, func)
+
+	def add_prefix(self, method: str, prefix: str, func: Callable, name: Optional[str] = None):
+		"""Register a path prefix; longer prefixes win over shorter ones"""
+		routes = self._prefix.setdefault(method, [])
+		routes.append((prefix, Route(method, name or prefix + '*', func)))
+		routes.sort(key=lambda item: len(item[0]), reverse=True)
+
+	def add_pattern(self, method: str, pattern: str, func: Callable, name: Optional[str] = None):
+		"""Register a regular expression matched against the whole path"""
+		self._patterns.setdefault(method, []).append(
+			(re.compile(pattern), Route(method, name or pattern, func))
+		)
+
+	def set_fallback(self, method: str, func: Callable, name: str = 'fallback'):
+		"""Register the route used when nothing else matches"""
+		self._fallback[method] = Route(method, name, func)
+
+	def before(self, hook: Callable) -> Callable:
+		self.before_hooks.append(hook)
+		return hook
+
+	def after(self, hook: Callable) -> Callable:
+		self.after_hooks.append(hook)
+		return hook
+
+	def resolve(self, method: str, path: str) -> Tuple[Optional[Route], dict]:
+		"""Find the route for a path (query string already stripped)"""
+		route = self._exact.get((method, path))
+		if route is not None:
+			return route, {}
+
+		for prefix, route in self._prefix.get(method, ()):
+			if path.startswith(prefix):
+				return route, {}
+
+		for regex, route in self._patterns.get(method, ()):
+			match = regex.fullmatch(path)
+			if match:
+				return route, match.groupdict()
+
+		return self._fallback.get(method), {}
+
+	def dispatch(self, request, method: str) -> bool:
+		"""Run the route for request.path; returns False if nothing matched"""
+		path = request.path.split('?', 1)[0]
+		route, params = self.resolve(method, path)
+		if route is None:
+			return False
+
+		started = time.perf_counter()
+		try:
+			for hook in self.before_hooks:
+				if hook(request, route):
+					break
+			else:
+				route.func(request, **params)
+		finally:
+			if self.after_hooks:
+				elapsed = time.perf_counter() - started
+				for hook in self.after_hooks:
+					hook(request, route, elapsed)
+		return True
+
+# end template/python3/handlers/router.py ; marker comment, please do not remove
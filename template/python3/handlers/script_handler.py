@@ -4,14 +4,20 @@ import subprocess
 import time
 from typing import List, Tuple
 from config import INTERPRETER_MAP, SCRIPT_TYPES
+import profiling
 
 class ScriptHandler:
-    def __init__(self, request_handler):
-        self.handler = request_handler
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @property
+    def template_directory(self):
+        """Get the template directory path"""
+        return os.path.join(self.directory, 'template', 'python3')
 
     def run_script(self, script_name: str, *args):
         """Run a script with the appropriate interpreter and arguments"""
-        script_path = os.path.join(self.handler.template_directory, script_name)
+        script_path = os.path.join(self.template_directory, script_name)
 
         if not os.path.exists(script_path):
             print(f"Script not found: {script_path}")
@@ -27,12 +33,13 @@ class ScriptHandler:
 
         cmd = [interpreter, script_path] + list(args)
         print(f"Running command: {' '.join(cmd)}")  # Debug logging
-        print(f"Working directory: {self.handler.directory}")  # Debug logging
+        print(f"Working directory: {self.directory}")  # Debug logging
 
         try:
             result = subprocess.run(
                 cmd,
-                cwd=self.handler.directory,
+                cwd=self.directory,
+                env={**os.environ, **profiling.render_env(self.directory)},
                 check=True,
                 capture_output=True,
                 text=True
@@ -49,7 +56,7 @@ class ScriptHandler:
 
     def run_script_if_needed(self, output_filename: str, script_name: str, *args):
         """Run a script if the output file doesn't exist or is outdated"""
-        output_filepath = os.path.join(self.handler.directory, output_filename)
+        output_filepath = os.path.join(self.directory, output_filename)
         if not os.path.exists(output_filepath) or \
            time.time() - os.path.getmtime(output_filepath) > 60:
             print(f"Generating {output_filename}...")
@@ -6,15 +6,15 @@ from pathlib import Path
 from config import MIME_TYPES
 
 class StaticFileHandler:
-    def __init__(self, request_handler):
-        self.handler = request_handler
+    def __init__(self, directory):
+        self.directory = directory
 
-    def serve_static_file(self, path):
+    def serve_static_file(self, request, path):
         """Serve a static file"""
-        file_path = os.path.join(self.handler.directory, path)
+        file_path = os.path.join(self.directory, path)
 
         if not os.path.isfile(file_path):
-            template_path = os.path.join(self.handler.directory, 'template', path)
+            template_path = os.path.join(self.directory, 'template', path)
             if os.path.isfile(template_path):
                 file_path = template_path
 
@@ -23,22 +23,22 @@ class StaticFileHandler:
                 with open(file_path, 'rb') as f:
                     content = f.read()
                 content_type = self.get_content_type(file_path)
-                self.handler.send_response(200)
-                self.handler.send_header('Content-type', content_type)
-                self.handler.send_header('Cache-Control', 'public, max-age=3600')
-                self.handler.end_headers()
-                self.handler.wfile.write(content)
+                request.send_response(200)
+                request.send_header('Content-type', content_type)
+                request.send_header('Cache-Control', 'public, max-age=3600')
+                request.end_headers()
+                request.wfile.write(content)
             except Exception as e:
                 print(f"Error serving {file_path}: {e}")
-                self.handler.send_error(500, f"Internal server error: {str(e)}")
+                request.send_error(500, f"Internal server error: {str(e)}")
         else:
-            self.handler.send_error(404, f"File not found: {path}")
+            request.send_error(404, f"File not found: {path}")
 
     def ensure_index_html(self):
         """Ensure index.html exists in the home directory"""
-        home_index = os.path.join(self.handler.directory, 'index.html')
+        home_index = os.path.join(self.directory, 'index.html')
         if not os.path.exists(home_index):
-            template_index = os.path.join(self.handler.directory, 'template', 'html', 'index.html')
+            template_index = os.path.join(self.directory, 'template', 'html', 'index.html')
             if os.path.exists(template_index):
                 with open(template_index, 'r', encoding='utf-8') as src:
                     content = src.read()
@@ -51,22 +51,22 @@ class StaticFileHandler:
         ext = os.path.splitext(file_path)[1][1:].lower()
         return MIME_TYPES.get(ext, 'application/octet-stream')
 
-    def serve_text_file_as_html(self):
+    def serve_text_file_as_html(self, request):
         """Serve a text file as HTML"""
-        path = os.path.join(self.handler.directory, self.handler.path[1:])
+        path = os.path.join(self.directory, request.path.split('?', 1)[0][1:])
         try:
             with open(path, 'r', encoding='utf-8') as f:
                 content = f.read()
 
-            self.handler.send_response(200)
-            self.handler.send_header("Content-type", "text/html; charset=utf-8")
-            self.handler.end_headers()
+            request.send_response(200)
+            request.send_header("Content-type", "text/html; charset=utf-8")
+            request.end_headers()
 
             escaped_content = html.escape(content)
             html_content = self.generate_html_content(os.path.basename(path), escaped_content)
-            self.handler.wfile.write(html_content.encode('utf-8'))
+            request.wfile.write(html_content.encode('utf-8'))
         except IOError:
-            self.handler.send_error(404, "File not found")
+            request.send_error(404, "File not found")
 
     @staticmethod
     def generate_html_content(title, content):
@@ -7,10 +7,87 @@ from handlers.request_handler import RequestHandler
 from handlers.static_handler import StaticFileHandler
 from handlers.chat_handler import ChatHandler
 from handlers.script_handler import ScriptHandler
+from handlers.metrics_handler import MetricsHandler
+from handlers.admin_handler import AdminHandler
+from handlers.router import Router
+import metrics
+import profiling
+
+def build_router(directory):
+	"""Create the shared handler singletons and compile the route table"""
+	script_handler = ScriptHandler(directory)
+	static_handler = StaticFileHandler(directory)
+	chat_handler = ChatHandler(directory, script_handler, static_handler)
+	request_handler = RequestHandler(directory, chat_handler, script_handler)
+	metrics_handler = MetricsHandler()
+	admin_handler = AdminHandler()
+
+	def request_path(request):
+		return request.path.split('?', 1)[0]
+
+	def serve_static(request):
+		static_handler.serve_static_file(request, request_path(request)[1:])
+
+	def serve_index(request):
+		static_handler.ensure_index_html()
+		static_handler.serve_static_file(request, 'index.html')
+
+	def serve_channel(request):
+		chat_handler.handle_chat_get_request(request, request_path(request))
+
+	def serve_general(request):
+		chat_handler.generate_and_serve_chat(request, 'general')
+
+	def event_stream_unavailable(request):
+		# The unified server answers /events on its loop before routing
+		request.send_error(501, "Event stream requires the unified server (--unified)")
+
+	def not_found(request):
+		request.send_error(404, "File not found")
+
+	router = Router()
+	router.before(profiling.before_route)
+	router.after(profiling.after_route)
+	router.after(metrics.route_timer)
+
+	# GET routes
+	router.add_prefix('GET', '/css/', serve_static)
+	router.add_prefix('GET', '/js/', serve_static)
+	router.add('GET', '/', serve_index)
+	router.add('GET', '/index.html', serve_index)
+	router.add('GET', '/log.html', chat_handler.generate_and_serve_report)
+	router.add_prefix('GET', '/chat/', serve_channel)
+	router.add('GET', '/chat.html', serve_general)
+	router.add('GET', '/api/search', chat_handler.handle_search)
+	router.add('GET', '/api/channels', chat_handler.handle_channels)
+	router.add('GET', '/events', event_stream_unavailable)
+	router.add('GET', '/metrics', metrics_handler.serve_metrics)
+	router.add('GET', '/metrics.json', metrics_handler.serve_metrics_json)
+	router.add('GET', '/admin/profile', admin_handler.serve_profile_settings)
+	router.add_pattern('GET', r'/api/chat/(?P<channel>[A-Za-z0-9_-]+)/since/(?P<cursor>[A-Za-z0-9_-]*)',
+					   chat_handler.handle_since, name='/api/chat/*/since/*')
+	router.add_pattern('GET', r'/api/message/(?P<channel>[A-Za-z0-9_-]+)/(?P<message_id>[A-Za-z0-9_-]+)',
+					   chat_handler.handle_message, name='/api/message/*/*')
+	router.add_pattern('GET', r'/thread/(?P<message_id>[A-Za-z0-9_-]+?)(?:\.html)?', chat_handler.handle_thread, name='/thread/*')
+	router.add_pattern('GET', r'/api/thread/(?P<message_id>[A-Za-z0-9_-]+)', chat_handler.handle_thread_api,
+					   name='/api/thread/*')
+	router.add_pattern('GET', r'.*\.txt', static_handler.serve_text_file_as_html, name='*.txt')
+	router.set_fallback('GET', not_found)
+
+	# POST routes
+	router.add('POST', '/sync', request_handler.handle_sync_request)
+	router.add('POST', '/post', request_handler.handle_chat_post)
+	router.add('POST', '/post/batch', request_handler.handle_batch_post)
+	router.add('POST', '/chat.html', request_handler.handle_chat_post)
+	router.add('POST', '/admin/profile', admin_handler.update_profile_settings)
+	router.set_fallback('POST', request_handler.method_not_allowed)
+
+	return router
 
 class CustomHTTPRequestHandler(SimpleHTTPRequestHandler):
 	static_files_initialized = False
 	base_directory = None  # Class variable to store the base directory
+	router = None  # Compiled once, shared by every request
 
 	def setup(self):
 		"""Set up the handler before processing requests"""
@@ -21,11 +98,8 @@ class CustomHTTPRequestHandler(SimpleHTTPRequestHandler):
 		# Set instance directory
 		self.directory = CustomHTTPRequestHandler.base_directory
 
-		# Initialize all handlers before parent setup
-		self.script_handler = ScriptHandler(self)
-		self.static_handler = StaticFileHandler(self)
-		self.chat_handler = ChatHandler(self)
-		self.request_handler = RequestHandler(self)
+		if CustomHTTPRequestHandler.router is None:
+			CustomHTTPRequestHandler.router = build_router(self.directory)
 
 		# Call parent setup last
 		super().setup()
@@ -49,30 +123,17 @@ class CustomHTTPRequestHandler(SimpleHTTPRequestHandler):
 		return os.path.join(self.directory, 'template', 'python3')
 
 	def do_GET(self):
-		"""Handle GET requests with improved channel validation"""
-		if self.path.startswith(('/css/', '/js/')):
-			self.static_handler.serve_static_file(self.path[1:])
-		elif self.path in ['/', '/index.html']:
-			self.static_handler.ensure_index_html()
-			self.static_handler.serve_static_file('index.html')
-		elif self.path == '/log.html':
-			self.chat_handler.generate_and_serve_report()
-		elif self.path.startswith('/chat/'):
-			self.chat_handler.handle_chat_get_request(self.path)
-		elif self.path == '/chat.html':
-			self.chat_handler.generate_and_serve_chat('general')
-		elif self.path.endswith('.txt'):
-			self.static_handler.serve_text_file_as_html()
-		else:
-			self.send_error(404, "File not found")
+		"""Handle GET requests through the shared route table"""
+		self.router.dispatch(self, 'GET')
 
 	def do_POST(self):
-		"""Handle POST requests"""
-		self.request_handler.handle_post_request(self.path)
+		"""Handle POST requests through the shared route table"""
+		self.router.dispatch(self, 'POST')
 
 	@classmethod
 	def setup_static_files(cls, directory):
 		"""Setup static files by copying them from template to static directories"""
 		cls.base_directory = directory
 		StaticFileHandler.setup_static_files(cls, directory)
-# end http_handler.py ; marker comment, please include this, including this comment
\ No newline at end of file
+		cls.router = build_router(directory)
+# end http_handler.py ; marker comment, please include this, including this comment
@@ -0,0 +1,218 @@
+# begin template/python3/metrics.py ; marker comment, please do not remove
+
+# Process-wide instrumentation: counters, gauges and latency histograms.
+# Recording is a bisect plus a few integer updates on a metric object that
+# callers look up once and keep, so it stays under a microsecond per event;
+# formatting only happens when /metrics is read. Updates take no lock: under
+# heavy thread contention an increment can very rarely be lost, which is an
+# acceptable trade for monitoring data.
+#
+# Usage:
+#   metrics.counter('git_commands_total', command='fetch').inc()
+#   metrics.histogram('render_seconds', page='chat').observe(0.12)
+#   metrics.gauge('websocket_clients', lambda: len(clients))
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Tuple
+
+# Upper bounds in seconds, from 0.5 ms to 10 s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+	'http_request_seconds': 'Time spent handling a request, by route',
+	'render_seconds': 'Time spent rendering a page',
+	'cache_hits_total': 'Cache lookups that returned a value',
+	'cache_misses_total': 'Cache lookups that found nothing usable',
+	'cache_evictions_total': 'Cache entries removed by expiry or capacity',
+	'cache_entries': 'Entries held by a cache',
+	'cache_bytes': 'Approximate bytes held by a cache',
+	'git_commands_total': 'Git commands run',
+	'git_command_seconds': 'Time spent running git commands',
+	'websocket_clients': 'Connected WebSocket clients',
+	'event_stream_clients': 'Connected Server-Sent Events clients',
+	'template_loads_total': 'Template files read and parsed',
+	'singleflight_calls_total': 'Calls that ran, or joined a call already running for the same key',
+	'stale_pages_served_total': 'Previously rendered pages served while a fresh render ran',
+	'watcher_events_total': 'Message file changes seen by the watcher',
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+	if not labels:
+		return ()
+	return tuple(sorted(labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+	pairs = list(key) + ([extra] if extra else [])
+	if not pairs:
+		return ''
+	escaped = ('{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+	return '{' + ','.join(escaped) + '}'
+
+class Counter:
+	__slots__ = ('value',)
+
+	def __init__(self):
+		self.value = 0
+
+	def inc(self, amount: int = 1):
+		self.value += amount
+
+class Histogram:
+	__slots__ = ('bounds', 'counts', 'sum', 'count')
+
+	def __init__(self, bounds=DEFAULT_BUCKETS):
+		self.bounds = bounds
+		self.counts = [0] * (len(bounds) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value: float):
+		self.counts[bisect_left(self.bounds, value)] += 1
+		self.sum += value
+		self.count += 1
+
+	def time(self):
+		"""Context manager that observes the elapsed time of its block"""
+		return _Timer(self)
+
+	def snapshot(self):
+		counts = list(self.counts)
+		# Report the bucket total so count and buckets always agree
+		return counts, self.sum, sum(counts)
+
+class _Timer:
+	__slots__ = ('histogram', 'started')
+
+	def __init__(self, histogram: Histogram):
+		self.histogram = histogram
+
+	def __enter__(self):
+		self.started = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self.histogram.observe(time.perf_counter() - self.started)
+		return False
+
+class Registry:
+	"""All metrics of the process, keyed by name and label set"""
+
+	def __init__(self):
+		self._counters: Dict[str, Dict[LabelKey, Counter]] = {}
+		self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+		self._gauges: Dict[str, Dict[LabelKey, Callable[[], float]]] = {}
+		self._lock = threading.Lock()
+
+	def counter(self, name: str, **labels) -> Counter:
+		key = _label_key(labels)
+		family = self._counters.get(name)
+		if family is not None:
+			metric = family.get(key)
+			if metric is not None:
+				return metric
+		with self._lock:
+			return self._counters.setdefault(name, {}).setdefault(key, Counter())
+
+	def histogram(self, name: str, **labels) -> Histogram:
+		key = _label_key(labels)
+		family = self._histograms.get(name)
+		if family is not None:
+			metric = family.get(key)
+			if metric is not None:
+				return metric
+		with self._lock:
+			return self._histograms.setdefault(name, {}).setdefault(key, Histogram())
+
+	def gauge(self, name: str, callback: Callable[[], float], **labels):
+		"""Register a gauge whose value is read from callback at export time"""
+		with self._lock:
+			self._gauges.setdefault(name, {})[_label_key(labels)] = callback
+
+	def reset(self):
+		with self._lock:
+			self._counters.clear()
+			self._histograms.clear()
+			self._gauges.clear()
+			_route_histograms.clear()
+
+	def as_dict(self) -> dict:
+		"""JSON-friendly snapshot of every metric"""
+		data = {'counters': {}, 'gauges': {}, 'histograms': {}}
+		for name, family in list(self._counters.items()):
+			data['counters'][name] = [
+				{'labels': dict(key), 'value': metric.value} for key, metric in list(family.items())
+			]
+		for name, family in list(self._gauges.items()):
+			data['gauges'][name] = [
+				{'labels': dict(key), 'value': _read_gauge(callback)} for key, callback in list(family.items())
+			]
+		for name, family in list(self._histograms.items()):
+			entries = []
+			for key, metric in list(family.items()):
+				counts, total, count = metric.snapshot()
+				entries.append({
+					'labels': dict(key),
+					'count': count,
+					'sum': total,
+					'buckets': dict(zip([str(bound) for bound in metric.bounds] + ['+Inf'], counts)),
+				})
+			data['histograms'][name] = entries
+		return data
+
+	def render_prometheus(self) -> str:
+		"""Prometheus text exposition format (version 0.0.4)"""
+		lines = []
+		for name, family in sorted(self._counters.items()):
+			_header(lines, name, 'counter')
+			for key, metric in sorted(family.items()):
+				lines.append(f"{name}{_format_labels(key)} {metric.value}")
+		for name, family in sorted(self._gauges.items()):
+			_header(lines, name, 'gauge')
+			for key, callback in sorted(family.items()):
+				lines.append(f"{name}{_format_labels(key)} {_read_gauge(callback)}")
+		for name, family in sorted(self._histograms.items()):
+			_header(lines, name, 'histogram')
+			for key, metric in sorted(family.items()):
+				counts, total, count = metric.snapshot()
+				cumulative = 0
+				for bound, bucket_count in zip(metric.bounds, counts):
+					cumulative += bucket_count
+					lines.append(f"{name}_bucket{_format_labels(key, ('le', repr(bound)))} {cumulative}")
+				lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {count}")
+				lines.append(f"{name}_sum{_format_labels(key)} {total}")
+				lines.append(f"{name}_count{_format_labels(key)} {count}")
+		return '\n'.join(lines) + '\n'
+
+def _header(lines, name, kind):
+	if name in HELP:
+		lines.append(f"# HELP {name} {HELP[name]}")
+	lines.append(f"# TYPE {name} {kind}")
+
+def _read_gauge(callback) -> float:
+	try:
+		return callback()
+	except Exception:
+		return float('nan')
+
+# The process-wide registry and shortcuts to it
+registry = Registry()
+counter = registry.counter
+histogram = registry.histogram
+gauge = registry.gauge
+
+_route_histograms: Dict[object, Histogram] = {}
+
+def route_timer(request, route, elapsed):
+	"""Router after-hook recording per-route request latency"""
+	metric = _route_histograms.get(route)
+	if metric is None:
+		metric = _route_histograms[route] = registry.histogram(
+			'http_request_seconds', method=route.method, route=route.name
+		)
+	metric.observe(elapsed)
+
+# end template/python3/metrics.py ; marker comment, please do not remove
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+# begin template/python3/migrate_layout.py ; marker comment, please do not remove
+# to run: python3 migrate_layout.py -d REPO [--layout sharded|flat]
+
+# Moves message files between the flat layout (message/<channel>/<id>.txt)
+# and the sharded layout (message/<channel>/YYYY/MM/DD/<id>.txt); see
+# config.MESSAGE_LAYOUT. Tracked files are moved with git mv and the moves
+# committed, so git log --follow keeps each message's history; untracked
+# files are renamed. Manifest entries move with their files, so nothing is
+# parsed again. Set GITYAP_MESSAGE_LAYOUT to the new layout before starting
+# the server again, or new posts land in the old one (both are readable).
+
+import argparse
+import os
+import shlex
+import sys
+
+from chat.channel_manager import message_path
+from chat.manifest import manifest_for
+from commit_files import git_toplevel, run_git, tracked_files
+
+# Paths per git mv command line
+GIT_MV_BATCH = 200
+
+def plan_moves(message_dir, channels, layout):
+	"""[(source, target)] of every message file not where layout puts it"""
+	moves = []
+	for channel in channels:
+		for root, dirs, files in os.walk(os.path.join(message_dir, channel)):
+			dirs[:] = [name for name in dirs if not name.startswith('.')]
+			for name in files:
+				if not name.endswith('.txt'):
+					continue
+				source = os.path.join(root, name)
+				target = message_path(message_dir, channel, name[:-len('.txt')], layout)
+				if source != target:
+					moves.append((source, target))
+	return sorted(moves)
+
+def git_move(toplevel, sources, target_dir):
+	"""git mv sources into target_dir; returns whether every batch succeeded"""
+	ok = True
+	for start in range(0, len(sources), GIT_MV_BATCH):
+		batch = sources[start:start + GIT_MV_BATCH]
+		paths = ' '.join(shlex.quote(os.path.relpath(path, toplevel)) for path in batch)
+		returncode, _, error = run_git(
+			f"git mv -- {paths} {shlex.quote(os.path.relpath(target_dir, toplevel))}/", toplevel)
+		if returncode != 0:
+			print(f"Error moving files to {target_dir}: {error}")
+			ok = False
+	return ok
+
+def remove_empty_dirs(channel_dir):
+	"""Drop shard directories left empty by the move (bottom-up, never the channel itself)"""
+	for root, dirs, files in os.walk(channel_dir, topdown=False):
+		if root == channel_dir or os.path.basename(root).startswith('.'):
+			continue
+		try:
+			os.rmdir(root)
+		except OSError:
+			pass  # Not empty
+
+def migrate(repo_path, layout, channels=None, use_git=True, commit=True, dry_run=False):
+	"""Move every message file of channels (default: all) to layout; returns the number moved"""
+	repo_path = os.path.abspath(repo_path)
+	message_dir = os.path.join(repo_path, 'message')
+	if channels is None:
+		channels = sorted(entry.name for entry in os.scandir(message_dir)
+						  if entry.is_dir() and not entry.name.startswith('.'))
+	manifest = manifest_for(repo_path)
+	moved = 0
+	for channel in channels:
+		channel_dir = os.path.join(message_dir, channel)
+		moves = plan_moves(message_dir, [channel], layout)
+		if not moves:
+			print(f"{channel}: already {layout}")
+			continue
+		print(f"{channel}: moving {len(moves)} files to the {layout} layout")
+		if dry_run:
+			for source, target in moves[:10]:
+				print(f"  {os.path.relpath(source, repo_path)} -> {os.path.relpath(target, repo_path)}")
+			if len(moves) > 10:
+				print(f"  ... and {len(moves) - 10} more")
+			continue
+
+		# Entries are looked up before the move; rename keeps mtime and size
+		entries = {source: manifest.lookup(source) for source, _ in moves}
+
+		toplevel = git_toplevel(channel_dir) if use_git else None
+		tracked = tracked_files(toplevel, channel_dir) if toplevel else set()
+		by_target_dir = {}
+		for source, target in moves:
+			os.makedirs(os.path.dirname(target), exist_ok=True)
+			if source in tracked:
+				by_target_dir.setdefault(os.path.dirname(target), []).append(source)
+			else:
+				os.replace(source, target)
+		git_ok = all([git_move(toplevel, sources, target_dir) for target_dir, sources in sorted(by_target_dir.items())])
+
+		for source, target in moves:
+			if os.path.exists(source):
+				continue  # git mv failed for it
+			manifest.forget(source)
+			if entries[source] is not None:
+				manifest.store(target, entries[source])
+			moved += 1
+		manifest.save()
+		remove_empty_dirs(channel_dir)
+
+		if toplevel and by_target_dir and commit:
+			message = f"Move {channel} messages to the {layout} layout"
+			returncode, _, error = run_git(
+				f"git commit -q -m {shlex.quote(message)} -- {shlex.quote(os.path.relpath(channel_dir, toplevel))}",
+				toplevel)
+			if returncode != 0:
+				print(f"Error committing moves in {channel}: {error}")
+		if not git_ok:
+			print(f"{channel}: some files could not be moved, see above")
+	return moved
+
+def main():
+	parser = argparse.ArgumentParser(description="Move message files between the flat and the date-sharded layout.")
+	parser.add_argument('-d', '--directory', type=str, default=os.getcwd(),
+					   help='Repository to migrate (default: current directory)')
+	parser.add_argument('-l', '--layout', choices=('sharded', 'flat'), default='sharded',
+					   help='Target layout (default: sharded)')
+	parser.add_argument('-c', '--channel', action='append', dest='channels',
+					   help='Only this channel (may be repeated; default: every channel)')
+	parser.add_argument('-n', '--dry-run', action='store_true', help='Show what would move, change nothing')
+	parser.add_argument('--no-git', action='store_true', help='Rename files without git mv')
+	parser.add_argument('--no-commit', action='store_true', help='Leave the git mv renames staged, uncommitted')
+	args = parser.parse_args()
+
+	if not os.path.isdir(os.path.join(args.directory, 'message')):
+		print(f"No message directory in {args.directory}")
+		sys.exit(1)
+	moved = migrate(args.directory, args.layout, channels=args.channels, use_git=not args.no_git,
+					commit=not args.no_commit, dry_run=args.dry_run)
+	if not args.dry_run:
+		print(f"Moved {moved} files. Set GITYAP_MESSAGE_LAYOUT={args.layout} so new posts follow.")
+
+if __name__ == "__main__":
+	main()
+
+# end template/python3/migrate_layout.py ; marker comment, please do not remove
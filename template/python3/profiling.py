@@ -0,0 +1,193 @@
+# begin template/python3/profiling.py ; marker comment, please do not remove
+
+# On-demand profiling hooks.
+# - Route sampling: a router before/after hook pair profiles a fraction of
+#   requests (settings.sample_rate) and dumps each profile to settings.directory.
+# - Inline: an admin request with ?profile=1 gets the profile back as its
+#   response instead of the page.
+# - Render path: when settings.render is on, chat.html.py runs under cProfile
+#   and so does every Pool worker it starts; the server passes this down
+#   through the GITYAP_PROFILE_DIR environment variable.
+# Dumps are written as .pstats (load with pstats/snakeviz) and .collapsed
+# (caller;callee self-time in microseconds, for flamegraph.pl).
+
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import time
+import urllib.parse
+from contextlib import contextmanager
+from multiprocessing import util as mp_util
+
+from config import PROFILE_SAMPLE_RATE, PROFILE_RENDER, PROFILE_DIR, ADMIN_TOKEN
+
+PROFILE_ENV = 'GITYAP_PROFILE_DIR'
+INLINE_LINES = 60
+
+class ProfileSettings:
+	"""Mutable process-wide settings, changed at runtime via /admin/profile"""
+
+	def __init__(self):
+		self.sample_rate = PROFILE_SAMPLE_RATE
+		self.render = PROFILE_RENDER
+		self.directory = PROFILE_DIR
+
+	def as_dict(self):
+		return {'sample_rate': self.sample_rate, 'render': self.render, 'directory': self.directory}
+
+	def path(self, base_directory=None):
+		"""Absolute dump directory; relative paths are taken from base_directory"""
+		if os.path.isabs(self.directory):
+			return self.directory
+		return os.path.abspath(os.path.join(base_directory or os.getcwd(), self.directory))
+
+	def update(self, data):
+		if 'sample_rate' in data:
+			self.sample_rate = min(1.0, max(0.0, float(data['sample_rate'])))
+		if 'render' in data:
+			self.render = bool(data['render'])
+		if data.get('directory'):
+			self.directory = str(data['directory'])
+
+settings = ProfileSettings()
+
+def is_admin(request):
+	"""True if the request carries the admin token (or is local when none is set)"""
+	if ADMIN_TOKEN:
+		query = urllib.parse.parse_qs(urllib.parse.urlparse(request.path).query)
+		token = request.headers.get('X-Admin-Token') or query.get('token', [''])[0]
+		return token == ADMIN_TOKEN
+	host = request.client_address[0] if request.client_address else ''
+	return host in ('127.0.0.1', '::1', 'localhost')
+
+def _slug(name):
+	return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') or 'root'
+
+def function_label(func):
+	filename, line, name = func
+	return f"{os.path.basename(filename)}:{line}({name})"
+
+def collapsed_lines(stats):
+	"""Caller;callee pairs weighted by the callee's self time (microseconds)"""
+	lines = []
+	for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+		label = function_label(func)
+		if not callers:
+			if tt > 0:
+				lines.append(f"{label} {int(tt * 1e6)}")
+			continue
+		for caller, caller_stats in callers.items():
+			# caller_stats is (nc, cc, tt, ct) of this callee when called from caller
+			self_time = caller_stats[2] if isinstance(caller_stats, tuple) else 0
+			if self_time > 0:
+				lines.append(f"{function_label(caller)};{label} {int(self_time * 1e6)}")
+	return lines
+
+def write_profile(profile, name, directory=None):
+	"""Dump a profile as .pstats and .collapsed; returns the .pstats path"""
+	directory = directory or settings.path()
+	os.makedirs(directory, exist_ok=True)
+	base = os.path.join(directory, f"{_slug(name)}-{time.strftime('%Y%m%d_%H%M%S')}-{os.getpid()}-{random.randrange(1 << 16):04x}")
+	profile.dump_stats(base + '.pstats')
+	stats = pstats.Stats(profile)
+	with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+		f.write('\n'.join(collapsed_lines(stats)) + '\n')
+	return base + '.pstats'
+
+def format_profile(profile, limit=INLINE_LINES):
+	"""Text report sorted by cumulative time"""
+	buffer = io.StringIO()
+	stats = pstats.Stats(profile, stream=buffer)
+	stats.sort_stats('cumulative').print_stats(limit)
+	return buffer.getvalue()
+
+# Router middleware
+
+def before_route(request, route):
+	inline = False
+	if 'profile=1' in request.path:
+		query = urllib.parse.parse_qs(urllib.parse.urlparse(request.path).query)
+		inline = query.get('profile', [''])[0] == '1' and is_admin(request)
+	sampled = settings.sample_rate > 0 and random.random() < settings.sample_rate
+	if not (inline or sampled):
+		return False
+
+	request.profile_state = (cProfile.Profile(), inline, sampled, request.wfile)
+	if inline:
+		# Capture the page so the profile can be sent in its place
+		request.wfile = io.BytesIO()
+	request.profile_state[0].enable()
+	return False
+
+def after_route(request, route, elapsed):
+	state = getattr(request, 'profile_state', None)
+	if state is None:
+		return
+	profile, inline, sampled, wfile = state
+	profile.disable()
+	request.profile_state = None
+
+	if sampled:
+		try:
+			write_profile(profile, f"route-{route.method}-{route.name}", settings.path(request.directory))
+		except OSError as e:
+			print(f"Error writing profile: {e}")
+
+	if inline:
+		request.wfile = wfile
+		body = f"Profile of {route.method} {request.path} ({elapsed * 1000:.1f} ms)\n\n{format_profile(profile)}".encode('utf-8')
+		request.send_response(200)
+		request.send_header('Content-Type', 'text/plain; charset=utf-8')
+		request.send_header('Content-Length', len(body))
+		request.send_header('Cache-Control', 'no-store')
+		request.end_headers()
+		request.wfile.write(body)
+
+# Render path (runs inside chat.html.py and its Pool workers)
+
+def render_env(base_directory=None):
+	"""Environment additions that switch on render profiling in a script"""
+	if not settings.render:
+		return {}
+	return {PROFILE_ENV: settings.path(base_directory)}
+
+def render_profile_dir():
+	return os.environ.get(PROFILE_ENV)
+
+@contextmanager
+def profile_render(name):
+	"""Profile the enclosed render when the server asked for it"""
+	directory = render_profile_dir()
+	if not directory:
+		yield
+		return
+	profile = cProfile.Profile()
+	profile.enable()
+	try:
+		yield
+	finally:
+		profile.disable()
+		write_profile(profile, f"render-{name}", directory)
+
+def _start_worker_profile(directory):
+	profile = cProfile.Profile()
+	profile.enable()
+
+	def finish():
+		profile.disable()
+		write_profile(profile, 'render-worker', directory)
+
+	# Runs when the worker exits normally (pool.close() + pool.join())
+	mp_util.Finalize(None, finish, exitpriority=100)
+
+def pool_options():
+	"""Keyword arguments for multiprocessing.Pool that profile each worker"""
+	directory = render_profile_dir()
+	if not directory:
+		return {}
+	return {'initializer': _start_worker_profile, 'initargs': (directory,)}
+
+# end template/python3/profiling.py ; marker comment, please do not remove
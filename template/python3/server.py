@@ -4,6 +4,8 @@
 
 import argparse
 import os
+import time
+from collections import OrderedDict
 from http_handler import CustomHTTPRequestHandler
 from utils import is_port_in_use, find_available_port
 import socketserver
@@ -11,35 +13,217 @@ import asyncio
 import websockets
 from typing import Set
 import json
+import events
+import metrics
+from broadcast import Broadcaster, OVERFLOW_POLICIES
+from subscriptions import ChannelFanout
+from config import WS_QUEUE_SIZE, WS_OVERFLOW_POLICY, WATCH_MESSAGES, WATCH_BACKEND, SSE_REPLAY_LIMIT
+import cache
+import watcher
+import sse
+
+# A new message announced by both the post handler and the watcher within
+# this many seconds is only sent to clients once
+UPDATE_DEDUP_WINDOW = 2.0
 
 class ChatServer:
-	def __init__(self, port: int, directory: str):
+	def __init__(self, port: int, directory: str, ws_queue_size: int = WS_QUEUE_SIZE,
+				 ws_overflow: str = WS_OVERFLOW_POLICY, watch: bool = WATCH_MESSAGES,
+				 watch_backend: str = WATCH_BACKEND):
 		self.port = port
 		self.directory = directory
+		self.watch = watch
+		self.watch_backend = watch_backend
+		self.watcher = None
+		self.recent_updates: 'OrderedDict[tuple, tuple]' = OrderedDict()
 		self.http_server = None
 		self.websocket_server = None
 		self.connected_clients: Set[websockets.WebSocketServerProtocol] = set()
+		self.event_streams: Set[sse.EventStream] = set()
+		self.broadcaster = Broadcaster(max_queue=ws_queue_size, overflow=ws_overflow)
+		self.fanout = ChannelFanout(self.broadcaster)
+		self.register_metrics()
+
+	def register_metrics(self):
+		"""Expose WebSocket client and delivery figures through /metrics"""
+		metrics.gauge('websocket_clients', lambda: len(self.connected_clients))
+		metrics.gauge('event_stream_clients', lambda: len(self.event_streams))
+		stats = self.broadcaster.stats
+		metrics.gauge('websocket_frames_delivered', lambda: stats.delivered)
+		metrics.gauge('websocket_frames_dropped', lambda: stats.dropped)
+		metrics.gauge('websocket_clients_disconnected', lambda: stats.disconnected)
+		metrics.gauge('websocket_delivery_lag_max_seconds', lambda: stats.lag_max)
+		metrics.gauge('websocket_delivery_lag_avg_seconds',
+			lambda: stats.lag_total / stats.delivered if stats.delivered else 0.0)
+
+	def publish_event(self, event: dict):
+		"""Forward an event published by a handler to its channel's subscribers"""
+		if event.get('type') == 'update_required' and event.get('message_id') and event.get('change', 'add') == 'add':
+			if self.is_duplicate_update(event['channel'], event['message_id'], event.get('source')):
+				return
+		self.fanout.publish(event)
+
+	def is_duplicate_update(self, channel, message_id, source) -> bool:
+		"""True if the other source (post handler or watcher) announced this
+		new message within UPDATE_DEDUP_WINDOW"""
+		now = time.monotonic()
+		while self.recent_updates:
+			oldest_key, (seen, _) = next(iter(self.recent_updates.items()))
+			if now - seen < UPDATE_DEDUP_WINDOW:
+				break
+			del self.recent_updates[oldest_key]
+		key = (channel, message_id)
+		previous = self.recent_updates.get(key)
+		if previous is not None and previous[1] != source:
+			return True
+		self.recent_updates[key] = (now, source)
+		self.recent_updates.move_to_end(key)
+		return False
+
+	def warm_indexes(self):
+		"""Build the reply-thread index in the background instead of in the first request"""
+		from chat.thread_index import thread_index_for
+		thread_index_for(self.directory).warm()
+
+	def start_watcher(self):
+		"""Watch message/ and turn file changes into index, cache and client updates"""
+		if not self.watch or self.watcher is not None:
+			return
+		message_dir = os.path.join(self.directory, 'message')
+		self.watcher = watcher.create_watcher(message_dir, self.handle_file_changes, self.watch_backend)
+		self.watcher.start()
+		print(f"Watching {message_dir} ({type(self.watcher).__name__})")
+
+	def handle_file_changes(self, changes):
+		"""Runs on the watcher thread for every batch of changes"""
+		from chat.manifest import manifest_for
+		from chat.channel_registry import registry_for
+		manifest = manifest_for(self.directory)
+		channels = set()
+		rescan = False
+		for change in changes:
+			metrics.counter('watcher_events_total', kind=change.kind).inc()
+			if change.kind == watcher.RESCAN:
+				rescan = True
+				continue
+			channels.add(change.channel)
+			if change.kind == watcher.DELETE:
+				manifest.forget(change.path)
+			else:
+				try:
+					manifest.get(change.path)
+				except OSError:
+					pass  # Already gone again; its delete event follows
+		manifest.save()
+
+		# Only the pages showing these channels are stale
+		registry = registry_for(self.directory)
+		for channel in channels:
+			cache.invalidate_channel(channel)
+			registry.invalidate(channel)
+		if rescan:
+			# Events were lost; any page may be stale
+			cache.invalidate_pages()
+			registry.invalidate()
+
+		for change in changes:
+			if change.kind == watcher.RESCAN:
+				continue
+			events.publish('update_required', channel=change.channel, message_id=change.message_id,
+						   change=change.kind, source='watcher')
+		if rescan:
+			events.publish('update_required', source='watcher')
 
 	async def register(self, websocket: websockets.WebSocketServerProtocol):
 		self.connected_clients.add(websocket)
+		self.broadcaster.add(websocket)
+		self.fanout.add(websocket)
 		try:
 			async for message in websocket:
-				# Handle incoming WebSocket messages
-				await self.broadcast_message(message)
+				# Clients only send subscription frames. Nothing they send is
+				# relayed: events come from the server (events.publish), so a
+				# client cannot forge update_required for other subscribers
+				self.fanout.handle_message(websocket, message)
+		except Exception as e:
+			print(f"WebSocket client error: {e}")
 		finally:
-			self.connected_clients.remove(websocket)
+			self.fanout.remove(websocket)
+			self.broadcaster.remove(websocket)
+			self.connected_clients.discard(websocket)
 
-	async def broadcast_message(self, message: str):
-		if self.connected_clients:
-			await asyncio.gather(
-				*[client.send(message) for client in self.connected_clients]
+	async def register_event_stream(self, stream: sse.EventStream):
+		"""Serve one /events client until it disconnects"""
+		try:
+			await stream.start()
+		except ConnectionError:
+			return
+		self.event_streams.add(stream)
+		self.broadcaster.add(stream)
+		self.fanout.add(stream)
+		if stream.channels:
+			self.fanout.subscribe(stream, stream.channels)
+		try:
+			if stream.last_event_id:
+				await self.replay_events(stream)
+			await stream.wait_closed(lambda: self.broadcaster.send_to(stream, sse.HEARTBEAT))
+		except Exception as e:
+			print(f"Event stream error: {e}")
+		finally:
+			self.fanout.remove(stream)
+			self.broadcaster.remove(stream)
+			self.event_streams.discard(stream)
+			await stream.close()
+
+	async def replay_events(self, stream: sse.EventStream):
+		"""Announce messages written after the client's Last-Event-ID"""
+		from chat.delta import messages_since
+		loop = asyncio.get_running_loop()
+		for channel in stream.channels or ['everything']:
+			messages, more = await loop.run_in_executor(
+				None, messages_since, self.directory, channel, stream.last_event_id, SSE_REPLAY_LIMIT
 			)
+			if more:
+				# Too many to list; the client reloads the page instead
+				self.broadcaster.send_to(stream, json.dumps({'type': 'update_required', 'channel': channel, 'source': 'replay'}))
+				continue
+			for message in reversed(messages):
+				self.broadcaster.send_to(stream, json.dumps({
+					'type': 'update_required',
+					'channel': message['channel'],
+					'message_id': message['message_id'],
+					'change': 'add',
+					'source': 'replay',
+				}))
+
+	async def broadcast_message(self, message: str):
+		"""Queue a message for every client; slow clients never hold up the rest"""
+		self.broadcaster.broadcast(message)
 
 	async def start_websocket_server(self):
+		events.attach(asyncio.get_running_loop(), self.publish_event)
+		self.start_watcher()
+		self.warm_indexes()
 		async with websockets.serve(self.register, "localhost", self.port + 1):
 			await asyncio.Future()  # run forever
 
-	def run(self):
+	async def start_unified_server(self):
+		"""Serve HTTP and WebSocket (at /ws) on one port from this loop"""
+		from aio_server import UnifiedServer
+
+		os.chdir(self.directory)
+		CustomHTTPRequestHandler.setup_static_files(self.directory)
+		events.attach(asyncio.get_running_loop(), self.publish_event)
+		self.start_watcher()
+		self.warm_indexes()
+		self.http_server = UnifiedServer(self.port, self.directory, self.register,
+										 on_event_stream=self.register_event_stream)
+		await self.http_server.serve_forever()
+
+	def run(self, unified: bool = False):
+		if unified:
+			asyncio.run(self.start_unified_server())
+			return
+
 		# Start HTTP server in a separate thread
 		import threading
 		http_thread = threading.Thread(
@@ -76,6 +260,11 @@ if __name__ == "__main__":
 	parser = argparse.ArgumentParser(description="Run chat server with WebSocket support.")
 	parser.add_argument('-p', '--port', type=int, default=8000, help='Port to serve on (default: 8000)')
 	parser.add_argument('-d', '--directory', type=str, default=os.getcwd(), help='Directory to serve')
+	parser.add_argument('--unified', action='store_true', help='Serve HTTP and WebSocket on one port from a single event loop')
+	parser.add_argument('--ws-queue-size', type=int, default=WS_QUEUE_SIZE, help=f'Outbound frames queued per WebSocket client (default: {WS_QUEUE_SIZE})')
+	parser.add_argument('--no-watch', action='store_true', help='Do not watch message/ for changes made outside the server')
+	parser.add_argument('--watch-backend', choices=('auto', 'inotify', 'poll'), default=WATCH_BACKEND, help=f'How to watch message/ (default: {WATCH_BACKEND})')
+	parser.add_argument('--ws-overflow', choices=OVERFLOW_POLICIES, default=WS_OVERFLOW_POLICY, help=f'What to do when a client queue is full (default: {WS_OVERFLOW_POLICY})')
 
 	args = parser.parse_args()
 
@@ -83,7 +272,8 @@ if __name__ == "__main__":
 		args.port = find_available_port(args.port + 1)
 		print(f"Using port {args.port}...")
 
-	server = ChatServer(args.port, args.directory)
-	server.run()
+	server = ChatServer(args.port, args.directory, ws_queue_size=args.ws_queue_size, ws_overflow=args.ws_overflow,
+						watch=not args.no_watch, watch_backend=args.watch_backend)
+	server.run(unified=args.unified)
 
 # end server.py ; marker comment, please do not remove
\ No newline at end of file
@@ -0,0 +1,83 @@
+# begin template/python3/singleflight.py ; marker comment, please do not remove
+
+# Duplicate-call suppression.
+# SingleFlight.do(key, fn) runs fn once per key at a time: a thread that asks
+# for a key whose call is already running waits for that call and gets the
+# same result (or the same exception) instead of starting its own. Used to
+# render each chat page once however many viewers ask for it together.
+#
+# Usage:
+#   renders = SingleFlight('chat')
+#   content = renders.do('general', lambda: render('general'))
+#   renders.start('general', fn)   # same, in a background thread, no waiting
+
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+
+class _Call:
+	__slots__ = ('done', 'result', 'error')
+
+	def __init__(self):
+		self.done = threading.Event()
+		self.result = None
+		self.error: Optional[BaseException] = None
+
+class SingleFlight:
+	def __init__(self, name: str = 'default'):
+		self._calls: Dict[str, _Call] = {}
+		self._lock = threading.Lock()
+		self._runs = metrics.counter('singleflight_calls_total', flight=name, outcome='run')
+		self._joins = metrics.counter('singleflight_calls_total', flight=name, outcome='joined')
+
+	def _claim(self, key: str):
+		"""(call, True) for the caller that has to run it, (call, False) for waiters"""
+		with self._lock:
+			call = self._calls.get(key)
+			if call is not None:
+				self._joins.inc()
+				return call, False
+			call = self._calls[key] = _Call()
+			self._runs.inc()
+			return call, True
+
+	def _run(self, key: str, call: _Call, fn: Callable[[], Any]):
+		try:
+			call.result = fn()
+		except BaseException as e:
+			call.error = e
+		finally:
+			with self._lock:
+				self._calls.pop(key, None)
+			call.done.set()
+
+	def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+		"""Result of fn, shared with every concurrent caller for key"""
+		call, owner = self._claim(key)
+		if owner:
+			self._run(key, call, fn)
+		elif not call.done.wait(timeout):
+			raise TimeoutError(f"Timed out waiting for {key}")
+		if call.error is not None:
+			raise call.error
+		return call.result
+
+	def start(self, key: str, fn: Callable[[], Any]) -> bool:
+		"""Run fn in a background thread unless a call for key is running; returns whether it started one"""
+		call, owner = self._claim(key)
+		if not owner:
+			return False
+
+		def run():
+			self._run(key, call, fn)
+			if call.error is not None:
+				print(f"Error in background {key}: {call.error}")
+
+		threading.Thread(target=run, name=f"singleflight-{key}", daemon=True).start()
+		return True
+
+	def in_flight(self, key: str) -> bool:
+		return key in self._calls
+
+# end template/python3/singleflight.py ; marker comment, please do not remove
@@ -0,0 +1,115 @@
+# begin template/python3/sse.py ; marker comment, please do not remove
+
+# Server-Sent Events on the HTTP port, for clients that cannot reach the
+# WebSocket endpoint (proxies that drop upgrades or block port + 1).
+#
+#   GET /events?channel=general[,random]
+#   Last-Event-ID: <message id>        (or ?last_event_id=, sent on reconnect)
+#
+# A stream carries the same events as the WebSocket, one SSE event per chat
+# event: "event: <type>" and the event as JSON in "data:". Events about a
+# message carry "id: <message id>", so a reconnecting browser sends the last
+# id it saw and the server replays the messages written since then from the
+# message files, which also works across server restarts.
+#
+# EventStream looks like a WebSocket to Broadcaster and ChannelFanout (send
+# and close), so streams get the same per-client queues, overflow handling
+# and channel filtering. Streams live on the event loop; an idle stream holds
+# no thread, only a socket and a heartbeat timer.
+
+import asyncio
+import json
+import re
+import urllib.parse
+from typing import Any, Dict, List, Optional
+
+from config import SSE_HEARTBEAT_INTERVAL, SSE_RETRY_MS
+
+EVENT_STREAM_PATH = '/events'
+# Queued through the broadcaster like any frame so writes never interleave
+HEARTBEAT = ':heartbeat'
+# What an id or event name may contain; anything else could end the line
+# and inject fields or whole events into the stream
+SAFE_FIELD = re.compile(r'[A-Za-z0-9_-]+')
+LINE_BREAK = re.compile(r'\r\n|\r|\n')
+
+def safe_field(value) -> Optional[str]:
+	"""value if it is safe on an id/event line, else None"""
+	if isinstance(value, str) and SAFE_FIELD.fullmatch(value):
+		return value
+	return None
+
+def format_event(event: Dict[str, Any]) -> str:
+	"""One SSE event; the id is set only for events about a specific message"""
+	lines = []
+	message_id = safe_field(event.get('message_id'))
+	if message_id:
+		lines.append(f"id: {message_id}")
+	lines.append(f"event: {safe_field(event.get('type')) or 'message'}")
+	# Every line of the payload gets its own data: field
+	lines.extend(f"data: {line}" for line in LINE_BREAK.split(json.dumps(event)))
+	return '\n'.join(lines) + '\n\n'
+
+class EventStream:
+	"""One text/event-stream response, written from the event loop"""
+
+	def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str, headers):
+		self.reader = reader
+		self.writer = writer
+		self.path = path
+		query = urllib.parse.parse_qs(urllib.parse.urlparse(path).query)
+		self.channels: List[str] = [
+			channel for value in query.get('channel', []) for channel in value.split(',') if channel
+		]
+		self.last_event_id: Optional[str] = safe_field(
+			headers.get('Last-Event-ID') or query.get('last_event_id', [None])[0]
+		)
+		self.closed = False
+
+	async def start(self):
+		"""Send the response head; the stream stays open until close()"""
+		self.writer.write(
+			b"HTTP/1.1 200 OK\r\n"
+			b"Content-Type: text/event-stream; charset=utf-8\r\n"
+			b"Cache-Control: no-cache\r\n"
+			b"Connection: keep-alive\r\n"
+			# Stop nginx-style proxies from buffering the stream
+			b"X-Accel-Buffering: no\r\n"
+			b"\r\n"
+			+ f"retry: {SSE_RETRY_MS}\n\n".encode('utf-8')
+		)
+		await self.writer.drain()
+
+	async def send(self, message: str):
+		"""Write one broadcaster frame: an event, a batch of events or a heartbeat"""
+		if self.closed:
+			raise ConnectionError("Event stream closed")
+		if message == HEARTBEAT:
+			payload = ': heartbeat\n\n'
+		else:
+			data = json.loads(message)
+			events = data['events'] if data.get('type') == 'batch' else [data]
+			payload = ''.join(format_event(event) for event in events)
+		self.writer.write(payload.encode('utf-8'))
+		await self.writer.drain()
+
+	async def wait_closed(self, heartbeat):
+		"""Return when the client goes away; calls heartbeat() while idle"""
+		while not self.closed:
+			try:
+				data = await asyncio.wait_for(self.reader.read(1024), SSE_HEARTBEAT_INTERVAL)
+			except asyncio.TimeoutError:
+				heartbeat()
+				continue
+			except ConnectionError:
+				break
+			if not data:
+				break
+		self.closed = True
+
+	async def close(self):
+		self.closed = True
+		if not self.writer.is_closing():
+			self.writer.close()
+
+# end template/python3/sse.py ; marker comment, please do not remove
@@ -0,0 +1,152 @@
+# begin template/python3/subscriptions.py ; marker comment, please do not remove
+
+# Channel-scoped WebSocket subscriptions.
+#
+# Protocol (JSON text frames from the client):
+#   {"type": "subscribe", "channels": ["general", "random"]}
+#   {"type": "unsubscribe", "channels": ["random"]}
+# The server answers with {"type": "subscribed", "channels": [...]}.
+# "everything" subscribes to all channels. Clients that never send a
+# subscribe frame are treated as "everything" subscribers, so older pages
+# keep receiving updates.
+#
+# Events published within one tick (WS_COALESCE_INTERVAL) are coalesced:
+# each interested client receives a single frame, either the event itself
+# or {"type": "batch", "events": [...]} when several events apply.
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from broadcast import Broadcaster
+from config import WS_COALESCE_INTERVAL
+
+EVERYTHING = 'everything'
+
+class ChannelFanout:
+	"""Per-channel subscriber sets in front of a Broadcaster"""
+
+	def __init__(self, broadcaster: Broadcaster, interval: float = WS_COALESCE_INTERVAL):
+		self.broadcaster = broadcaster
+		self.interval = interval
+		self.subscribers: Dict[str, Set[Any]] = {}
+		self.client_channels: Dict[Any, Set[str]] = {}
+		self.implicit: Set[Any] = set()
+		self.pending: List[Tuple[Dict[str, Any], float]] = []
+		self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+	def add(self, websocket):
+		"""Register a client; it receives everything until it subscribes"""
+		self.client_channels[websocket] = set()
+		self.implicit.add(websocket)
+		self._join(websocket, [EVERYTHING])
+
+	def remove(self, websocket):
+		for channel in self.client_channels.pop(websocket, ()):
+			members = self.subscribers.get(channel)
+			if members is not None:
+				members.discard(websocket)
+				if not members:
+					del self.subscribers[channel]
+		self.implicit.discard(websocket)
+
+	def subscribe(self, websocket, channels: List[str]):
+		if websocket in self.implicit:
+			self.implicit.discard(websocket)
+			self._leave(websocket, [EVERYTHING])
+		self._join(websocket, channels)
+
+	def unsubscribe(self, websocket, channels: List[str]):
+		self._leave(websocket, channels)
+
+	def _join(self, websocket, channels):
+		joined = self.client_channels.setdefault(websocket, set())
+		for channel in channels:
+			self.subscribers.setdefault(channel, set()).add(websocket)
+			joined.add(channel)
+
+	def _leave(self, websocket, channels):
+		joined = self.client_channels.get(websocket, set())
+		for channel in channels:
+			joined.discard(channel)
+			members = self.subscribers.get(channel)
+			if members is not None:
+				members.discard(websocket)
+				if not members:
+					del self.subscribers[channel]
+
+	def handle_message(self, websocket, raw) -> bool:
+		"""Apply a protocol frame from a client; returns False if it was not one"""
+		try:
+			data = json.loads(raw)
+		except (TypeError, ValueError):
+			return False
+		if not isinstance(data, dict):
+			return False
+
+		kind = data.get('type')
+		if kind not in ('subscribe', 'unsubscribe'):
+			return False
+
+		channels = data.get('channels') or []
+		if isinstance(channels, str):
+			channels = [channels]
+		channels = [str(channel) for channel in channels]
+		if kind == 'subscribe':
+			self.subscribe(websocket, channels)
+		else:
+			self.unsubscribe(websocket, channels)
+
+		self.broadcaster.send_to(websocket, json.dumps({
+			'type': 'subscribed',
+			'channels': sorted(self.client_channels.get(websocket, ())),
+		}))
+		return True
+
+	def publish(self, event: Dict[str, Any]):
+		"""Queue an event for the next tick (must be called on the loop)"""
+		self.pending.append((event, time.monotonic()))
+		if self._flush_handle is None:
+			loop = asyncio.get_running_loop()
+			self._flush_handle = loop.call_later(self.interval, self.flush)
+
+	def targets(self, channel: Optional[str]) -> Set[Any]:
+		"""Clients interested in an event for this channel"""
+		if channel is None:
+			return set(self.client_channels)
+		return self.subscribers.get(channel, set()) | self.subscribers.get(EVERYTHING, set())
+
+	def flush(self):
+		"""Send one coalesced frame to every client with pending events"""
+		self._flush_handle = None
+		pending, self.pending = self.pending, []
+
+		per_client: Dict[Any, List[Dict[str, Any]]] = {}
+		first_seen: Dict[Any, float] = {}
+		targets_by_channel: Dict[Optional[str], Set[Any]] = {}
+		for event, published_at in pending:
+			channel = event.get('channel')
+			if channel not in targets_by_channel:
+				targets_by_channel[channel] = self.targets(channel)
+			for websocket in targets_by_channel[channel]:
+				per_client.setdefault(websocket, []).append(event)
+				first_seen.setdefault(websocket, published_at)
+
+		# Clients on the same channels share one encoded frame
+		frames: Dict[Tuple[int, ...], str] = {}
+		for websocket, client_events in per_client.items():
+			key = tuple(id(event) for event in client_events)
+			frame = frames.get(key)
+			if frame is None:
+				if len(client_events) == 1:
+					frame = json.dumps(client_events[0])
+				else:
+					frame = json.dumps({'type': 'batch', 'events': client_events})
+				frames[key] = frame
+			self.broadcaster.send_to(websocket, frame, enqueued_at=first_seen[websocket])
+
+	def snapshot(self) -> Dict[str, int]:
+		return {channel: len(members) for channel, members in self.subscribers.items()}
+
+# end template/python3/subscriptions.py ; marker comment, please do not remove
@@ -0,0 +1,118 @@
+# begin template/python3/templates.py ; marker comment, please do not remove
+
+# Process-wide registry of page templates.
+# Templates are read and split into literal text and {field} slots once, and
+# only re-read when the file's mtime or size changes, so editing a template
+# takes effect on the next render without a restart. Rendering appends the
+# pieces to a caller-supplied list; a value that is itself a list (e.g. the
+# already-rendered messages) is spliced in as-is, so a whole page is joined
+# exactly once at the end.
+#
+# Templates use str.format syntax ({name}, {{ and }} for literal braces);
+# .source holds the raw text for files that are inlined rather than rendered.
+#
+# Usage:
+#   out = []
+#   templates.get('template/html/chat_message.html').render_into(out, author='alice', ...)
+#   page = templates.get('template/html/chat_page.html').render(chat_messages=out, ...)
+
+import os
+import threading
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+_formatter = Formatter()
+
+# (literal text, field name or None, conversion or None, format spec)
+Part = Tuple[str, Optional[str], Optional[str], str]
+
+class Template:
+	__slots__ = ('path', 'mtime', 'size', 'source', '_parts')
+
+	def __init__(self, path: str, source: str, mtime: float = 0.0, size: int = 0):
+		self.path = path
+		self.mtime = mtime
+		self.size = size
+		self.source = source
+		self._parts: Optional[List[Part]] = None
+
+	@property
+	def parts(self) -> List[Part]:
+		# Parsed on first render, so files used verbatim (stylesheets) may
+		# contain braces
+		if self._parts is None:
+			self._parts = [
+				(literal, field, conversion, spec or '')
+				for literal, field, spec, conversion in _formatter.parse(self.source)
+			]
+		return self._parts
+
+	def render_into(self, out: List[str], **values):
+		"""Append the rendered pieces to out"""
+		append = out.append
+		for literal, field, conversion, spec in self.parts:
+			if literal:
+				append(literal)
+			if field is None:
+				continue
+			if field in values:
+				value = values[field]
+			else:
+				# Attribute/index lookups ({a.b}, {a[0]}) and missing names
+				value = _formatter.get_field(field, (), values)[0]
+			if conversion:
+				value = _formatter.convert_field(value, conversion)
+			if type(value) is str and not spec:
+				append(value)
+			elif type(value) is list and not spec:
+				out.extend(value)
+			else:
+				append(format(value, spec))
+
+	def render(self, **values) -> str:
+		out: List[str] = []
+		self.render_into(out, **values)
+		return ''.join(out)
+
+def _decode(raw: bytes) -> str:
+	try:
+		return raw.decode('utf-8')
+	except UnicodeDecodeError:
+		import chardet
+		return raw.decode(chardet.detect(raw)['encoding'] or 'utf-8', errors='replace')
+
+class TemplateRegistry:
+	"""Parsed templates keyed by absolute path, refreshed when the file changes"""
+
+	def __init__(self):
+		self._templates: Dict[str, Template] = {}
+		self._lock = threading.Lock()
+		self._loads = metrics.counter('template_loads_total')
+
+	def get(self, path: str) -> Template:
+		"""The parsed template at path; raises OSError if it cannot be read"""
+		key = os.path.abspath(path)
+		stat = os.stat(key)
+		template = self._templates.get(key)
+		if template is not None and template.mtime == stat.st_mtime and template.size == stat.st_size:
+			return template
+
+		with open(key, 'rb') as f:
+			text = _decode(f.read())
+		template = Template(key, text, stat.st_mtime, stat.st_size)
+		with self._lock:
+			self._templates[key] = template
+		self._loads.inc()
+		return template
+
+	def clear(self):
+		with self._lock:
+			self._templates.clear()
+
+# The process-wide registry and a shortcut to it
+registry = TemplateRegistry()
+get = registry.get
+
+# end template/python3/templates.py ; marker comment, please do not remove
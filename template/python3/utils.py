@@ -5,38 +5,14 @@ import random
 import string
 from datetime import datetime
 import time
-from typing import Dict, Any, Optional
-from functools import lru_cache
-
-class Cache:
-	def __init__(self, ttl: int = 60):
-		self._cache: Dict[str, tuple[Any, float]] = {}
-		self._ttl = ttl
-
-	def get(self, key: str) -> Optional[Any]:
-		if key in self._cache:
-			value, timestamp = self._cache[key]
-			if time.time() - timestamp <= self._ttl:
-				return value
-			del self._cache[key]
-		return None
-
-	def set(self, key: str, value: Any):
-		self._cache[key] = (value, time.time())
-
-	def invalidate(self, key: str):
-		if key in self._cache:
-			del self._cache[key]
-
-# Create global cache instances
-page_cache = Cache(ttl=30)  # Cache pages for 30 seconds
-git_cache = Cache(ttl=60)   # Cache git status for 1 minute
-
-@lru_cache(maxsize=128)
-def parse_message_file(file_path: str) -> dict:
-	"""Cache parsed message files"""
-	# Implementation will be added when we modify chat.html.py
-	pass
+
+# The shared caches now live in cache.py; kept here for existing imports
+from cache import Cache, page_cache, git_cache
+
+def parse_message_file(file_path: str, repo_path: str = '.') -> dict:
+	"""Parsed metadata of a message file, from the manifest cache when still valid"""
+	from chat.manifest import manifest_for
+	return manifest_for(repo_path).get(file_path)
 
 def is_port_in_use(port: int) -> bool:
 	"""Check if a port is already in use"""
@@ -0,0 +1,341 @@
+# begin template/python3/watcher.py ; marker comment, please do not remove
+
+# Change detection for the message tree.
+# Watches message/ and every directory below it and reports .txt files that
+# were added, modified or deleted, however they got there (a post, git pull,
+# commit_files.py, or a file copied in by hand).
+#
+# Backends:
+# - inotify (Linux, through ctypes): one watch per directory, new
+#   directories are watched as they appear.
+# - polling: every poll interval, re-list only the directories whose mtime
+#   changed (adds, deletes and renames change it); every full-scan interval,
+#   stat all files to catch in-place edits.
+#
+# Events are collected for a short settle time and delivered in batches of
+# ChangeEvent to a callback on the watcher thread, with repeated events for
+# one file folded together (add then modify -> add, add then delete -> none).
+#
+# archive/ is not watched: packs are only written by archive_messages.py,
+# which removes the packed files from message/ in the same run, so their
+# delete events already mark those channels stale.
+
+import abc
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from config import WATCH_POLL_INTERVAL, WATCH_FULL_SCAN_INTERVAL
+
+ADD = 'add'
+MODIFY = 'modify'
+DELETE = 'delete'
+# Emitted when events were lost (inotify queue overflow); path is None
+RESCAN = 'rescan'
+
+SETTLE_TIME = 0.05
+
+class ChangeEvent(NamedTuple):
+	kind: str
+	path: Optional[str]
+	channel: Optional[str]
+
+	@property
+	def message_id(self) -> Optional[str]:
+		return os.path.splitext(os.path.basename(self.path))[0] if self.path else None
+
+def _fold(previous: Optional[str], kind: str) -> Optional[str]:
+	"""Combine two events for the same file; None means nothing happened"""
+	if previous is None:
+		return kind
+	if previous == ADD:
+		return None if kind == DELETE else ADD
+	if previous == DELETE:
+		return MODIFY if kind == ADD else DELETE
+	return DELETE if kind == DELETE else MODIFY
+
+class _Backend(abc.ABC):
+	"""Common part: channel lookup, batching and the thread"""
+
+	def __init__(self, message_dir: str, callback: Callable[[List[ChangeEvent]], None]):
+		self.message_dir = os.path.abspath(message_dir)
+		self.callback = callback
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+		self._pending: Dict[str, str] = {}
+		self._rescan = False
+
+	def channel_of(self, path: str) -> Optional[str]:
+		parts = os.path.relpath(path, self.message_dir).split(os.sep)
+		return parts[0] if len(parts) > 1 else None
+
+	def record(self, kind: str, path: str):
+		if not path.endswith('.txt'):
+			return
+		folded = _fold(self._pending.get(path), kind)
+		if folded is None:
+			self._pending.pop(path, None)
+		else:
+			self._pending[path] = folded
+
+	def flush(self):
+		events = [ChangeEvent(kind, path, self.channel_of(path)) for path, kind in sorted(self._pending.items())]
+		if self._rescan:
+			events.append(ChangeEvent(RESCAN, None, None))
+		self._pending = {}
+		self._rescan = False
+		if events:
+			try:
+				self.callback(events)
+			except Exception as e:
+				print(f"Error handling file changes: {e}")
+
+	def start(self):
+		self._thread = threading.Thread(target=self.run, name=f"{type(self).__name__}", daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join(timeout=5)
+
+	@abc.abstractmethod
+	def run(self):
+		"""Watch until stopped, recording events and calling flush"""
+
+class PollingWatcher(_Backend):
+	"""Directory-mtime polling with a periodic full stat sweep"""
+
+	def __init__(self, message_dir, callback, interval: float = WATCH_POLL_INTERVAL,
+				 full_scan_interval: float = WATCH_FULL_SCAN_INTERVAL):
+		super().__init__(message_dir, callback)
+		self.interval = interval
+		self.full_scan_interval = full_scan_interval
+		self.directories: Dict[str, float] = {}
+		self.files: Dict[str, Tuple[float, int]] = {}
+		self.files_by_dir: Dict[str, set] = {}
+
+	def _list(self, directory: str):
+		"""(mtime of directory, {file: (mtime, size)}, [subdirectories])"""
+		files = {}
+		subdirectories = []
+		try:
+			mtime = os.stat(directory).st_mtime
+			with os.scandir(directory) as entries:
+				for entry in entries:
+					if entry.is_dir(follow_symlinks=False):
+						subdirectories.append(entry.path)
+					elif entry.name.endswith('.txt'):
+						stat = entry.stat()
+						files[entry.path] = (stat.st_mtime, stat.st_size)
+		except FileNotFoundError:
+			return None, {}, []
+		return mtime, files, subdirectories
+
+	def _scan_directory(self, directory: str, report: bool):
+		"""Bring one directory (and new subdirectories) up to date"""
+		mtime, files, subdirectories = self._list(directory)
+		if mtime is None:
+			self._drop_directory(directory, report)
+			return
+		self.directories[directory] = mtime
+
+		known = self.files_by_dir.get(directory, set())
+		for path in known - files.keys():
+			self.files.pop(path, None)
+			if report:
+				self.record(DELETE, path)
+		for path, signature in files.items():
+			previous = self.files.get(path)
+			if previous is None:
+				if report:
+					self.record(ADD, path)
+			elif previous != signature and report:
+				self.record(MODIFY, path)
+			self.files[path] = signature
+		self.files_by_dir[directory] = set(files)
+
+		for subdirectory in subdirectories:
+			if subdirectory not in self.directories:
+				self._scan_directory(subdirectory, report)
+
+	def _drop_directory(self, directory: str, report: bool):
+		for known in [d for d in self.directories if d == directory or d.startswith(directory + os.sep)]:
+			self.directories.pop(known, None)
+			for path in self.files_by_dir.pop(known, set()):
+				self.files.pop(path, None)
+				if report:
+					self.record(DELETE, path)
+
+	def poll(self, full: bool = False):
+		"""One polling pass; full passes stat every known file"""
+		for directory, mtime in list(self.directories.items()):
+			if directory not in self.directories:
+				continue  # Dropped with its parent during this pass
+			try:
+				current = os.stat(directory).st_mtime
+			except FileNotFoundError:
+				self._drop_directory(directory, True)
+				continue
+			if current != mtime:
+				self._scan_directory(directory, True)
+			elif full:
+				for path in list(self.files_by_dir.get(directory, ())):
+					try:
+						stat = os.stat(path)
+					except FileNotFoundError:
+						continue  # Picked up by the directory mtime next pass
+					signature = (stat.st_mtime, stat.st_size)
+					if self.files.get(path) != signature:
+						self.files[path] = signature
+						self.record(MODIFY, path)
+		self.flush()
+
+	def run(self):
+		os.makedirs(self.message_dir, exist_ok=True)
+		self._scan_directory(self.message_dir, False)
+		last_full = time.monotonic()
+		while not self._stop.wait(self.interval):
+			full = time.monotonic() - last_full >= self.full_scan_interval
+			if full:
+				last_full = time.monotonic()
+			try:
+				self.poll(full)
+			except Exception as e:
+				print(f"Error polling {self.message_dir}: {e}")
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+def _load_libc():
+	name = ctypes.util.find_library('c')
+	if name is None:
+		return None
+	libc = ctypes.CDLL(name, use_errno=True)
+	if not hasattr(libc, 'inotify_init1'):
+		return None
+	libc.inotify_init1.argtypes = [ctypes.c_int]
+	libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+	return libc
+
+class InotifyWatcher(_Backend):
+	"""Linux inotify through ctypes; raises OSError if unavailable"""
+
+	def __init__(self, message_dir, callback):
+		super().__init__(message_dir, callback)
+		self.libc = _load_libc()
+		if self.libc is None:
+			raise OSError("inotify is not available")
+		self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+		self.watches: Dict[int, str] = {}
+		# Files created but not yet closed, so their close reports an add
+		self._created: set = set()
+
+	def _watch_tree(self, directory: str, report: bool):
+		"""Watch directory and everything below it; report files already there"""
+		wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+		if wd < 0:
+			print(f"Cannot watch {directory}: {os.strerror(ctypes.get_errno())}")
+			return
+		self.watches[wd] = directory
+		try:
+			with os.scandir(directory) as entries:
+				for entry in entries:
+					if entry.is_dir(follow_symlinks=False):
+						self._watch_tree(entry.path, report)
+					elif report:
+						# Written before the watch existed
+						self.record(ADD, entry.path)
+		except FileNotFoundError:
+			pass
+
+	def _handle(self, wd: int, mask: int, name: str):
+		if mask & IN_Q_OVERFLOW:
+			self._rescan = True
+			return
+		directory = self.watches.get(wd)
+		if directory is None:
+			return
+		if mask & IN_IGNORED:
+			self.watches.pop(wd, None)
+			return
+		path = os.path.join(directory, name) if name else directory
+		if mask & IN_ISDIR:
+			if mask & (IN_CREATE | IN_MOVED_TO):
+				self._watch_tree(path, True)
+			elif mask & IN_MOVED_FROM:
+				# Its files are gone from the tree; let consumers rescan
+				self._rescan = True
+			return
+		if mask & IN_CREATE:
+			self._created.add(path)
+		elif mask & IN_CLOSE_WRITE:
+			self.record(ADD if path in self._created else MODIFY, path)
+			self._created.discard(path)
+		elif mask & IN_MOVED_TO:
+			self.record(ADD, path)
+		elif mask & (IN_DELETE | IN_MOVED_FROM):
+			self._created.discard(path)
+			self.record(DELETE, path)
+
+	def _read(self):
+		try:
+			data = os.read(self.fd, 64 * 1024)
+		except BlockingIOError:
+			return
+		offset = 0
+		while offset + EVENT_HEADER.size <= len(data):
+			wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+			offset += EVENT_HEADER.size
+			name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+			offset += length
+			self._handle(wd, mask, name)
+
+	def run(self):
+		os.makedirs(self.message_dir, exist_ok=True)
+		self._watch_tree(self.message_dir, False)
+		try:
+			while not self._stop.is_set():
+				readable, _, _ = select.select([self.fd], [], [], 0.5)
+				if not readable:
+					continue
+				self._read()
+				# Let a burst (git pull, bulk copy) settle into one batch
+				while select.select([self.fd], [], [], SETTLE_TIME)[0]:
+					self._read()
+				self.flush()
+		finally:
+			os.close(self.fd)
+
+def create_watcher(message_dir: str, callback: Callable[[List[ChangeEvent]], None],
+				   backend: str = 'auto'):
+	"""An unstarted watcher: inotify when available (or asked for), else polling"""
+	if backend in ('auto', 'inotify'):
+		try:
+			return InotifyWatcher(message_dir, callback)
+		except (OSError, AttributeError) as e:
+			if backend == 'inotify':
+				raise
+			print(f"inotify unavailable ({e}), polling {message_dir} instead")
+	return PollingWatcher(message_dir, callback)
+
+# end template/python3/watcher.py ; marker comment, please do not remove
@@ -0,0 +1,195 @@
+# begin template/python3/ws_protocol.py ; marker comment, please do not remove
+
+# Minimal RFC 6455 WebSocket framing on top of asyncio streams.
+# Used by the unified server (aio_server.py) so WebSocket upgrades can be
+# answered on the HTTP port without an external dependency.
+
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_MESSAGE_SIZE = 1 << 20
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+class ConnectionClosed(Exception):
+	"""Raised when the peer closed the connection or the stream ended"""
+
+def accept_key(key: str) -> str:
+	"""Compute the Sec-WebSocket-Accept value for a client key"""
+	digest = hashlib.sha1((key + WS_GUID).encode('ascii')).digest()
+	return base64.b64encode(digest).decode('ascii')
+
+def handshake_response(key: str) -> bytes:
+	"""Build the 101 Switching Protocols response for a client key"""
+	return (
+		"HTTP/1.1 101 Switching Protocols\r\n"
+		"Upgrade: websocket\r\n"
+		"Connection: Upgrade\r\n"
+		f"Sec-WebSocket-Accept: {accept_key(key)}\r\n"
+		"\r\n"
+	).encode('ascii')
+
+def encode_frame(opcode: int, payload: bytes, mask: bool = False) -> bytes:
+	"""Encode a single final frame; clients must mask, servers must not"""
+	header = bytearray([0x80 | opcode])
+	mask_bit = 0x80 if mask else 0
+	length = len(payload)
+	if length < 126:
+		header.append(mask_bit | length)
+	elif length < (1 << 16):
+		header.append(mask_bit | 126)
+		header += struct.pack('!H', length)
+	else:
+		header.append(mask_bit | 127)
+		header += struct.pack('!Q', length)
+
+	if mask:
+		key = os.urandom(4)
+		header += key
+		payload = apply_mask(payload, key)
+	return bytes(header) + payload
+
+def apply_mask(payload: bytes, key: bytes) -> bytes:
+	"""XOR a payload with a 4-byte masking key"""
+	if not payload:
+		return payload
+	repeated = (key * (len(payload) // 4 + 1))[:len(payload)]
+	return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(len(payload), 'big')
+
+async def read_frame(reader: asyncio.StreamReader, max_size: int = MAX_MESSAGE_SIZE):
+	"""Read one frame; returns (fin, opcode, payload)"""
+	try:
+		first, second = await reader.readexactly(2)
+		length = second & 0x7F
+		if length == 126:
+			length = struct.unpack('!H', await reader.readexactly(2))[0]
+		elif length == 127:
+			length = struct.unpack('!Q', await reader.readexactly(8))[0]
+		if length > max_size:
+			raise ConnectionClosed(f"Frame of {length} bytes exceeds limit")
+		key = await reader.readexactly(4) if second & 0x80 else None
+		payload = await reader.readexactly(length)
+	except (asyncio.IncompleteReadError, ConnectionError) as e:
+		raise ConnectionClosed(str(e))
+
+	if key:
+		payload = apply_mask(payload, key)
+	return bool(first & 0x80), first & 0x0F, payload
+
+async def connect(host: str, port: int, path: str = '/ws', timeout: float = 10.0) -> 'WebSocketConnection':
+	"""Open a client connection (used by the load-testing harness)"""
+	reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+	key = base64.b64encode(os.urandom(16)).decode('ascii')
+	writer.write((
+		f"GET {path} HTTP/1.1\r\n"
+		f"Host: {host}:{port}\r\n"
+		"Upgrade: websocket\r\n"
+		"Connection: Upgrade\r\n"
+		f"Sec-WebSocket-Key: {key}\r\n"
+		"Sec-WebSocket-Version: 13\r\n"
+		"\r\n"
+	).encode('ascii'))
+	await writer.drain()
+	head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+	status_line, _, header_block = head.decode('latin-1').partition('\r\n')
+	if ' 101 ' not in status_line + ' ':
+		writer.close()
+		raise ConnectionClosed(f"Handshake refused: {status_line}")
+	headers = {}
+	for line in header_block.split('\r\n'):
+		name, _, value = line.partition(':')
+		headers[name.strip().lower()] = value.strip()
+	if headers.get('sec-websocket-accept') != accept_key(key):
+		writer.close()
+		raise ConnectionClosed("Handshake returned a wrong Sec-WebSocket-Accept")
+	return WebSocketConnection(reader, writer, path=path, is_client=True)
+
+class WebSocketConnection:
+	"""One upgraded connection; mirrors the send/recv/iterate API of websockets"""
+
+	def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str = '/', is_client: bool = False):
+		self.reader = reader
+		self.writer = writer
+		self.path = path
+		self.is_client = is_client
+		self.remote_address = writer.get_extra_info('peername')
+		self.closed = False
+		self._send_lock = asyncio.Lock()
+
+	async def send(self, message):
+		"""Send a text (str) or binary (bytes) message"""
+		if self.closed:
+			raise ConnectionClosed("Connection already closed")
+		if isinstance(message, str):
+			frame = encode_frame(OP_TEXT, message.encode('utf-8'), mask=self.is_client)
+		else:
+			frame = encode_frame(OP_BINARY, bytes(message), mask=self.is_client)
+		await self._write(frame)
+
+	async def _write(self, frame: bytes):
+		async with self._send_lock:
+			try:
+				self.writer.write(frame)
+				await self.writer.drain()
+			except ConnectionError as e:
+				self.closed = True
+				raise ConnectionClosed(str(e))
+
+	async def recv(self):
+		"""Receive the next complete message, answering pings along the way"""
+		fragments = []
+		message_opcode = None
+		while True:
+			fin, opcode, payload = await read_frame(self.reader)
+			if opcode == OP_PING:
+				await self._write(encode_frame(OP_PONG, payload, mask=self.is_client))
+				continue
+			if opcode == OP_PONG:
+				continue
+			if opcode == OP_CLOSE:
+				await self.close()
+				raise ConnectionClosed("Peer closed the connection")
+
+			if opcode != OP_CONTINUATION:
+				message_opcode = opcode
+				fragments = []
+			fragments.append(payload)
+			if sum(len(part) for part in fragments) > MAX_MESSAGE_SIZE:
+				await self.close(1009)
+				raise ConnectionClosed("Message too big")
+			if fin:
+				data = b''.join(fragments)
+				return data.decode('utf-8') if message_opcode == OP_TEXT else data
+
+	def __aiter__(self):
+		return self
+
+	async def __anext__(self):
+		try:
+			return await self.recv()
+		except ConnectionClosed:
+			raise StopAsyncIteration
+
+	async def close(self, code: int = 1000):
+		"""Send a close frame (once) and close the transport"""
+		if self.closed:
+			return
+		self.closed = True
+		try:
+			self.writer.write(encode_frame(OP_CLOSE, struct.pack('!H', code), mask=self.is_client))
+			await self.writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			self.writer.close()
+
+# end template/python3/ws_protocol.py ; marker comment, please do not remove